@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""Startup latency of the package and of every sfapi subcommand
+
+Runs each target with `python -X importtime` and reports the median import
+time and wall time over a few runs as JSON. With --baseline, exits 1 when a
+target got slower than the baseline by more than --tolerance.
+
+    python benchmarks/importtime.py --output startup.json
+    python benchmarks/importtime.py --baseline startup.json --tolerance 0.25
+"""
+from pathlib import Path
+import argparse
+import json
+import os
+import runpy
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+_root = Path(__file__).resolve().parent.parent
+SFAPI = _root / "python" / "SuperfacilityAPI" / "bin" / "sfapi"
+
+
+def parse_importtime(stderr: str):
+    """Gets the total and per module cumulative import times in ms
+
+    Only top level imports (no indentation) are summed, nested imports are
+    already counted in their parent's cumulative time.
+    """
+    total = 0.0
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        ms = int(cumulative) / 1000
+        modules[name.strip()] = ms
+        if not name.startswith("  "):
+            total += ms
+    return total, modules
+
+
+def measure(cmd, env, repeat: int):
+    imports, walls, modules = [], [], {}
+    for _ in range(repeat):
+        start = time.perf_counter()
+        proc = subprocess.run([sys.executable, "-X", "importtime"] + cmd, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        walls.append((time.perf_counter() - start) * 1000)
+        total, modules = parse_importtime(proc.stderr)
+        imports.append(total)
+    return {"import_ms": round(statistics.median(imports), 2),
+            "wall_ms": round(statistics.median(walls), 2),
+            "slowest": dict(sorted(modules.items(), key=lambda kv: -kv[1])[:10])}
+
+
+def subcommands():
+    # Loading the script only defines the click group, it doesn't run it
+    cli = runpy.run_path(str(SFAPI), run_name="sfapi_commands")["cli"]
+    names = []
+    for name, command in cli.commands.items():
+        if hasattr(command, "commands"):
+            names += [[name, sub] for sub in command.commands]
+        else:
+            names.append([name])
+    return names
+
+
+def run(repeat: int):
+    # No keys and no daemon, so only the startup cost is measured
+    home = tempfile.mkdtemp()
+    env = dict(os.environ, HOME=home)
+    try:
+        results = {"python": sys.version.split()[0],
+                   "package": measure(["-c", "import SuperfacilityAPI"], env, repeat),
+                   "sfapi --help": measure([str(SFAPI), "--help"], env, repeat)}
+        for command in subcommands():
+            results[f"sfapi {' '.join(command)} --help"] = measure(
+                [str(SFAPI)] + command + ["--help"], env, repeat)
+    finally:
+        shutil.rmtree(home, ignore_errors=True)
+    return results
+
+
+def regressions(results, baseline, tolerance: float):
+    slower = []
+    for name, result in results.items():
+        if not isinstance(result, dict) or name not in baseline:
+            continue
+        before = baseline[name]["import_ms"]
+        if result["import_ms"] > before * (1 + tolerance):
+            slower.append(f"{name}: {before:.1f}ms -> {result['import_ms']:.1f}ms")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per target, the median is kept")
+    parser.add_argument("--output", default=None, help="Write the results to this file")
+    parser.add_argument("--baseline", default=None, help="Results to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slow down over the baseline, 0.25 is 25%%")
+    args = parser.parse_args(argv)
+
+    results = run(args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        Path(args.output).write_text(text)
+    print(text)
+
+    if args.baseline is not None:
+        slower = regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in slower:
+            print(f"Import time regression {line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+"""End to end throughput and latency of the client against the mock server
+
+Each scenario runs in its own process, once with calls made one after the
+other (sync) and once from a thread pool (concurrent), so the CPU time and
+peak RSS reported are the client's alone. The mock server runs in this
+process with a small added latency to stand in for the network.
+
+    python benchmarks/throughput.py --output throughput.json
+    python benchmarks/throughput.py --baseline throughput.json --tolerance 0.25
+    python benchmarks/throughput.py --scenario status --scenario ls --calls 20
+"""
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+_root = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(_root / "python"))
+
+from SuperfacilityAPI import SuperfacilityAPI  # noqa: E402
+from SuperfacilityAPI.mock_server import MockServer, MockSuperfacility, MOCK_HOME  # noqa: E402
+
+SITE = 'perlmutter'
+LS_DIR = f'{MOCK_HOME}/many'
+BIG_FILE = f'{MOCK_HOME}/big.txt'
+SCRIPT = "#!/bin/bash\n#SBATCH -J bench\nsrun hostname\n"
+
+
+def _status(sfapi):
+    sfapi.status(new=True)
+
+
+def _ls(sfapi):
+    sfapi.ls(LS_DIR, site=SITE, new=True)
+
+
+def _squeue(sfapi):
+    sfapi.get_jobs(site=SITE, sacct=False)
+
+
+def _sacct(sfapi):
+    sfapi.get_jobs(site=SITE, sacct=True)
+
+
+def _post_job(sfapi):
+    # Includes waiting for the task to resolve into a jobid
+    ret = sfapi.post_job(site=SITE, script=SCRIPT, isPath=False)
+    if ret['jobid'] is None:
+        raise RuntimeError(f"Job wasn't submitted {ret}")
+
+
+def _download(sfapi):
+    sfapi.download(site=SITE, remote_path=BIG_FILE)
+
+
+def _download_stream(sfapi):
+    for _ in sfapi.iter_download(site=SITE, remote_path=BIG_FILE):
+        pass
+
+
+# name -> (call, default number of calls)
+SCENARIOS = {
+    'status': (_status, 200),
+    'ls': (_ls, 100),
+    'squeue': (_squeue, 20),
+    'sacct': (_sacct, 20),
+    'post_job': (_post_job, 20),
+    'download': (_download, 10),
+    'download_stream': (_download_stream, 10),
+}
+MODES = ('sync', 'concurrent')
+
+
+def percentile(values, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def peak_rss_mb() -> float:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kB, macOS bytes
+    return round(peak / (1 << 20 if sys.platform == 'darwin' else 1 << 10), 1)
+
+
+def run_scenario(name: str, mode: str, calls: int, workers: int, base_url: str, token: str):
+    """Runs one scenario in this process and measures it
+    """
+    call = SCENARIOS[name][0]
+    sfapi = SuperfacilityAPI(token=token, base_url=base_url, pool_maxsize=max(workers, 10))
+
+    def timed(_):
+        start = time.perf_counter()
+        call(sfapi)
+        return time.perf_counter() - start
+
+    # Warm the connection pool and imports outside the measurement
+    timed(None)
+
+    cpu = time.process_time()
+    start = time.perf_counter()
+    if mode == 'sync':
+        latencies = [timed(i) for i in range(calls)]
+    else:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            latencies = list(pool.map(timed, range(calls)))
+    wall = time.perf_counter() - start
+    cpu = time.process_time() - cpu
+    sfapi.transport.close()
+
+    return {'calls': calls,
+            'calls_per_s': round(calls / wall, 2),
+            'p50_ms': round(statistics.median(latencies) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'cpu_s': round(cpu, 3),
+            'cpu_ms_per_call': round(cpu / calls * 1000, 3),
+            'peak_rss_mb': peak_rss_mb()}
+
+
+def mock_state(args) -> MockSuperfacility:
+    state = MockSuperfacility(latency=args.latency, task_delay=args.task_delay, seed=0)
+    for i in range(args.ls_entries):
+        state.add_file(SITE, f'{LS_DIR}/file_{i:06d}.dat', b'')
+    for i in range(args.jobs):
+        state.add_job(SITE, state='RUNNING' if i % 2 else 'PENDING', name=f'job_{i}')
+        state.add_job(SITE, state='COMPLETED', name=f'done_{i}')
+    line = b'0123456789abcdef' * 4 + b'\n'
+    state.add_file(SITE, BIG_FILE, line * (args.download_mb * (1 << 20) // len(line)))
+    return state
+
+
+def run(args):
+    state = mock_state(args)
+    results = {'python': sys.version.split()[0],
+               'config': {'latency_s': args.latency, 'task_delay_s': args.task_delay,
+                          'workers': args.workers, 'ls_entries': args.ls_entries,
+                          'jobs': args.jobs, 'download_mb': args.download_mb},
+               'scenarios': {}}
+    with MockServer(state) as server:
+        for name in args.scenario or SCENARIOS:
+            calls = args.calls or SCENARIOS[name][1]
+            results['scenarios'][name] = {}
+            for mode in MODES:
+                cmd = [sys.executable, __file__, '--child', name, mode, '--calls', str(calls),
+                       '--workers', str(args.workers), '--url', server.base_url]
+                # The token goes through the environment to stay out of the process list
+                env = dict(os.environ, SFAPI_BENCH_TOKEN=state.issue_token())
+                proc = subprocess.run(cmd, env=env, stdout=subprocess.PIPE, text=True, check=True)
+                results['scenarios'][name][mode] = json.loads(proc.stdout)
+                print(f"{name:>16} {mode:>10} {results['scenarios'][name][mode]['calls_per_s']:>10} calls/s",
+                      file=sys.stderr)
+    return results
+
+
+def regressions(results, baseline, tolerance: float):
+    slower = []
+    for name, modes in results['scenarios'].items():
+        for mode, result in modes.items():
+            before = baseline.get('scenarios', {}).get(name, {}).get(mode)
+            if before is None:
+                continue
+            if result['calls_per_s'] < before['calls_per_s'] * (1 - tolerance):
+                slower.append(f"{name} {mode}: {before['calls_per_s']} -> {result['calls_per_s']} calls/s")
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run, can be repeated, by default all of them')
+    parser.add_argument('--calls', type=int, default=None, help='Calls per scenario and mode')
+    parser.add_argument('--workers', type=int, default=8, help='Threads in concurrent mode')
+    parser.add_argument('--latency', type=float, default=0.005, help='Seconds the mock adds to every response')
+    parser.add_argument('--task-delay', type=float, default=0.05, help='Seconds before mock tasks complete')
+    parser.add_argument('--ls-entries', type=int, default=1000, help='Entries in the listed directory')
+    parser.add_argument('--jobs', type=int, default=5000, help='Jobs in the queue and in the history')
+    parser.add_argument('--download-mb', type=int, default=8, help='Size of the downloaded file')
+    parser.add_argument('--output', default=None, help='Write the results to this file')
+    parser.add_argument('--baseline', default=None, help='Results to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed drop in calls/s from the baseline, 0.25 is 25%%')
+    parser.add_argument('--child', nargs=2, metavar=('SCENARIO', 'MODE'), help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child is not None:
+        name, mode = args.child
+        print(json.dumps(run_scenario(name, mode, args.calls, args.workers, args.url,
+                                      os.environ['SFAPI_BENCH_TOKEN'])))
+        return 0
+
+    results = run(args)
+    text = json.dumps(results, indent=2)
+    if args.output is not None:
+        Path(args.output).write_text(text)
+    print(text)
+
+    if args.baseline is not None:
+        slower = regressions(results, json.loads(Path(args.baseline).read_text()), args.tolerance)
+        for line in slower:
+            print(f"Throughput regression {line}", file=sys.stderr)
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
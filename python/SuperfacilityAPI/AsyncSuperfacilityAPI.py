@@ -0,0 +1,848 @@
+from typing import Dict, List
+import asyncio
+import json
+import logging
+from pathlib import Path
+
+from .SuperfacilityAccessToken import SuperfacilityAccessToken
+from .SuperfacilityErrors import (
+    InternalServerError,
+    SuperfacilityCmdFailed,
+    SuperfacilitySiteDown,
+    SuperfacilityCircuitOpen
+)
+from .SuperfacilityAPI import (
+    NerscSystemState,
+    sacct_columns,
+    squeue_columns,
+    HAVE_PANDAS
+)
+from .api_version import API_VERSION
+from .transport import (
+    check_status_code,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_TIMEOUT
+)
+from .task_poller import AsyncTaskPoller, task_list
+from .status_cache import StatusCache, DEFAULT_STATUS_TTL, group_by_system
+from .retry import RetryPolicy, CircuitBreaker, API_SITE
+from .ratelimit import RateLimiter, request_priority, INTERACTIVE, BACKGROUND
+from .endpoints import endpoint_site
+from .coalesce import AsyncSingleFlight
+from .instrument import Instrumentation
+from .lazy import lazy_import, have_module
+from .nersc_systems import (
+    NERSC_DEFAULT_COMPUTE,
+    nersc_systems,
+    NerscCompute
+)
+
+global HAVE_HTTPX
+HAVE_HTTPX = have_module('httpx')
+if HAVE_HTTPX:
+    httpx = lazy_import('httpx')
+
+
+class AsyncSuperfacilityAccessToken:
+    access_token = None
+
+    def __init__(self, access_token=None):
+        """Awaitable token provider built on SuperfacilityAccessToken
+
+        Parameters
+        ----------
+        access_token : str or SuperfacilityAccessToken, optional
+            Token to hand out, by default None
+        """
+        self.access_token = access_token
+        self._lock = None
+
+    async def token(self) -> str:
+        """Gets the access token, refreshing it off the event loop when it is due
+
+        Returns
+        -------
+        str
+        """
+        if not isinstance(self.access_token, SuperfacilityAccessToken):
+            return self.access_token
+
+        # Cached token is still good, no need to leave the loop
+        if self.access_token.expires_in > self.access_token.refresh_margin:
+            return self.access_token.access_token
+
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, lambda: self.access_token.token)
+
+
+class AsyncSuperfacilityAPI:
+    _status = None
+    access_token = None
+
+    def __init__(self, token=None, base_url=None,
+                 client: "httpx.AsyncClient" = None,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 timeout=DEFAULT_TIMEOUT,
+                 status_ttl: float = DEFAULT_STATUS_TTL,
+                 retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limiter: RateLimiter = None,
+                 coalesce_window: float = 0.0,
+                 instrumentation: Instrumentation = None):
+        """AsyncSuperfacilityAPI
+
+        asyncio version of SuperfacilityAPI, every call is awaitable.
+
+        Parameters
+        ----------
+        token : str, SuperfacilityAccessToken or AsyncSuperfacilityAccessToken, optional
+            Access token used to authorize requests, by default None
+        base_url : str, optional
+            Base url for sfapi requests, by default the NERSC api
+        client : httpx.AsyncClient, optional
+            Client to send requests with, by default a new pooled client
+        pool_maxsize : int, optional
+            Number of pooled connections for a new client, by default DEFAULT_POOL_MAXSIZE
+        timeout : float or (float, float), optional
+            Connect and read timeouts for a new client, by default DEFAULT_TIMEOUT
+        status_ttl : float, optional
+            Seconds to cache system status for, by default DEFAULT_STATUS_TTL
+        retry : RetryPolicy, optional
+            When to retry failed requests, by default RetryPolicy()
+        breaker : CircuitBreaker, optional
+            Per site circuit breaker, by default CircuitBreaker()
+        rate_limiter : RateLimiter, optional
+            Request budgets per endpoint class, by default None (no limit)
+        coalesce_window : float, optional
+            Seconds identical GETs keep sharing a finished result, by default 0
+            (only GETs in flight at the same time are shared)
+        instrumentation : Instrumentation, optional
+            Request hooks and metrics, by default a new Instrumentation()
+        """
+        if not HAVE_HTTPX:
+            raise ImportError(
+                "AsyncSuperfacilityAPI needs httpx, pip install SuperfacilityConnector[async]")
+
+        self.API_VERSION = API_VERSION
+        if base_url is None:
+            # Base url for sfapi requests
+            self.base_url = f'https://api.nersc.gov/api/v{self.API_VERSION}'
+        else:
+            self.base_url = base_url
+
+        if client is None:
+            if isinstance(timeout, tuple):
+                connect, read = timeout
+                timeout = httpx.Timeout(read, connect=connect)
+            client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=pool_maxsize,
+                                    max_keepalive_connections=pool_maxsize),
+                timeout=timeout)
+        self.client = client
+        self.retry = RetryPolicy() if retry is None else retry
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+        self.rate_limiter = rate_limiter
+        self.instrumentation = Instrumentation() if instrumentation is None else instrumentation
+        self.retries = 0
+        self.headers = {'accept': 'application/json',
+                        'Content-Type': 'application/x-www-form-urlencoded'}
+
+        if not isinstance(token, AsyncSuperfacilityAccessToken):
+            token = AsyncSuperfacilityAccessToken(token)
+        self.access_token = token
+        # Shared tracker for outstanding tasks, polls /tasks once per tick
+        self.task_poller = AsyncTaskPoller(self.__all_tasks)
+        self.status_cache = StatusCache(ttl=status_ttl)
+        # Identical GETs in flight at the same time share one request
+        self.single_flight = AsyncSingleFlight(window=coalesce_window)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Closes all pooled connections
+        """
+        await self.client.aclose()
+
+    @property
+    def counters(self) -> Dict:
+        """Retries sent, circuits opened, requests rejected by an open circuit and the sites currently open
+        """
+        return {'retries': self.retries,
+                'circuits_opened': self.breaker.opened,
+                'circuit_rejections': self.breaker.rejected,
+                'open_circuits': self.breaker.open_sites()}
+
+    async def __generic_request(self, method: str, sub_url: str,
+                                data: Dict = None) -> Dict:
+        """PRIVATE: Used to make a request to the api given a fully qualified sub url.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method, GET/POST/DELETE
+        sub_url : str
+            Url of the specific funtion to request.
+        data : Dict, optional
+            Form data for the request, by default None
+
+        Returns
+        -------
+        Dict
+            Dictionary given by httpx.Response.json()
+        """
+        token = await self.access_token.token()
+        if token is None:
+            raise PermissionError("No Token Provided")
+
+        headers = dict(self.headers)
+        headers['Authorization'] = f'Bearer {token}'
+        url = self.base_url+sub_url
+        logging.debug("__generic_request %s %s", method, url)
+
+        event = self.instrumentation.before(method, url)
+        resp = None
+        try:
+            resp = await self.__send(method, url, headers, data, event)
+            check_status_code(resp.status_code, url, token, resp.reason_phrase)
+        except BaseException as err:
+            status = None if resp is None else resp.status_code
+            self.instrumentation.after(event, status=status, error=err)
+            raise
+        self.instrumentation.after(event, status=resp.status_code, nbytes=len(resp.content))
+        return resp.json()
+
+    async def __send(self, method: str, url: str, headers: Dict, data: Dict,
+                     event: Dict) -> "httpx.Response":
+        """PRIVATE: Sends a request, retrying it as the policy allows, and counts the retries in event
+        """
+        site = endpoint_site(url) or API_SITE
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire_async(url)
+            # Checked last, a half-open circuit lets its trial through only once it is sent
+            if not self.breaker.allow(site):
+                raise SuperfacilityCircuitOpen(
+                    f"{site} is failing, not sending {method} {url}")
+
+            try:
+                resp = await self.client.request(method, url, headers=headers,
+                                                 data=data)
+            except httpx.TooManyRedirects as err:
+                self.breaker.record_failure(site)
+                logging.warning(f"TooManyRedirects {err}")
+                raise InternalServerError(f"TooManyRedirects {err}")
+            except httpx.TransportError as err:
+                self.breaker.record_failure(site)
+                delay = self.retry.delay(method, attempt)
+                if delay is None:
+                    raise
+                logging.warning(f"{method} {url} failed {type(err).__name__}, retrying in {delay:.1f}s")
+            except BaseException:
+                # No response, cancelled included, a half-open circuit mustn't wait for one forever
+                self.breaker.record_failure(site)
+                raise
+            else:
+                if resp.status_code >= 500:
+                    self.breaker.record_failure(site)
+                else:
+                    self.breaker.record_success(site)
+
+                delay = self.retry.delay(method, attempt, resp.status_code,
+                                         resp.headers.get('Retry-After'))
+                if delay is None:
+                    break
+                logging.warning(f"{method} {url} returned {resp.status_code}, retrying in {delay:.1f}s")
+
+            self.retries += 1
+            attempt += 1
+            event['retries'] = attempt
+            await asyncio.sleep(delay)
+
+        return resp
+
+    async def __generic_get(self, sub_url: str) -> Dict:
+        sent = []
+
+        def send():
+            sent.append(True)
+            return self.__generic_request('GET', sub_url)
+
+        result = await self.single_flight.do(sub_url, send)
+        if not sent:
+            # Shared the answer of an identical request
+            self.instrumentation.cache_hit('coalesce', 'GET', self.base_url+sub_url)
+        return result
+
+    async def __generic_post(self, sub_url: str, data: Dict = None) -> Dict:
+        return await self.__generic_request('POST', sub_url, data=data)
+
+    async def __generic_delete(self, sub_url: str) -> Dict:
+        return await self.__generic_request('DELETE', sub_url)
+
+    async def __get_system_status(self) -> None:
+        self._status = await self.__generic_get('/status/')
+        self.status_cache.put_all(self._status)
+
+    async def system_names(self) -> List:
+        """Returns list of all systems at NERSC
+
+        Returns
+        -------
+        List
+        """
+        await self.__get_system_status()
+        return [system['name'] for system in self._status]
+
+    def invalidate_status(self, name: str = None) -> None:
+        """Forget cached system status so the next call fetches it again
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the system to forget, by default forgets every system
+        """
+        self.status_cache.invalidate(name)
+
+    async def status(self, name: str = None, notes: bool = False,
+                     outages: bool = False, planned: bool = False,
+                     new: bool = False) -> Dict:
+        """Gets status of NERSC systems
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of system to get the status for, by default None
+            Can be combined with notes/outages/planned to get detailed status
+        notes : bool, optional
+            Get notes on the status, by default False
+        outages : bool, optional
+            Get current outages, by default False
+        planned : bool, optional
+            Get planned outages, by default False
+        new : bool, optional
+            Get newest version of the status, by default False
+
+        Returns
+        -------
+        Dict
+        """
+        sub_url = '/status'
+        if notes:
+            sub_url = '/status/notes'
+
+        if outages:
+            sub_url = '/status/outages'
+
+        if planned:
+            sub_url = '/status/outages/planned'
+
+        if name is not None and name in nersc_systems:
+            sub_url = f'{sub_url}/{name}'
+
+        if name == "muller":
+            return {'name': 'muller', 'full_name': 'muller', 'description': 'System is active',
+                    'system_type': 'compute', 'notes': [], 'status': 'active', 'updated_at': 'never'}
+
+        if sub_url == '/status':
+            if new or self.status_cache.get() is None:
+                await self.__get_system_status()
+            return self.status_cache.get() or self._status
+
+        if sub_url == f'/status/{name}':
+            status = None if new else self.status_cache.get(name)
+            if status is None:
+                # One full /status fills in every system for later lookups
+                await self.__get_system_status()
+                status = self.status_cache.get(name)
+            if status is None:
+                status = await self.__generic_get(sub_url)
+                self.status_cache.put(name, status)
+            return status
+
+        return await self.__generic_get(sub_url)
+
+    async def status_many(self, names: List[str], notes: bool = False,
+                          outages: bool = False, planned: bool = False,
+                          new: bool = False) -> Dict[str, Dict]:
+        """Gets the status of several NERSC systems at once
+
+        Whatever one bulk /status (or notes/outages) responce has is used as
+        is, the systems missing from it are fetched concurrently.
+
+        Parameters
+        ----------
+        names : List[str]
+            Names of the systems
+        notes : bool, optional
+            Get notes on the status, by default False
+        outages : bool, optional
+            Get current outages, by default False
+        planned : bool, optional
+            Get planned outages, by default False
+        new : bool, optional
+            Get newest version of the status, by default False
+
+        Returns
+        -------
+        Dict[str, Dict]
+            System name -> what status(name, ...) returns for it
+        """
+        names = list(dict.fromkeys(names))
+        known = [name for name in names if name in nersc_systems]
+        results = {}
+
+        sub_url = '/status'
+        if notes:
+            sub_url = '/status/notes'
+        if outages:
+            sub_url = '/status/outages'
+        if planned:
+            sub_url = '/status/outages/planned'
+
+        if known and sub_url == '/status':
+            if new or any(self.status_cache.get(name) is None for name in known):
+                await self.__get_system_status()
+            for name in known:
+                status = self.status_cache.get(name)
+                if status is not None:
+                    results[name] = status
+        elif known:
+            grouped = group_by_system(await self.__generic_get(sub_url))
+            if grouped is not None:
+                # Systems without notes/outages aren't in the bulk responce
+                results.update({name: grouped.get(name, []) for name in known})
+
+        async def fetch(name: str):
+            if name not in nersc_systems:
+                return await self.status(name, notes=notes, outages=outages,
+                                         planned=planned, new=new)
+            status = await self.__generic_get(f'{sub_url}/{name}')
+            if sub_url == '/status':
+                self.status_cache.put(name, status)
+            return status
+
+        missing = [name for name in names if name not in results]
+        for name, status in zip(missing, await asyncio.gather(*[fetch(name) for name in missing])):
+            results[name] = status
+
+        return {name: results[name] for name in names}
+
+    async def system_status(self, name: str = "perlmutter") -> NerscSystemState:
+        """system_status
+
+        Args:
+            name (str, optional): Name of the system to check status. Defaults to "perlmutter".
+
+        Returns:
+            NerscSystemState: State of the system as an enum
+        """
+        data = await self.status(name=name)
+        if not isinstance(data, dict):
+            return NerscSystemState.UNKNOWN
+
+        # Active comes up for up and degraded so we split them based on descrition
+        if data['status'] == 'active':
+            return NerscSystemState.ACTIVE
+        elif data['status'] == 'degraded':
+            return NerscSystemState.DEGRADED
+        elif data['description'] == "Scheduled Maintenance":
+            return NerscSystemState.MAINTNAINCE
+
+        return NerscSystemState.DOWN
+
+    async def check_status(self, name: str = "perlmutter") -> bool:
+        """Check Status
+
+        Args:
+            name (str, optional): Name to get status od. Defaults to "perlmutter".
+
+        Returns:
+            bool: Gives bool value if site is up/down, true/false
+        """
+        current_status = await self.system_status(name=name)
+
+        down = (NerscSystemState.DOWN | NerscSystemState.MAINTNAINCE |
+                NerscSystemState.UNKNOWN)
+        if current_status in down:
+            logging.debug("%s is %s", name, current_status)
+            return False
+
+        return True
+
+    async def __raise_if_down(self, site: str) -> None:
+        current_status = await self.system_status(name=site)
+        if current_status in (NerscSystemState.DOWN | NerscSystemState.MAINTNAINCE |
+                              NerscSystemState.UNKNOWN):
+            raise SuperfacilitySiteDown(
+                f'{site} is down, Reason: {current_status}')
+
+    async def ls(self, remote_path: str, site: str = NERSC_DEFAULT_COMPUTE) -> Dict:
+        """ls comand on a site
+
+        Parameters
+        ----------
+        site : str, optional
+            Name of the site you want to ls at, by default NERSC_DEFAULT_COMPUTE
+        remote_path : str, optional
+            Path on the system, by default None
+
+        Returns
+        -------
+        Dict
+        """
+        if remote_path is None:
+            return None
+
+        path = remote_path.replace("/", "%2F")
+
+        return await self.__generic_get(f'/utilities/ls/{site}/{path}')
+
+    async def projects(self) -> Dict:
+        """Get information about your projects
+
+        Returns
+        -------
+        Dict
+        """
+        return await self.__generic_get('/account/projects')
+
+    async def get_groups(self, groups: str = None) -> Dict:
+        """Get information about your groups
+
+        Returns
+        -------
+        Dict
+        """
+        sub_url = '/account/groups'
+        if groups is not None:
+            sub_url = f'/account/groups/{groups}'
+
+        return await self.__generic_get(sub_url)
+
+    async def roles(self) -> Dict:
+        """Get roles for your account
+
+        Returns
+        -------
+        Dict
+        """
+        return await self.__generic_get('/account/roles')
+
+    async def tasks(self, task_id: int = None) -> Dict:
+        """Used to get SuperfacilityAPI tasks
+
+        Parameters
+        ----------
+        task_id : int, optional
+            SuperfacilityAPI task number, by default None
+
+        Returns
+        -------
+        Dict
+        """
+        sub_url = '/tasks'
+        if task_id is not None:
+            sub_url = f'{sub_url}/{task_id}'
+
+        return await self.__generic_get(sub_url)
+
+    async def __all_tasks(self) -> List[Dict]:
+        with request_priority(BACKGROUND):
+            return task_list(await self.tasks())
+
+    async def __wait_task(self, task_id, timeout: int, sleeptime: int) -> Dict:
+        # Waits (up to {timeout*sleeptime} seconds) for the task to complete, without blocking the loop
+        try:
+            return await self.task_poller.wait(task_id, timeout=timeout*sleeptime)
+        except asyncio.TimeoutError:
+            return None
+
+    async def get_jobs(self, site: str = NERSC_DEFAULT_COMPUTE, sacct: bool = True,
+                       jobid: int = None, user: str = None, partition: str = None) -> Dict:
+        """Used to get information about slurm jobs on a system
+
+        Parameters
+        ----------
+        site : str, optional
+            NERSC site where slurm job is running, by default NERSC_DEFAULT_COMPUTE
+        sacct : bool, optional
+            Whether to use sacct[true] or squeue[false], by default True
+        jobid : int, optional
+            Slurm job id to get information for, by default None
+        user : int, optional
+            Username to get information for, by default None
+
+        Returns
+        -------
+        Dict
+        """
+        if site not in NerscCompute:
+            return {'status': "", 'output': [], 'error': ""}
+
+        await self.__raise_if_down(site)
+
+        sub_url = f'/compute/jobs/{site}'
+        if jobid is not None:
+            sub_url = f'{sub_url}/{jobid}'
+
+        sub_url = f'{sub_url}?sacct={"true" if sacct else "false"}'
+
+        if user is not None:
+            sub_url = f'{sub_url}&kwargs=user%3D{user}'
+        elif partition is not None:
+            sub_url = f'{sub_url}&kwargs=partition%3D{partition}'
+
+        return await self.__generic_get(sub_url)
+
+    async def squeue(self, site: str = NERSC_DEFAULT_COMPUTE,
+                     jobid: int = None, user: str = None,
+                     partition: str = None, dataframe: bool = False,
+                     columns: List[str] = None,
+                     typed: bool = False):
+        """squeue
+
+        Returns similar information as squeue command line, with dataframe=True
+        the jobs come back as a DataFrame of the projected columns, with
+        typed=True its times, durations, sizes and ids are parsed
+        """
+        jobs = await self.get_jobs(site=site, jobid=jobid, user=user,
+                                   partition=partition, sacct=False)
+        if 'output' in jobs:
+            jobs = jobs['output']
+
+        if dataframe and HAVE_PANDAS:
+            from .frames import jobs_frame, squeue_types
+            return jobs_frame(jobs, squeue_columns, squeue_types,
+                              projection=columns, typed=typed)
+
+        return jobs
+
+    async def sacct(self, site: str = NERSC_DEFAULT_COMPUTE,
+                    jobid: int = None, user: str = None,
+                    partition: str = None, dataframe: bool = False,
+                    columns: List[str] = None,
+                    typed: bool = False):
+        """sacct
+
+        Returns similar information as sacct command line, with dataframe=True
+        the jobs come back as a DataFrame of the projected columns, with
+        typed=True its times, durations, sizes and ids are parsed
+        """
+        jobs = await self.get_jobs(site=site, jobid=jobid, user=user,
+                                   partition=partition, sacct=True)
+        if 'output' in jobs:
+            jobs = jobs['output']
+
+        if dataframe and HAVE_PANDAS:
+            from .frames import jobs_frame, sacct_types
+            return jobs_frame(jobs, sacct_columns, sacct_types,
+                              projection=columns, typed=typed)
+
+        return jobs
+
+    async def post_job(self, site: str = NERSC_DEFAULT_COMPUTE,
+                       script: str = None, isPath: bool = True,
+                       run_async: bool = False,
+                       timeout: int = 30,
+                       sleeptime: int = 2) -> Dict:
+        """Adds a new job to the queue
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to add job to, by default NERSC_DEFAULT_COMPUTE
+        script : str, optional
+            Path or script to call sbatch on, by default None
+        isPath : bool, optional
+            Is the script a path on the site or a file, by default True
+        run_async : bool, optional
+            Return the task_id without waiting for the jobid, by default False
+
+        Returns
+        -------
+        Dict
+            error, jobid and task_id of the submission
+        """
+        job_info = {'error': None, 'jobid': None, 'task_id': None}
+
+        if site not in NerscCompute:
+            job_info['error'] = 'not a compute site'
+            return job_info
+
+        await self.__raise_if_down(site)
+
+        data = {'job': script, 'isPath': 'true' if isPath else 'false'}
+        resp = await self.__generic_post(f'/compute/jobs/{site}', data=data)
+        if resp is None:
+            return {'error': -1, 'jobid': None, 'task_id': None}
+
+        task_id = resp['task_id']
+        job_info['task_id'] = task_id
+        if run_async:
+            return job_info
+
+        task = await self.__wait_task(task_id, timeout, sleeptime)
+        if task is not None:
+            jobinfo = json.loads(task['result'])
+            return {
+                'error': jobinfo['error'],
+                'jobid': jobinfo['jobid'],
+                'task_id': task_id
+            }
+
+        return job_info
+
+    async def sbatch(self, site: str = NERSC_DEFAULT_COMPUTE,
+                     script: str = None, isPath: bool = True) -> int:
+        """Adds a new job to the queue like sbatch
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to add job to, by default NERSC_DEFAULT_COMPUTE
+        script : str, optional
+            Path or script to call sbatch on, by default None
+        isPath : bool, optional
+            Is the script a path on the site or a file, by default True
+
+        Returns
+        -------
+        int
+            slurm jobid
+        """
+        if isPath:
+            out = await self.ls(script, site=site)
+            if out['status'] == "ERROR":
+                raise FileNotFoundError(f"{script} Not found on {site}")
+        elif Path(script).exists():
+            with open(Path(script)) as contents:
+                script = contents.read()
+
+        job_output = await self.post_job(site=site, script=script, isPath=isPath)
+
+        return job_output['jobid']
+
+    async def delete_job(self, site: str = NERSC_DEFAULT_COMPUTE, jobid: int = None) -> Dict:
+        """Removes job from queue
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to remove job from, by default NERSC_DEFAULT_COMPUTE
+        jobid : int, optional
+            Jobid to remove, by default None
+
+        Returns
+        -------
+        Dict
+        """
+        if site not in NerscCompute:
+            return None
+
+        # Cancelling goes ahead of any background polling
+        with request_priority(INTERACTIVE):
+            await self.__raise_if_down(site)
+            return await self.__generic_delete(f'/compute/jobs/{site}/{jobid}')
+
+    async def scancel(self, jobid: int, site: str = NERSC_DEFAULT_COMPUTE) -> bool:
+        """Removes job from queue
+
+        Returns
+        -------
+        bool
+        """
+        del_job = await self.delete_job(site=site, jobid=jobid)
+        return (del_job['status'] == 'OK')
+
+    async def custom_cmd(self,
+                         run_async: bool = False,
+                         site: str = NERSC_DEFAULT_COMPUTE, cmd: str = None,
+                         timeout: int = 30, sleeptime: int = 2) -> Dict:
+        """Run custom command
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to run the command on, by default NERSC_DEFAULT_COMPUTE
+        cmd: str,
+            Command to run
+
+        Returns
+        -------
+        Dict
+        """
+        if site not in NerscCompute:
+            return None
+
+        resp = await self.__generic_post(f'/utilities/command/{site}',
+                                         data={'executable': cmd})
+        if resp is None:
+            return {'error': -1, 'task_id': None}
+
+        task_id = resp['task_id']
+        if run_async:
+            return {'error': None, 'task_id': task_id}
+
+        task = await self.__wait_task(task_id, timeout, sleeptime)
+        if task is None:
+            task = await self.tasks(task_id)
+
+        try:
+            ret = json.loads(task['result'])
+            ret['task_id'] = task_id
+            return ret
+        except TypeError as e:
+            logging.warning(f"{type(e).__name__} : {e}")
+            return {'jobid': f"{type(e).__name__} : {e}"}
+
+    async def download(self,
+                       site: str = NERSC_DEFAULT_COMPUTE, remote_path: str = None,
+                       binary: bool = False, local_path: str = '.', save: bool = False) -> Dict:
+        """Download a file from a site
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to download from, by default NERSC_DEFAULT_COMPUTE
+        remote_path : str
+            Path of the file on the site
+        binary : bool, optional
+            Download the file base64 encoded, by default False
+        local_path : str, optional
+            Directory to save the file to, by default '.'
+        save : bool, optional
+            Write the file to local_path, by default False
+
+        Returns
+        -------
+        Dict
+        """
+        if site is None:
+            raise SuperfacilityCmdFailed("Need site to download from")
+        if remote_path is None:
+            raise SuperfacilityCmdFailed("Need a remote path to download")
+
+        if site not in ['perlmutter', 'cori']:
+            raise SuperfacilityCmdFailed(f"Cannot download from {site}")
+
+        file_name = f'{local_path}/{remote_path.split("/")[-1]}'
+        path = remote_path.replace("/", "%2F")
+
+        sub_url = f'/utilities/download/{site}/{path}'
+        if binary:
+            sub_url = f'{sub_url}?binary=true'
+
+        res = await self.__generic_get(sub_url)
+        if res is not None and res['error'] is None and save:
+            with open(file_name, "wb") as f:
+                f.write(bytes(res['file'], 'utf8'))
+
+        return res
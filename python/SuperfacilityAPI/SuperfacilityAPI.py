@@ -1,16 +1,19 @@
-from typing import Dict, List
-from authlib.integrations.requests_client import (
-    OAuth2Session,
-    OAuthError
-)
-from authlib.oauth2.rfc7523 import PrivateKeyJWT
-import requests
+from typing import Callable, Dict, Iterator, List
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import concurrent.futures
 import sys
 from time import sleep
+import time
 from datetime import datetime
 import json
+import hashlib
 import logging
-from pathlib import Path
+import os
+import shlex
+from pathlib import Path, PurePosixPath
+from fnmatch import fnmatch
+from contextlib import nullcontext
+import posixpath
 import urllib.parse
 from . import SuperfacilityAccessToken
 
@@ -23,10 +26,43 @@ from .SuperfacilityErrors import (
     InternalServerError,
     NoClientException,
     SuperfacilityCmdFailed,
+    SuperfacilityError,
     SuperfacilitySiteDown,
     ApiTokenError
 )
 from .api_version import API_VERSION
+from .transport import (
+    SuperfacilityTransport,
+    DEFAULT_POOL_MAXSIZE,
+    DEFAULT_TIMEOUT
+)
+from .task_poller import TaskPoller, task_list
+from .status_cache import StatusCache, DEFAULT_STATUS_TTL, group_by_system
+from .retry import RetryPolicy, CircuitBreaker
+from .ratelimit import RateLimiter, request_priority, INTERACTIVE, BACKGROUND
+from .coalesce import SingleFlight
+from .instrument import Instrumentation, cache_miss
+from .ls_cache import LsCache
+from .job_watcher import JobWatcher, DEFAULT_WATCH_INTERVAL
+from .job_history import JobHistory, DEFAULT_SYNC_OVERLAP, latest_time, shift_time
+from .workflow import Workflow, DEFAULT_MAX_IN_FLIGHT
+from .upload import (
+    DEFAULT_UPLOAD_CHUNK_SIZE,
+    UPLOAD_ROUNDS,
+    UploadManifest,
+    chunk_checksums,
+    iter_chunks,
+    parse_sha256sum,
+    part_path
+)
+from .streaming import (
+    DEFAULT_CHUNK_SIZE,
+    iter_base64,
+    iter_json_array,
+    iter_json_string,
+    iter_text,
+    rechunk
+)
 from .nersc_systems import (
     NERSC_DEFAULT_COMPUTE,
     nersc_systems,
@@ -34,14 +70,22 @@ from .nersc_systems import (
     NerscFilesystems
 )
 
+from .lazy import lazy_import, have_module
+
 from enum import Flag, auto, Enum
 
+requests = lazy_import('requests')
+
+# pandas is only imported when a DataFrame is asked for
 global HAVE_PANDAS
-try:
-    import pandas as pd
-    HAVE_PANDAS = True
-except ImportError:
-    HAVE_PANDAS = False
+HAVE_PANDAS = have_module('pandas')
+
+# Bytes read at a time when streaming jobs, small so memory follows the batch size
+DEFAULT_JOBS_CHUNK_SIZE = 64 << 10
+# Jobs per DataFrame when streaming squeue or sacct as DataFrames
+DEFAULT_JOBS_BATCH_SIZE = 1000
+# Unfinished jobs asked for per sacct request when syncing the job history
+SYNC_JOBS_PER_REQUEST = 200
 
 
 sacct_columns = ['account', 'admincomment', 'alloccpus', 'allocnodes', 'alloctres', 'associd', 'avecpu',
@@ -84,15 +128,49 @@ class SuperfacilityAPI:
     _status = None
     access_token = None
 
-    def __init__(self, token=None, base_url=None):
+    def __init__(self, token=None, base_url=None,
+                 transport: SuperfacilityTransport = None,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 timeout=DEFAULT_TIMEOUT,
+                 status_ttl: float = DEFAULT_STATUS_TTL,
+                 ls_cache: LsCache = None,
+                 job_history: JobHistory = None,
+                 retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limiter: RateLimiter = None,
+                 coalesce_window: float = 0.0,
+                 instrumentation: Instrumentation = None):
         """SuperfacilityAPI
 
         Parameters
         ----------
-        client_id : str, optional
-            Client ID obtained from iris, by default None
-        private_key : str, optional
-            Private key obtained from iris, by default None
+        token : str or SuperfacilityAccessToken, optional
+            Access token used to authorize requests, by default None
+        base_url : str, optional
+            Base url for sfapi requests, by default the NERSC api
+        transport : SuperfacilityTransport, optional
+            Transport to send requests with, by default a new pooled transport
+        pool_maxsize : int, optional
+            Keep-alive connections per host for a new transport, by default DEFAULT_POOL_MAXSIZE
+        timeout : float or (float, float), optional
+            Connect and read timeouts for a new transport, by default DEFAULT_TIMEOUT
+        status_ttl : float, optional
+            Seconds to cache system status for, by default DEFAULT_STATUS_TTL
+        ls_cache : LsCache, optional
+            On disk cache for ls results, by default None (no caching)
+        job_history : JobHistory, optional
+            Local store sacct is synced into and answered from, by default None
+        retry : RetryPolicy, optional
+            When a new transport retries failed requests, by default RetryPolicy()
+        breaker : CircuitBreaker, optional
+            Per site circuit breaker for a new transport, by default CircuitBreaker()
+        rate_limiter : RateLimiter, optional
+            Request budgets per endpoint class for a new transport, by default None (no limit)
+        coalesce_window : float, optional
+            Seconds identical GETs keep sharing a finished result, by default 0
+            (only GETs in flight at the same time are shared)
+        instrumentation : Instrumentation, optional
+            Request hooks and metrics for a new transport, by default a new Instrumentation()
         """
         self.API_VERSION = API_VERSION
         if base_url is None:
@@ -100,66 +178,97 @@ class SuperfacilityAPI:
             self.base_url = f'https://api.nersc.gov/api/v{self.API_VERSION}'
         else:
             self.base_url = base_url
-        self.headers = {'accept': 'application/json',
-                        'Content-Type': 'application/x-www-form-urlencoded'}
+        if transport is None:
+            transport = SuperfacilityTransport(pool_maxsize=pool_maxsize,
+                                               timeout=timeout,
+                                               retry=retry,
+                                               breaker=breaker,
+                                               rate_limiter=rate_limiter,
+                                               instrumentation=instrumentation)
+        self.transport = transport
+        self.instrumentation = self.transport.instrumentation
+        self.headers = self.transport.headers
         self.access_token = token
+        # Shared tracker for outstanding tasks, polls /tasks once per tick
+        self.task_poller = TaskPoller(self.__poll_tasks)
+        self.status_cache = StatusCache(ttl=status_ttl)
+        self.ls_cache = ls_cache
+        self.job_history = job_history
+        # Identical GETs in flight at the same time share one request
+        self.single_flight = SingleFlight(window=coalesce_window)
 
-    def __generic_get(self, sub_url: str, header: Dict = None) -> Dict:
-        """PRIVATE: Used to make a GET request to the api given a fully qualified sub url.
+    def __poll_tasks(self) -> List[Dict]:
+        # Polling yields to interactive calls when requests are rate limited
+        with request_priority(BACKGROUND):
+            return task_list(self.tasks())
+
+    def __generic_request(self, method: str, sub_url: str, header: Dict = None,
+                          data: Dict = None, files: Dict = None) -> Dict:
+        """PRIVATE: Used to make a request to the api given a fully qualified sub url.
 
 
         Parameters
         ----------
+        method : str
+            HTTP method, GET/POST/DELETE
         sub_url : str
             Url of the specific funtion to request.
+        header : Dict, optional
+            Extra headers for the request, by default None
+        data : Dict, optional
+            Form data for the request, by default None
+        files : Dict, optional
+            Files to send as multipart/form-data, by default None
 
         Returns
         -------
         Dict
             Dictionary given by requests.Responce.json()
         """
-        logging.debug(f"__generic_get {sub_url}")
-        json_resp = {}
-        if isinstance(self.access_token, str):
-            self.headers['Authorization'] = f'Bearer {self.access_token}'
-        elif isinstance(self.access_token, SuperfacilityAccessToken):
-            self.headers['Authorization'] = f'Bearer {self.access_token.token}'
-        else:
-            raise PermissionError("No Token Provided")
+        logging.debug("__generic_request %s %s%s", method, self.base_url, sub_url)
+        sent = []
+
+        def send():
+            sent.append(True)
+            resp = self.transport.request(method, self.base_url+sub_url,
+                                          token=self.access_token,
+                                          header=header, data=data, files=files)
+            return resp.json()
+
+        if method == 'GET' and header is None:
+            result = self.single_flight.do(sub_url, send)
+            if not sent:
+                # Shared the answer of an identical request
+                self.instrumentation.cache_hit('coalesce', method, self.base_url+sub_url)
+            return result
+        return send()
+
+    def __generic_stream(self, sub_url: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[str]:
+        """PRIVATE: Used to stream the body of a GET request as text given a fully qualified sub url.
+
+
+        Parameters
+        ----------
+        sub_url : str
+            Url of the specific funtion to request.
+        chunk_size : int, optional
+            Bytes to read from the socket at a time, by default DEFAULT_CHUNK_SIZE
 
+        Yields
+        ------
+        str
+            Pieces of the body text
+        """
+        logging.debug("__generic_stream GET %s%s", self.base_url, sub_url)
+        resp = self.transport.request('GET', self.base_url+sub_url,
+                                      token=self.access_token, stream=True)
         try:
-            logging.debug(
-                f"Getting from {self.base_url+sub_url}")
-            # Perform a get request
-            resp = requests.get(
-                self.base_url+sub_url, headers=self.headers if header is None else header)
-
-            status = resp.status_code
-            # Raise error based on reposnce status [200 OK] [500 err]
-            resp.raise_for_status()
-            json_resp = resp.json()
-        except requests.exceptions.HTTPError as err:
-            if status == 404:
-                logging.warning(warning_fourOfour.format(
-                    self.base_url+sub_url))
-                raise FourOfourException(
-                    f"404 not found {self.base_url+sub_url}")
-            elif status == 500:
-                logging.warning(f"500 Internal Server Error {err}")
-                raise InternalServerError(f"500 Internal Server Error {err}")
-            elif status == 403:
-                logging.warning(
-                    f"The security token included in the request is invalid. {err}")
-                raise ApiTokenError(
-                    f"The security token included in the request is invalid.  {err}")
-        except requests.exceptions.TooManyRedirects as err:
-            logging.warning(f"TooManyRedirects {err}")
-            raise InternalServerError(f"TooManyRedirects {err}")
-
-        return json_resp
+            yield from iter_text(resp.iter_content(chunk_size))
+        finally:
+            resp.close()
 
-    def __generic_post(self, sub_url: str, header: Dict = None, data: Dict = None) -> Dict:
-        """PRIVATE: Used to make a POST request to the api given a fully qualified sub url.
+    def __generic_get(self, sub_url: str, header: Dict = None) -> Dict:
+        """PRIVATE: Used to make a GET request to the api given a fully qualified sub url.
 
 
         Parameters
@@ -172,47 +281,23 @@ class SuperfacilityAPI:
         Dict
             Dictionary given by requests.Responce.json()
         """
-        logging.debug(f"__generic_post {sub_url}")
-        json_resp = {}
+        return self.__generic_request('GET', sub_url, header=header)
 
-        if isinstance(self.access_token, str):
-            self.headers['Authorization'] = f'Bearer {self.access_token}'
-        elif isinstance(self.access_token, SuperfacilityAccessToken):
-            self.headers['Authorization'] = f'Bearer {self.access_token.token}'
-        else:
-            raise PermissionError("No Token Provided")
+    def __generic_post(self, sub_url: str, header: Dict = None, data: Dict = None) -> Dict:
+        """PRIVATE: Used to make a POST request to the api given a fully qualified sub url.
 
-        try:
-            logging.debug(
-                f"Sending {data} to {self.base_url+sub_url}")
-            # Perform a get request
-            resp = requests.post(
-                self.base_url+sub_url,
-                headers=self.headers if header is None else header,
-                data="" if data is None else urllib.parse.urlencode(data))
-            status = resp.status_code
-            # Raise error based on reposnce status [200 OK] [500 err]
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            if status == 404:
-                logging.warning(warning_fourOfour.format(
-                    self.base_url+sub_url))
-                raise FourOfourException(
-                    f"404 not found {self.base_url+sub_url}")
-            elif status == 403:
-                logging.warning(
-                    f"The security token included in the request is invalid. {err}")
-                raise ApiTokenError(
-                    f"The security token included in the request is invalid.  {err}")
-            elif status == 500:
-                if self.access_token is None:
-                    logging.warning(no_client)
-                    raise NoClientException(no_client)
-                logging.warning(f"500 Internal Server Error")
-                raise InternalServerError(f"500 Internal Server Error")
-
-        json_resp = resp.json()
-        return json_resp
+
+        Parameters
+        ----------
+        sub_url : str
+            Url of the specific funtion to request.
+
+        Returns
+        -------
+        Dict
+            Dictionary given by requests.Responce.json()
+        """
+        return self.__generic_request('POST', sub_url, header=header, data=data)
 
     def __generic_delete(self, sub_url: str, header: Dict = None) -> Dict:
         """PRIVATE: Used to make a DELETE request to the api given a fully qualified sub url.
@@ -228,54 +313,31 @@ class SuperfacilityAPI:
         Dict
             Dictionary given by requests.Responce.json()
         """
-        logging.debug(f"__generic_delete {sub_url}")
-        json_resp = {}
+        return self.__generic_request('DELETE', sub_url, header=header)
 
-        if isinstance(self.access_token, str):
-            self.headers['Authorization'] = f'Bearer {self.access_token}'
-        elif isinstance(self.access_token, SuperfacilityAccessToken):
-            self.headers['Authorization'] = f'Bearer {self.access_token.token}'
-        else:
-            raise PermissionError("No Token Provided")
-
-        try:
-            # Perform a get request
-            resp = requests.delete(
-                self.base_url+sub_url,
-                headers=self.headers if header is None else header)
-            status = resp.status_code
-            # Raise error based on reposnce status [200 OK] [500 err]
-            resp.raise_for_status()
-        except requests.exceptions.HTTPError as err:
-            if status == 404:
-                logging.warning(warning_fourOfour.format(
-                    self.base_url+sub_url))
-                raise FourOfourException(
-                    f"404 not found {self.base_url+sub_url}")
-            elif status == 403:
-                logging.warning(
-                    f"The security token included in the request is invalid. {err}")
-                raise ApiTokenError(
-                    f"The security token included in the request is invalid.  {err}")
-            elif status == 500:
-                if self.access_token is None:
-                    logging.warning(no_client)
-                    raise NoClientException(no_client)
-
-                logging.warning(f"500 Internal Server Error")
-                raise InternalServerError(f"500 Internal Server Error")
-
-        json_resp = resp.json()
-        return json_resp
+    def __generic_put(self, sub_url: str, files: Dict = None) -> Dict:
+        """PRIVATE: Used to make a multipart PUT request to the api given a fully qualified sub url.
+        """
+        return self.__generic_request('PUT', sub_url, files=files)
 
     def __get_system_status(self) -> None:
         """Gets the system status and all systems and stores them.
         """
         logging.debug("Getting full status")
         self._status = self.__generic_get('/status/')
-        logging.debug(f"Putting {self._status} into the systems")
+        self.status_cache.put_all(self._status)
         self.systems = [system['name'] for system in self._status]
 
+    def invalidate_status(self, name: str = None) -> None:
+        """Forget cached system status so the next call fetches it again
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the system to forget, by default forgets every system
+        """
+        self.status_cache.invalidate(name)
+
     def system_names(self) -> List:
         """Returns list of all systems at NERSC
 
@@ -304,6 +366,7 @@ class SuperfacilityAPI:
             Get planned outages, by default False
         new : bool, optional
             Get newest version of the status, by default False
+            Otherwise the status is served from status_cache while it is fresh
 
         Returns
         -------
@@ -326,13 +389,106 @@ class SuperfacilityAPI:
             return {'name': 'muller', 'full_name': 'muller', 'description': 'System is active',
                     'system_type': 'compute', 'notes': [], 'status': 'active', 'updated_at': 'never'}
 
-        if sub_url == '/status' and not new:
-            if self._status is None:
-                self.__get_system_status()
-            return self._status
+        if sub_url == '/status':
+            if new or self.__cached_status() is None:
+                with cache_miss('status'):
+                    self.__get_system_status()
+            return self.status_cache.get() or self._status
+
+        if sub_url == f'/status/{name}':
+            status = None if new else self.__cached_status(name)
+            if status is None:
+                with cache_miss('status'):
+                    # One full /status fills in every system for later lookups
+                    self.__get_system_status()
+                    status = self.status_cache.get(name)
+                    if status is None:
+                        status = self.__generic_get(sub_url)
+                        self.status_cache.put(name, status)
+            return status
 
         return self.__generic_get(sub_url)
 
+    def __cached_status(self, name: str = None):
+        """PRIVATE: Gets a status from the status_cache, reporting hits to the instrumentation
+        """
+        status = self.status_cache.get(name)
+        if status is not None:
+            sub_url = '/status/' if name is None else f'/status/{name}'
+            self.instrumentation.cache_hit('status', 'GET', self.base_url+sub_url)
+        return status
+
+    def status_many(self, names: List[str], notes: bool = False,
+                    outages: bool = False, planned: bool = False,
+                    new: bool = False, max_workers: int = 8) -> Dict[str, Dict]:
+        """Gets the status of several NERSC systems at once
+
+        Whatever one bulk /status (or notes/outages) responce has is used as
+        is, the systems missing from it are fetched concurrently.
+
+        Parameters
+        ----------
+        names : List[str]
+            Names of the systems
+        notes : bool, optional
+            Get notes on the status, by default False
+        outages : bool, optional
+            Get current outages, by default False
+        planned : bool, optional
+            Get planned outages, by default False
+        new : bool, optional
+            Get newest version of the status, by default False
+        max_workers : int, optional
+            Most systems fetched at the same time, by default 8
+
+        Returns
+        -------
+        Dict[str, Dict]
+            System name -> what status(name, ...) returns for it
+        """
+        names = list(dict.fromkeys(names))
+        known = [name for name in names if name in nersc_systems]
+        results = {}
+
+        sub_url = '/status'
+        if notes:
+            sub_url = '/status/notes'
+        if outages:
+            sub_url = '/status/outages'
+        if planned:
+            sub_url = '/status/outages/planned'
+
+        if known and sub_url == '/status':
+            if new or any(self.status_cache.get(name) is None for name in known):
+                with cache_miss('status'):
+                    self.__get_system_status()
+            for name in known:
+                status = self.status_cache.get(name)
+                if status is not None:
+                    results[name] = status
+        elif known:
+            grouped = group_by_system(self.__generic_get(sub_url))
+            if grouped is not None:
+                # Systems without notes/outages aren't in the bulk responce
+                results.update({name: grouped.get(name, []) for name in known})
+
+        def fetch(name: str):
+            if name not in nersc_systems:
+                return self.status(name, notes=notes, outages=outages,
+                                   planned=planned, new=new)
+            status = self.__generic_get(f'{sub_url}/{name}')
+            if sub_url == '/status':
+                self.status_cache.put(name, status)
+            return status
+
+        missing = [name for name in names if name not in results]
+        if missing:
+            with ThreadPoolExecutor(max_workers=min(max_workers, len(missing))) as pool:
+                for name, status in zip(missing, pool.map(fetch, missing)):
+                    results[name] = status
+
+        return {name: results[name] for name in names}
+
     def system_status(self, name: str = "perlmutter"):
         """system_status
 
@@ -378,12 +534,24 @@ class SuperfacilityAPI:
                 NerscSystemState.UNKNOWN)
         # Check if status is any of the down states and return false
         if current_status in down:
-            logging.debug(f"{name} is {current_status}")
+            logging.debug("%s is %s", name, current_status)
             return False
 
         return True
 
-    def ls(self, remote_path: str, site: str = NERSC_DEFAULT_COMPUTE) -> Dict:
+    def __raise_if_down(self, site: str) -> None:
+        """PRIVATE: Raises SuperfacilitySiteDown if the site can't take requests
+        """
+        current_status = self.system_status(name=site)
+        down = (NerscSystemState.DOWN | NerscSystemState.MAINTNAINCE |
+                NerscSystemState.UNKNOWN)
+        if current_status in down:
+            logging.debug("%s is %s", site, current_status)
+            raise SuperfacilitySiteDown(
+                f'{site} is down, Reason: {current_status}')
+
+    def ls(self, remote_path: str, site: str = NERSC_DEFAULT_COMPUTE,
+           new: bool = False) -> Dict:
         """ls comand on a site
 
         Parameters
@@ -392,6 +560,8 @@ class SuperfacilityAPI:
             Name of the site you want to ls at, by default NERSC_DEFAULT_COMPUTE
         remote_path : str, optional
             Path on the system, by default None
+        new : bool, optional
+            Skip the ls_cache and get a fresh listing, by default False
 
         Returns
         -------
@@ -405,7 +575,114 @@ class SuperfacilityAPI:
 
         sub_url = f'{sub_url}/{site}/{path}'
 
-        return self.__generic_get(sub_url)
+        if self.ls_cache is not None and not new:
+            cached = self.ls_cache.get(site, remote_path)
+            if cached is not None:
+                self.instrumentation.cache_hit('ls', 'GET', self.base_url+sub_url)
+                return cached
+
+        with cache_miss('ls') if self.ls_cache is not None else nullcontext():
+            out = self.__generic_get(sub_url)
+        if self.ls_cache is not None and isinstance(out, dict) and out.get('status') != "ERROR":
+            self.ls_cache.put(site, remote_path, out)
+        return out
+
+    def exists(self, remote_path: str, site: str = NERSC_DEFAULT_COMPUTE) -> bool:
+        """Checks if a path exists on a site
+
+        Answered from the ls_cache when a cached listing has the path,
+        anything else is checked with a live ls.
+
+        Parameters
+        ----------
+        remote_path : str
+            Path on the system
+        site : str, optional
+            Name of the site, by default NERSC_DEFAULT_COMPUTE
+
+        Returns
+        -------
+        bool
+        """
+        if self.ls_cache is not None:
+            known = self.ls_cache.exists(site, remote_path)
+            if known is not None:
+                path = remote_path.replace("/", "%2F")
+                self.instrumentation.cache_hit('ls', 'GET', f'{self.base_url}/utilities/ls/{site}/{path}')
+                return known
+
+        out = self.ls(remote_path, site=site)
+        return isinstance(out, dict) and out.get('status') != "ERROR"
+
+    def walk(self, remote_path: str, site: str = NERSC_DEFAULT_COMPUTE,
+             max_depth: int = None, concurrency: int = 8,
+             include: List[str] = None, exclude: List[str] = None) -> Iterator[Dict]:
+        """Recursively lists a directory on a site, running ls on many directories at once
+
+        Parameters
+        ----------
+        remote_path : str
+            Directory on the system to start from
+        site : str, optional
+            Name of the site you want to walk at, by default NERSC_DEFAULT_COMPUTE
+        max_depth : int, optional
+            Levels of directories to list, 1 only lists remote_path, by default no limit
+        concurrency : int, optional
+            Number of ls calls running at once, by default 8
+        include : List[str], optional
+            Glob patterns, only entries whose name or path match one are yielded, by default None
+        exclude : List[str], optional
+            Glob patterns, matching entries are skipped and not descended into, by default None
+
+        Yields
+        ------
+        Dict
+            ls entry with its full 'path' and 'depth' added, as each listing arrives
+        """
+        def matches(path, patterns):
+            return any(fnmatch(path, pattern) or fnmatch(posixpath.basename(path), pattern)
+                       for pattern in patterns)
+
+        root = posixpath.normpath(remote_path)
+        visited = {root}
+        pool = ThreadPoolExecutor(max_workers=concurrency)
+        futures = {pool.submit(self.ls, root, site): (root, 1)}
+        try:
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    directory, depth = futures.pop(future)
+                    try:
+                        out = future.result()
+                    except SuperfacilityError as err:
+                        # e.g. an unreadable or just deleted directory, the rest of the tree is still walked
+                        logging.warning(f"ls {directory} on {site} failed: {type(err).__name__}: {err}")
+                        continue
+                    if out is None or out.get('status') == "ERROR":
+                        logging.warning(f"ls {directory} on {site} failed: {out}")
+                        continue
+
+                    for entry in out.get('entries', []):
+                        name = posixpath.basename(entry['name'])
+                        if name in ('.', '..', ''):
+                            continue
+                        path = posixpath.join(directory, name)
+                        if exclude and matches(path, exclude):
+                            continue
+
+                        # Symlinks aren't followed, and visited stops any other loops
+                        is_dir = entry.get('perms', '').startswith('d')
+                        if is_dir and (max_depth is None or depth < max_depth) \
+                                and path not in visited:
+                            visited.add(path)
+                            futures[pool.submit(self.ls, path, site)] = (path, depth + 1)
+
+                        if not include or matches(path, include):
+                            yield dict(entry, path=path, depth=depth)
+        finally:
+            for future in futures:
+                future.cancel()
+            pool.shutdown(wait=True)
 
     def projects(self) -> Dict:
         """Get information about your projects
@@ -492,7 +769,8 @@ class SuperfacilityAPI:
         return self.__generic_get(sub_url)
 
     def get_jobs(self, site: str = NERSC_DEFAULT_COMPUTE, sacct: bool = True,
-                 jobid: int = None, user: str = None, partition: str = None) -> Dict:
+                 jobid: int = None, user: str = None, partition: str = None,
+                 stream: bool = False, batch_size: int = None, jobids: List = None):
         """Used to get information about slurm jobs on a system
 
         Parameters
@@ -505,21 +783,93 @@ class SuperfacilityAPI:
             Slurm job id to get information for, by default None
         user : int, optional
             Username to get information for, by default None
+        stream : bool, optional
+            Return an iterator over the jobs parsed as the response arrives, see iter_jobs, by default False
+        batch_size : int, optional
+            With stream, yield lists of up to batch_size jobs, by default None
+        jobids : List, optional
+            Slurm job ids to get information for in one request, by default None
 
         Returns
         -------
         Dict
 
         """
+        if stream:
+            return self.iter_jobs(site=site, sacct=sacct, jobid=jobid, user=user,
+                                  partition=partition, batch_size=batch_size, jobids=jobids)
 
         if site not in NerscCompute:
             return {'status': "", 'output': [], 'error': ""}
 
-        if not self.check_status(name=site):
-            logging.debug(site)
-            raise SuperfacilitySiteDown(
-                f'{site} is down, Reason: {self.system_status(name=site)}')
-            # return {'status': "", 'output': [], 'error': ""}
+        return self.__generic_get(self.__jobs_url(site, sacct, jobid, user, partition,
+                                                  self.__jobids_options(jobids)))
+
+    def iter_jobs(self, site: str = NERSC_DEFAULT_COMPUTE, sacct: bool = True,
+                  jobid: int = None, user: str = None, partition: str = None,
+                  batch_size: int = None, chunk_size: int = DEFAULT_JOBS_CHUNK_SIZE,
+                  jobids: List = None) -> Iterator:
+        """Streams the jobs of get_jobs, parsing them as the response arrives
+
+        Only the jobs not handed out yet are held in memory, so a full
+        system squeue or a large sacct doesn't need to fit in memory at once.
+
+        Parameters
+        ----------
+        site : str, optional
+            NERSC site where slurm job is running, by default NERSC_DEFAULT_COMPUTE
+        sacct : bool, optional
+            Whether to use sacct[true] or squeue[false], by default True
+        jobid : int, optional
+            Slurm job id to get information for, by default None
+        user : str, optional
+            Username to get information for, by default None
+        partition : str, optional
+            Partition to get information for, by default None
+        batch_size : int, optional
+            Yield lists of up to batch_size jobs instead of single jobs, by default None
+        chunk_size : int, optional
+            Bytes to read from the socket at a time, by default DEFAULT_JOBS_CHUNK_SIZE
+        jobids : List, optional
+            Slurm job ids to get information for in one request, by default None
+
+        Yields
+        ------
+        Dict or List[Dict]
+            One job, or a batch of jobs
+        """
+        if site not in NerscCompute:
+            return
+
+        sub_url = self.__jobs_url(site, sacct, jobid, user, partition, self.__jobids_options(jobids))
+        yield from self.__stream_jobs(site, sub_url, batch_size, chunk_size)
+
+    def __stream_jobs(self, site: str, sub_url: str, batch_size: int = None,
+                      chunk_size: int = DEFAULT_JOBS_CHUNK_SIZE) -> Iterator:
+        """PRIVATE: Streams the output of a jobs request, raising if it failed
+        """
+        fields = {}
+        yield from iter_json_array(self.__generic_stream(sub_url, chunk_size), 'output',
+                                   fields, batch_size=batch_size)
+
+        if fields.get('status') == 'ERROR' or fields.get('error'):
+            raise SuperfacilityCmdFailed(f"Getting jobs on {site} failed: {fields.get('error')}")
+
+    @staticmethod
+    def __jobids_options(jobids: List) -> Dict:
+        """PRIVATE: squeue/sacct options selecting several jobs, like --jobs=1,2,3
+        """
+        if jobids is None:
+            return None
+        return {'jobs': ','.join(str(jobid) for jobid in jobids)}
+
+    def __jobs_url(self, site: str, sacct: bool, jobid: int, user: str, partition: str,
+                   options: Dict = None) -> str:
+        """PRIVATE: Checks the site is up and builds the sub url of get_jobs
+
+        options are more squeue/sacct options, e.g. {'starttime': '2022-04-14T00:00:00'}
+        """
+        self.__raise_if_down(site)
 
         sub_url = f'/compute/jobs/{site}'
         if jobid is not None:
@@ -532,14 +882,113 @@ class SuperfacilityAPI:
         elif partition is not None:
             sub_url = f'{sub_url}&kwargs=partition%3D{partition}'
 
-        return self.__generic_get(sub_url)
+        for key, value in (options or {}).items():
+            sub_url = f'{sub_url}&kwargs={urllib.parse.quote(f"{key}={value}", safe="")}'
+
+        return sub_url
+
+    def sync_jobs(self, site: str = NERSC_DEFAULT_COMPUTE, user: str = None,
+                  full: bool = False) -> Dict:
+        """Brings the job_history up to date with sacct
+
+        The first sync of a site and user gets their whole sacct history.
+        Later ones only ask for jobs active since the latest time in the
+        records synced before, and for the jobs that hadn't finished then,
+        which is usually a small request. That time is the cluster's, so
+        the clock and timezone of the client don't matter.
+
+        Parameters
+        ----------
+        site : str, optional
+            NERSC site to sync, by default NERSC_DEFAULT_COMPUTE
+        user : str, optional
+            Only sync the jobs of this user, by default None (every job sacct returns)
+        full : bool, optional
+            Get the whole history again instead of what changed, by default False
+
+        Returns
+        -------
+        Dict
+            site, user, whether the sync was full and the number of records fetched
+        """
+        if self.job_history is None:
+            raise SuperfacilityCmdFailed("No job_history to sync jobs into")
+        if site not in NerscCompute:
+            raise SuperfacilityCmdFailed(f"Cannot sync jobs of {site}")
+
+        watermark = None if full else self.job_history.watermark(site, user)
+        options = None
+        if watermark is not None:
+            # The watermark is the cluster's time, so sacct reads it the way it was written
+            options = {'starttime': shift_time(watermark, -DEFAULT_SYNC_OVERLAP)}
+
+        fetched = set()
+        latest = watermark
+        sub_url = self.__jobs_url(site, True, None, user, None, options)
+        for batch in self.__stream_jobs(site, sub_url, DEFAULT_JOBS_BATCH_SIZE):
+            self.job_history.put(site, batch)
+            fetched.update(str(job.get('jobidraw') or job.get('jobid')) for job in batch)
+            latest = latest_time(batch, latest)
+
+        if watermark is not None:
+            # Jobs unfinished at the last sync which sacct didn't return this time
+            stale = [jobid for jobid in self.job_history.unfinished(site, user) if jobid not in fetched]
+            for i in range(0, len(stale), SYNC_JOBS_PER_REQUEST):
+                sub_url = self.__jobs_url(site, True, None, user, None,
+                                          {'jobs': ','.join(stale[i:i + SYNC_JOBS_PER_REQUEST])})
+                for batch in self.__stream_jobs(site, sub_url, DEFAULT_JOBS_BATCH_SIZE):
+                    self.job_history.put(site, batch)
+                    fetched.update(str(job.get('jobidraw') or job.get('jobid')) for job in batch)
+                    latest = latest_time(batch, latest)
+
+        if latest is not None:
+            self.job_history.set_watermark(site, user, latest)
+        return {'site': str(site), 'user': user, 'full': watermark is None, 'fetched': len(fetched)}
+
+    def query_jobs(self, site: str = NERSC_DEFAULT_COMPUTE, user: str = None,
+                   partition: str = None, state=None, jobid: str = None,
+                   start=None, end=None, sync: bool = True) -> List[Dict]:
+        """Answers sacct queries from the job_history
+
+        Parameters
+        ----------
+        site : str, optional
+            NERSC site the jobs ran on, by default NERSC_DEFAULT_COMPUTE
+        user : str, optional
+            User the jobs ran as, by default None
+        partition : str, optional
+            Partition the jobs ran in, by default None
+        state : str or List[str], optional
+            Slurm state(s) of the jobs, by default None
+        jobid : str, optional
+            Slurm job id, by default None
+        start : datetime, float or str, optional
+            Only jobs submitted at or after this time, by default None
+        end : datetime, float or str, optional
+            Only jobs submitted before this time, by default None
+        sync : bool, optional
+            Sync the history with sacct first, by default True
+
+        Returns
+        -------
+        List[Dict]
+            sacct records, oldest submitted first
+        """
+        if sync:
+            self.sync_jobs(site=site, user=user)
+        return self.job_history.query(site=site, user=user, partition=partition, state=state,
+                                      jobid=jobid, start=start, end=end)
 
     def squeue(self,
                site: str = NERSC_DEFAULT_COMPUTE,
                jobid: int = None,
                user: str = None,
                partition: str = None,
-               dataframe: bool = False):
+               dataframe: bool = False,
+               columns: List[str] = None,
+               typed: bool = False,
+               stream: bool = False,
+               batch_size: int = None):
         """squeue
 
         Returns similar information as squeue command line
@@ -550,7 +999,21 @@ class SuperfacilityAPI:
             jobid (int, optional): _description_. Defaults to None.
             user (str, optional): _description_. Defaults to None.
             partition (str, optional): _description_. Defaults to None.
+            dataframe (bool, optional): Return a pandas DataFrame. Defaults to False.
+            columns (List[str], optional): Only keep these columns in the DataFrame. Defaults to None.
+            typed (bool, optional): Parse times, durations, sizes and ids in the DataFrame, instead of keeping Slurm's strings. Defaults to False.
+            stream (bool, optional): Return an iterator over the jobs as they are parsed from the response. Defaults to False.
+            batch_size (int, optional): With stream, yield lists of up to batch_size jobs, or DataFrames with dataframe. Defaults to None.
         """
+        if stream:
+            jobs = self.iter_jobs(site=site, jobid=jobid, user=user, partition=partition,
+                                  sacct=False,
+                                  batch_size=batch_size or (DEFAULT_JOBS_BATCH_SIZE if dataframe else None))
+            if dataframe and HAVE_PANDAS:
+                from .frames import jobs_frame, squeue_types
+                return (jobs_frame(batch, squeue_columns, squeue_types, projection=columns, typed=typed)
+                        for batch in jobs)
+            return jobs
 
         jobs = self.get_jobs(site=site,
                              jobid=jobid,
@@ -561,10 +1024,9 @@ class SuperfacilityAPI:
             jobs = jobs['output']
 
         if dataframe and HAVE_PANDAS:
-            if len(jobs) == 0:
-                return pd.DataFrame(columns=squeue_columns)
-            else:
-                return pd.DataFrame(jobs)
+            from .frames import jobs_frame, squeue_types
+            return jobs_frame(jobs, squeue_columns, squeue_types,
+                              projection=columns, typed=typed)
 
         return jobs
 
@@ -573,7 +1035,11 @@ class SuperfacilityAPI:
               jobid: int = None,
               user: str = None,
               partition: str = None,
-              dataframe: bool = False):
+              dataframe: bool = False,
+              columns: List[str] = None,
+              typed: bool = False,
+              stream: bool = False,
+              batch_size: int = None):
         """sacct
 
         Returns similar information as sacct command line
@@ -584,24 +1050,79 @@ class SuperfacilityAPI:
             jobid (int, optional): _description_. Defaults to None.
             user (str, optional): _description_. Defaults to None.
             partition (str, optional): _description_. Defaults to None.
+            dataframe (bool, optional): Return a pandas DataFrame. Defaults to False.
+            columns (List[str], optional): Only keep these columns in the DataFrame. Defaults to None.
+            typed (bool, optional): Parse times, durations, sizes and ids in the DataFrame, instead of keeping Slurm's strings. Defaults to False.
+            stream (bool, optional): Return an iterator over the jobs as they are parsed from the response. Defaults to False.
+            batch_size (int, optional): With stream, yield lists of up to batch_size jobs, or DataFrames with dataframe. Defaults to None.
+
+        With a job_history, the history is synced and the jobs come from it, see query_jobs.
+        Only the job is fetched and stored when a jobid is given.
         """
-
-        jobs = self.get_jobs(site=site,
-                             jobid=jobid,
-                             user=user,
-                             partition=partition,
-                             sacct=True)
-        if 'output' in jobs:
-            jobs = jobs['output']
+        if self.job_history is not None and not stream and jobid is not None:
+            # One job is cheaper to ask for than a sync of the whole site
+            jobs = self.get_jobs(site=site, jobid=jobid, user=user, partition=partition,
+                                 sacct=True).get('output') or []
+            self.job_history.put(site, jobs)
+        elif self.job_history is not None and not stream:
+            jobs = self.query_jobs(site=site, user=user, partition=partition)
+        elif stream:
+            jobs = self.iter_jobs(site=site, jobid=jobid, user=user, partition=partition,
+                                  sacct=True,
+                                  batch_size=batch_size or (DEFAULT_JOBS_BATCH_SIZE if dataframe else None))
+            if dataframe and HAVE_PANDAS:
+                from .frames import jobs_frame, sacct_types
+                return (jobs_frame(batch, sacct_columns, sacct_types, projection=columns, typed=typed)
+                        for batch in jobs)
+            return jobs
+        else:
+            jobs = self.get_jobs(site=site,
+                                 jobid=jobid,
+                                 user=user,
+                                 partition=partition,
+                                 sacct=True)
+            if 'output' in jobs:
+                jobs = jobs['output']
 
         if dataframe and HAVE_PANDAS:
-            if len(jobs) == 0:
-                return pd.DataFrame(columns=sacct_columns)
-            else:
-                return pd.DataFrame(jobs)
+            from .frames import jobs_frame, sacct_types
+            return jobs_frame(jobs, sacct_columns, sacct_types,
+                              projection=columns, typed=typed)
 
         return jobs
 
+    def watch_jobs(self, site: str = NERSC_DEFAULT_COMPUTE, user: str = None,
+                   jobids: List = None, interval: float = DEFAULT_WATCH_INTERVAL,
+                   callback: Callable[[Dict], None] = None) -> JobWatcher:
+        """Follows slurm jobs, reporting only when their state changes
+
+        Iterate over the returned watcher to get each transition, or pass a
+        callback to have it called from a background thread. Iteration ends
+        once every job in jobids is finished.
+
+        Parameters
+        ----------
+        site : str, optional
+            NERSC site where the jobs run, by default NERSC_DEFAULT_COMPUTE
+        user : str, optional
+            Follow every job of this user, by default None
+        jobids : List, optional
+            Follow only these jobs, by default None
+        interval : float, optional
+            Seconds between polls of the queue, by default DEFAULT_WATCH_INTERVAL
+        callback : Callable[[Dict], None], optional
+            Called with each transition from a background thread, by default None
+
+        Returns
+        -------
+        JobWatcher
+            Yields {'jobid', 'old_state', 'new_state', 'time', 'job'} for every change
+        """
+        watcher = JobWatcher(self, site=site, user=user, jobids=jobids, interval=interval)
+        if callback is not None:
+            watcher.start(callback)
+        return watcher
+
     def post_job(self, site: str = NERSC_DEFAULT_COMPUTE,
                  script: str = None, isPath: bool = True,
                  run_async: bool = False,
@@ -630,16 +1151,9 @@ class SuperfacilityAPI:
             job_info['error'] = 'not a compute site'
             return job_info
 
-        if not self.check_status(name=site):
-            logging.debug(site)
-            raise SuperfacilitySiteDown(
-                f'{site} is down, Reason: {self.system_status(name=site)}')
+        self.__raise_if_down(site)
 
-        sub_url = f'/compute/jobs/{site}'
-        script.replace("/", "%2F")
-        is_path = 'true' if isPath else 'false'
-        data = {'job': script, 'isPath': is_path}
-        resp = self.__generic_post(sub_url, data=data)
+        resp = self.__post_job_task(site, script, isPath)
 
         logging.debug("Submitted new job, wating for responce.")
         if resp == None:
@@ -652,23 +1166,18 @@ class SuperfacilityAPI:
             logging.debug(job_info)
             return job_info
 
-        # Waits (up to {timeout} seconds) for the job to be submited before returning
-        for i in range(timeout):
-            if i > 0:
-                sleep(sleeptime)
-
-            logging.debug(f"Checking {i} ...")
-            task = self.tasks(resp['task_id'])
-            logging.debug(f"task = {task}")
-            if task is not None and task['status'] == 'completed':
-                jobinfo = json.loads(task['result'])
-                return {
-                    'error': jobinfo['error'],
-                    'jobid': jobinfo['jobid'],
-                    'task_id': task_id
-                }
+        # Waits (up to {timeout*sleeptime} seconds) for the job to be submited before returning
+        try:
+            task = self.task_poller.wait(task_id, timeout=timeout*sleeptime)
+        except concurrent.futures.TimeoutError:
+            return job_info
 
-        return job_info
+        jobinfo = json.loads(task['result'])
+        return {
+            'error': jobinfo['error'],
+            'jobid': jobinfo['jobid'],
+            'task_id': task_id
+        }
 
     def sbatch(self, site: str = NERSC_DEFAULT_COMPUTE,
                script: str = None, isPath: bool = True) -> int:
@@ -690,22 +1199,180 @@ class SuperfacilityAPI:
         """
         # We can check if the path is on the nersc system
         if isPath:
-            out = self.ls(script)
-            if out['status'] == "ERROR":
+            if not self.exists(script, site=site):
                 raise FileNotFoundError(f"{script} Not found on {site}")
         # Then see if it's a path on the current system
         elif Path(script).exists():
-            logging.debug(
-                f"Looks like the script is a path, opending {script}")
+            logging.debug("Looks like the script is a path, opending %s", script)
             with open(Path(script)) as contents:
                 script = contents.read()
         else:
-            logging.debug(f"Looks like the script is a string {script}")
+            logging.debug("Looks like the script is a string %s", script)
 
         job_output = self.post_job(site=site, script=script, isPath=isPath)
 
         return job_output['jobid']
 
+    def __post_job_task(self, site: str, script: str, isPath: bool) -> Dict:
+        """PRIVATE: Posts a job and returns the responce holding the task_id
+        """
+        sub_url = f'/compute/jobs/{site}'
+        is_path = 'true' if isPath else 'false'
+        data = {'job': script, 'isPath': is_path}
+        resp = self.__generic_post(sub_url, data=data)
+        if self.ls_cache is not None and isPath:
+            # Slurm writes its output next to the script
+            self.ls_cache.invalidate(site, posixpath.dirname(script))
+        return resp
+
+    def __missing_scripts(self, scripts: List[str], site: str,
+                          max_in_flight: int) -> Dict:
+        """PRIVATE: Checks which script paths don't exist on the site with one ls per directory
+
+        Returns
+        -------
+        Dict
+            Script path to error message for every missing script
+        """
+        directories = {}
+        for script in scripts:
+            directories.setdefault(str(PurePosixPath(script).parent), []).append(script)
+
+        def names_in(directory):
+            out = self.ls(directory, site=site)
+            if out is None or out.get('status') == "ERROR":
+                return None
+            return {PurePosixPath(entry['name']).name for entry in out.get('entries', [])}
+
+        missing = {}
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            listings = pool.map(names_in, directories.keys())
+            for (directory, in_dir), names in zip(directories.items(), listings):
+                for script in in_dir:
+                    if names is None or PurePosixPath(script).name not in names:
+                        missing[script] = f"{script} Not found on {site}"
+
+        return missing
+
+    def submit_many(self, scripts: List[str], site: str = NERSC_DEFAULT_COMPUTE,
+                    isPath: bool = True, max_in_flight: int = 8,
+                    timeout: int = 120) -> Iterator[Dict]:
+        """Submits many jobs at once, like calling sbatch for every script
+
+        Script paths are checked with one ls per directory, the site status is
+        checked once, up to max_in_flight submissions are posted at a time and
+        all the tasks are resolved together by the shared task_poller.
+
+        Parameters
+        ----------
+        scripts : List[str]
+            Paths or scripts to call sbatch on
+        site : str, optional
+            Site to add jobs to, by default NERSC_DEFAULT_COMPUTE
+        isPath : bool, optional
+            Are the scripts paths on the site or local files/strings, by default True
+        max_in_flight : int, optional
+            Maximum number of submissions posted at once, by default 8
+        timeout : int, optional
+            Seconds to wait for all the tasks to complete, by default 120
+
+        Yields
+        ------
+        Dict
+            script, task_id, jobid and error for each script as it finishes.
+            Scripts left at the timeout have a task_id if they were submitted,
+            and none if they weren't posted and can be submitted again.
+        """
+        if site not in NerscCompute:
+            for script in scripts:
+                yield {'script': script, 'task_id': None, 'jobid': None,
+                       'error': 'not a compute site'}
+            return
+
+        self.__raise_if_down(site)
+
+        missing = {}
+        if isPath:
+            missing = self.__missing_scripts(scripts, site, max_in_flight)
+        for script, error in missing.items():
+            yield {'script': script, 'task_id': None, 'jobid': None, 'error': error}
+
+        def submit(script):
+            job = script
+            if not isPath and Path(script).exists():
+                with open(Path(script)) as contents:
+                    job = contents.read()
+            return self.__post_job_task(site, job, isPath)['task_id']
+
+        deadline = time.monotonic() + timeout
+        with ThreadPoolExecutor(max_workers=max_in_flight) as pool:
+            # Futures for the posts and for the tasks they return, mapped to their script
+            futures = {pool.submit(submit, script): (script, None)
+                       for script in scripts if script not in missing}
+
+            while futures:
+                remaining = deadline - time.monotonic()
+                done, _ = wait(futures, timeout=max(remaining, 0),
+                               return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for future in done:
+                    script, task_id = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except (SuperfacilityError, OSError, requests.exceptions.RequestException) as err:
+                        yield {'script': script, 'task_id': task_id, 'jobid': None,
+                               'error': f"{type(err).__name__}: {err}"}
+                        continue
+
+                    if task_id is None:
+                        # A post finished, now wait on its task with all the others
+                        futures[self.task_poller.submit(result)] = (script, result)
+                    else:
+                        jobinfo = json.loads(result['result'])
+                        yield {'script': script, 'task_id': task_id,
+                               'jobid': jobinfo.get('jobid'), 'error': jobinfo.get('error')}
+
+            for future, (script, task_id) in futures.items():
+                if task_id is not None:
+                    self.task_poller.cancel(task_id, future)
+                else:
+                    # Posts that haven't started aren't sent after the deadline
+                    future.cancel()
+
+        for future, (script, task_id) in futures.items():
+            if task_id is None:
+                # Posts still running at the deadline have finished now, those jobs were submitted
+                if future.cancelled() or future.exception() is not None:
+                    yield {'script': script, 'task_id': None, 'jobid': None,
+                           'error': f'not submitted after {timeout}s'}
+                    continue
+                task_id = future.result()
+            yield {'script': script, 'task_id': task_id, 'jobid': None,
+                   'error': f'task not completed after {timeout}s'}
+
+    def workflow(self, site: str = NERSC_DEFAULT_COMPUTE, checkpoint: str = None,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT) -> Workflow:
+        """Starts a graph of jobs submitted with slurm dependencies between them
+
+        Add jobs with Workflow.add, then iterate over Workflow.submit.
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to submit to, by default NERSC_DEFAULT_COMPUTE
+        checkpoint : str, optional
+            JSON file to resume an interrupted submission from, by default None
+        max_in_flight : int, optional
+            Most submissions posted at once, by default DEFAULT_MAX_IN_FLIGHT
+
+        Returns
+        -------
+        Workflow
+        """
+        return Workflow(self, site, checkpoint=checkpoint, max_in_flight=max_in_flight)
+
     def delete_job(self, site: str = NERSC_DEFAULT_COMPUTE, jobid: int = None) -> Dict:
         """Removes job from queue
 
@@ -723,17 +1390,18 @@ class SuperfacilityAPI:
         if site not in NerscCompute:
             return None
 
-        down = NerscSystemState.DOWN | NerscSystemState.MAINTNAINCE | NerscSystemState.UNKNOWN
-        current_status = self.system_status()
-        if current_status is down:
-            logging.debug(
-                f"System is {current_status}, job cannot check jobs")
-            return None
+        # Cancelling goes ahead of any background polling
+        with request_priority(INTERACTIVE):
+            down = NerscSystemState.DOWN | NerscSystemState.MAINTNAINCE | NerscSystemState.UNKNOWN
+            current_status = self.system_status(name=site)
+            if current_status in down:
+                logging.debug("System is %s, job cannot check jobs", current_status)
+                return None
 
-        sub_url = f'/compute/jobs/{site}/{jobid}'
-        logging.debug(f"Calling {sub_url}")
+            sub_url = f'/compute/jobs/{site}/{jobid}'
+            logging.debug("Calling %s", sub_url)
 
-        return self.__generic_delete(sub_url)
+            return self.__generic_delete(sub_url)
 
     def scancel(self, jobid: int, site: str = NERSC_DEFAULT_COMPUTE) -> bool:
         """Removes job from queue
@@ -756,7 +1424,8 @@ class SuperfacilityAPI:
     def custom_cmd(self,
                    run_async: bool = False,
                    site: str = NERSC_DEFAULT_COMPUTE, cmd: str = None,
-                   timeout: int = 30, sleeptime: int = 2) -> Dict:
+                   timeout: int = 30, sleeptime: int = 2,
+                   invalidate: bool = True) -> Dict:
         """Run custom command
 
         Parameters
@@ -765,6 +1434,8 @@ class SuperfacilityAPI:
             Site to remove job from, by default NERSC_DEFAULT_COMPUTE
         cmd: str,
             Command to run
+        invalidate : bool, optional
+            Drop the site's ls_cache, as the command may change any file, by default True
 
         Returns
         -------
@@ -777,8 +1448,11 @@ class SuperfacilityAPI:
         data = {'executable': cmd}
 
         resp = self.__generic_post(sub_url, data=data)
+        if self.ls_cache is not None and invalidate:
+            # Commands can change any file on the site
+            self.ls_cache.invalidate(site)
         logging.debug("Submitted new job, wating for responce.")
-        logging.debug(f"{resp}")
+        logging.debug("%s", resp)
         if resp == None:
             return {'error': -1, 'task_id': None}
 
@@ -788,14 +1462,12 @@ class SuperfacilityAPI:
         if run_async:
             return {'error': None, 'task_id': task_id}
 
-        # Waits (up to {timeout} seconds) for the job to be submited before returning
-        for i in range(timeout):
-            if i > 0:
-                sleep(sleeptime)
-            task = self.tasks(resp['task_id'])
-            if isinstance(task, dict) and task['status'] == 'completed':
-                return json.loads(task['result'])
-            sleep(sleeptime)
+        # Waits (up to {timeout*sleeptime} seconds) for the command to finish before returning
+        try:
+            task = self.task_poller.wait(task_id, timeout=timeout*sleeptime)
+            return json.loads(task['result'])
+        except concurrent.futures.TimeoutError:
+            pass
 
         try:
             # Gives back error if something went wrong
@@ -807,11 +1479,9 @@ class SuperfacilityAPI:
             logging.warning(f"{type(e).__name__} : {e}")
             return {'jobid': f"{type(e).__name__} : {e}"}
 
-    ################## In Progress #######################
-    def download(self,
-                 site: str = NERSC_DEFAULT_COMPUTE, remote_path: str = None,
-                 binary: bool = False, local_path: str = '.', save: bool = False) -> Dict:
-
+    def __download_url(self, site: str, remote_path: str, binary: bool) -> str:
+        """PRIVATE: Checks the download arguments and builds the sub url
+        """
         if site is None:
             raise SuperfacilityCmdFailed("Need site to download from")
         if remote_path is None:
@@ -820,15 +1490,150 @@ class SuperfacilityAPI:
         if site not in ['perlmutter', 'cori']:
             raise SuperfacilityCmdFailed(f"Cannot download from {site}")
 
-        sub_url = '/utilities/download'
-        file_name = f'{local_path}/{remote_path.split("/")[-1]}'
         path = remote_path.replace("/", "%2F")
-
-        sub_url = f'{sub_url}/{site}/{path}'
+        sub_url = f'/utilities/download/{site}/{path}'
 
         if binary:
             sub_url = f'{sub_url}?binary=true'
 
+        return sub_url
+
+    def iter_download(self,
+                      site: str = NERSC_DEFAULT_COMPUTE, remote_path: str = None,
+                      binary: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      text: bool = False) -> Iterator:
+        """Streams a file from a site without holding it all in memory
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to download from, by default NERSC_DEFAULT_COMPUTE
+        remote_path : str
+            Path of the file on the site
+        binary : bool, optional
+            Download the file base64 encoded and decode it, by default False
+        chunk_size : int, optional
+            Size of the chunks to read and yield, by default DEFAULT_CHUNK_SIZE
+        text : bool, optional
+            Yield the decoded text as it arrives instead of bytes, by default False
+
+        Yields
+        ------
+        bytes or str
+            chunk_size bytes of the file at a time, or pieces of text
+        """
+        sub_url = self.__download_url(site, remote_path, binary)
+
+        fields = {}
+        pieces = iter_json_string(self.__generic_stream(sub_url, chunk_size), 'file', fields)
+        if text and not binary:
+            yield from pieces
+        elif binary:
+            yield from rechunk(iter_base64(pieces), chunk_size)
+        else:
+            yield from rechunk((piece.encode('utf8') for piece in pieces), chunk_size)
+
+        if fields.get('error') is not None:
+            raise SuperfacilityCmdFailed(
+                f"Downloading {remote_path} failed: {fields['error']}")
+
+    def sha256sum(self, remote_path: str, site: str = NERSC_DEFAULT_COMPUTE) -> str:
+        """Gets the sha256 checksum of a file on a site
+
+        Parameters
+        ----------
+        remote_path : str
+            Path of the file on the site
+        site : str, optional
+            Site the file is on, by default NERSC_DEFAULT_COMPUTE
+
+        Returns
+        -------
+        str
+            Hex digest of the file, None if it could not be computed
+        """
+        ret = self.custom_cmd(site=site, cmd=f"sha256sum {shlex.quote(remote_path)}", invalidate=False)
+        output = ret.get('output') if isinstance(ret, dict) else None
+        if not output:
+            return None
+        return output.split()[0]
+
+    def __download_to_file(self, site: str, remote_path: str, binary: bool,
+                           file_name: str, chunk_size: int,
+                           progress: Callable[[int], None],
+                           checksum: str) -> Dict:
+        """PRIVATE: Streams a download into file_name, checking the sha256 checksum
+        """
+        digest = hashlib.sha256()
+        size = 0
+        part = f'{file_name}.part'
+        try:
+            with open(part, "wb") as f:
+                for chunk in self.iter_download(site=site, remote_path=remote_path,
+                                                binary=binary, chunk_size=chunk_size):
+                    f.write(chunk)
+                    digest.update(chunk)
+                    size += len(chunk)
+                    if progress is not None:
+                        progress(size)
+
+            if checksum is not None and digest.hexdigest() != checksum.lower():
+                raise SuperfacilityCmdFailed(
+                    f"Checksum of {remote_path} does not match, {digest.hexdigest()} != {checksum}")
+        except BaseException:
+            Path(part).unlink(missing_ok=True)
+            raise
+
+        os.replace(part, file_name)
+        return {'error': None, 'file': file_name, 'is_binary': binary,
+                'size': size, 'sha256': digest.hexdigest()}
+
+    def download(self,
+                 site: str = NERSC_DEFAULT_COMPUTE, remote_path: str = None,
+                 binary: bool = False, local_path: str = '.', save: bool = False,
+                 stream: bool = False, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 progress: Callable[[int], None] = None,
+                 checksum: str = None, verify: bool = False) -> Dict:
+        """Download a file from a site
+
+        Parameters
+        ----------
+        site : str, optional
+            Site to download from, by default NERSC_DEFAULT_COMPUTE
+        remote_path : str
+            Path of the file on the site
+        binary : bool, optional
+            Download the file base64 encoded, by default False
+        local_path : str, optional
+            Directory to save the file to, by default '.'
+        save : bool, optional
+            Write the file to local_path, by default False
+        stream : bool, optional
+            Stream the file to local_path in chunks with bounded memory, by default False
+            The file contents are not returned when streaming.
+        chunk_size : int, optional
+            Size of the chunks to read and write when streaming, by default DEFAULT_CHUNK_SIZE
+        progress : Callable[[int], None], optional
+            Called with the bytes written so far after each chunk when streaming, by default None
+        checksum : str, optional
+            Expected sha256 of the file, checked when streaming, by default None
+        verify : bool, optional
+            Get the expected sha256 from the site when streaming, by default False
+
+        Returns
+        -------
+        Dict
+        """
+        file_name = f'{local_path}/{remote_path.split("/")[-1]}' if remote_path else None
+
+        if stream:
+            if verify and checksum is None:
+                checksum = self.sha256sum(remote_path, site=site)
+            return self.__download_to_file(site, remote_path, binary, file_name,
+                                           chunk_size, progress, checksum)
+
+        sub_url = self.__download_url(site, remote_path, binary)
+
         res = self.__generic_get(sub_url)
         if res is not None:
             if res['error'] is None:
@@ -841,3 +1646,145 @@ class SuperfacilityAPI:
                     return res
         else:
             return res
+
+    def upload(self, local_path: str, remote_path: str,
+               site: str = NERSC_DEFAULT_COMPUTE,
+               chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, resume: bool = True,
+               progress: Callable[[int], None] = None,
+               manifest_dir: str = None) -> Dict:
+        """Uploads a file to a site in chunks, resuming an interrupted upload
+
+        Each chunk is sent as its own file next to remote_path. All of them
+        are checked against their sha256 on the site with one command, chunks
+        that are missing or don't match are sent again, then the chunks are
+        put together and the whole file is checked. A manifest of the chunks
+        already sent lets a later call for the same file pick up where an
+        interrupted one stopped.
+
+        Parameters
+        ----------
+        local_path : str
+            File to upload
+        remote_path : str
+            Path of the file on the site
+        site : str, optional
+            Site to upload to, by default NERSC_DEFAULT_COMPUTE
+        chunk_size : int, optional
+            Bytes sent per request, by default DEFAULT_UPLOAD_CHUNK_SIZE
+        resume : bool, optional
+            Skip the chunks an earlier attempt already sent, by default True
+        progress : Callable[[int], None], optional
+            Called with the bytes on the site so far after each chunk, by default None
+        manifest_dir : str, optional
+            Where the manifests are kept, by default ~/.superfacility/uploads
+
+        Returns
+        -------
+        Dict
+            error, file, size, sha256, chunks and the number of chunks that didn't need sending
+        """
+        if site not in NerscCompute:
+            raise SuperfacilityCmdFailed(f"Cannot upload to {site}")
+
+        size = os.path.getsize(local_path)
+        manifest = UploadManifest(local_path, remote_path, site, chunk_size, manifest_dir)
+        if not (resume and manifest.load()):
+            manifest.chunks, manifest.sha256 = chunk_checksums(local_path, chunk_size)
+            manifest.sent = set()
+        resumed = len(manifest.sent)
+
+        # A file that fits in one chunk goes straight to remote_path
+        parts = [remote_path] if len(manifest.chunks) == 1 else \
+            [part_path(remote_path, index) for index in range(len(manifest.chunks))]
+
+        def on_site() -> int:
+            return sum(min(chunk_size, size - index * chunk_size) for index in manifest.sent)
+
+        bad = set()
+        for _ in range(UPLOAD_ROUNDS):
+            for index, chunk in iter_chunks(local_path, chunk_size, skip=manifest.sent):
+                path = parts[index].replace("/", "%2F")
+                self.__generic_put(f'/utilities/upload/{site}/{path}',
+                                   files={'file': (posixpath.basename(parts[index]), chunk)})
+                manifest.sent.add(index)
+                manifest.save()
+                if progress is not None:
+                    progress(on_site())
+
+            bad = self.__bad_chunks(site, parts, manifest.chunks)
+            if not bad:
+                break
+            logging.warning("Chunks %s of %s don't match on %s, sending them again",
+                            sorted(bad), local_path, site)
+            manifest.sent -= bad
+            manifest.save()
+
+        if bad:
+            raise SuperfacilityCmdFailed(
+                f"Chunks {sorted(bad)} of {local_path} don't match on {site} after {UPLOAD_ROUNDS} tries")
+
+        if len(parts) > 1:
+            self.__join_parts(site, remote_path, parts, manifest.sha256)
+        manifest.remove()
+        if self.ls_cache is not None:
+            self.ls_cache.invalidate(site, posixpath.dirname(remote_path))
+
+        return {'error': None, 'file': remote_path, 'size': size, 'sha256': manifest.sha256,
+                'chunks': len(parts), 'resumed': resumed}
+
+    def __bad_chunks(self, site: str, parts: List[str], checksums: List[str]) -> set:
+        """PRIVATE: Numbers of the uploaded chunks which are missing or don't match their checksum
+        """
+        ret = self.custom_cmd(site=site, cmd='sha256sum ' + ' '.join(shlex.quote(p) for p in parts),
+                              invalidate=False)
+        sums = parse_sha256sum(ret.get('output') if isinstance(ret, dict) else None)
+        return {index for index, path in enumerate(parts) if sums.get(path) != checksums[index]}
+
+    def __join_parts(self, site: str, remote_path: str, parts: List[str], checksum: str) -> None:
+        """PRIVATE: Puts the uploaded chunks together into remote_path and checks the result
+        """
+        quoted = ' '.join(shlex.quote(p) for p in parts)
+        target = shlex.quote(remote_path)
+        ret = self.custom_cmd(site=site, invalidate=False,
+                              cmd=f"cat {quoted} > {target} && rm -f {quoted} && sha256sum {target}")
+        if self.ls_cache is not None:
+            # Only the directory of the file and its chunks changed
+            self.ls_cache.invalidate(site, posixpath.dirname(remote_path))
+        sums = parse_sha256sum(ret.get('output') if isinstance(ret, dict) else None)
+        if sums.get(remote_path) != checksum:
+            raise SuperfacilityCmdFailed(
+                f"Checksum of {remote_path} on {site} does not match after joining its chunks")
+
+    def upload_many(self, files: Dict[str, str], site: str = NERSC_DEFAULT_COMPUTE,
+                    max_workers: int = 4, **kwargs) -> Iterator[Dict]:
+        """Uploads several files at once
+
+        Parameters
+        ----------
+        files : Dict[str, str]
+            Local path -> path on the site
+        site : str, optional
+            Site to upload to, by default NERSC_DEFAULT_COMPUTE
+        max_workers : int, optional
+            Most files uploaded at the same time, by default 4
+        **kwargs
+            Passed on to upload
+
+        Yields
+        ------
+        Dict
+            What upload returns plus local, for each file as it finishes
+            A failed upload has its error set instead of raising
+        """
+        def send(local: str) -> Dict:
+            try:
+                ret = self.upload(local, files[local], site=site, **kwargs)
+            except (SuperfacilityError, OSError) as err:
+                ret = {'error': f"{type(err).__name__}: {err}", 'file': files[local]}
+            ret['local'] = local
+            return ret
+
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            futures = [pool.submit(send, local) for local in files]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
@@ -1,14 +1,20 @@
-from authlib.integrations.requests_client import (
-    OAuth2Session,
-    OAuthError
-)
-from authlib.oauth2.rfc7523 import PrivateKeyJWT
 import sys
-from datetime import datetime
 from pathlib import Path
-import requests
 import logging
 import os
+import threading
+import time
+
+from .lazy import lazy_import
+
+requests = lazy_import('requests')
+
+# Lifetime assumed when the token response has no expires_in
+DEFAULT_TOKEN_LIFETIME = 600
+# Seconds before expiry to refresh the token
+DEFAULT_REFRESH_MARGIN = 60
+# NERSC oidc endpoint the token is requested from
+DEFAULT_TOKEN_URL = "https://oidc.nersc.gov/c2id/token"
 
 
 iris_instructions = """
@@ -35,8 +41,11 @@ class SuperfacilityAccessToken:
     def __init__(self, name: str = None,
                  client_id: str = None,
                  private_key: str = None,
-                 key_path: str = None):
-        """SuperfacilityAPI
+                 key_path: str = None,
+                 refresh_margin: int = DEFAULT_REFRESH_MARGIN,
+                 background_refresh: bool = True,
+                 token_url: str = DEFAULT_TOKEN_URL):
+        """SuperfacilityAccessToken
 
         Parameters
         ----------
@@ -44,6 +53,12 @@ class SuperfacilityAccessToken:
             Client ID obtained from iris, by default None
         private_key : str, optional
             Private key obtained from iris, by default None
+        refresh_margin : int, optional
+            Seconds before expiry to refresh the token, by default DEFAULT_REFRESH_MARGIN
+        background_refresh : bool, optional
+            Refresh the token in a background thread before it expires, by default True
+        token_url : str, optional
+            Endpoint to get the token from, by default DEFAULT_TOKEN_URL
         """
         # TODO: Check a better way to store these, esspecially private key
         if client_id is not None and private_key is not None:
@@ -65,7 +80,12 @@ class SuperfacilityAccessToken:
 
         # Create an access token in the __renew_toekn function
         self.access_token = None
-        self.__token_lifetime = datetime.now()
+        self.token_url = token_url
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self.__expires_at = 0.0
+        self.__lock = threading.Lock()
+        self.__timer = None
         self.__renew_token()
 
     @staticmethod
@@ -90,18 +110,67 @@ class SuperfacilityAccessToken:
 
     @property
     def token(self):
-        logging.debug(
-            f"Token lifetime {(datetime.now()-self.__token_lifetime).seconds}")
-        if ((datetime.now()-self.__token_lifetime).seconds) > 500:
-            logging.debug(
-                f"Token lifetime {(self.__token_lifetime - datetime.now()).seconds} renewing token")
-            self.__renew_token()
+        """Cached access token, refreshed shortly before it expires.
 
-        if self.session is not None:
-            self.access_token = self.session.fetch_token()['access_token']
+        Safe to share across threads, concurrent callers wait on a single refresh.
+        """
+        if self.session is not None and self.__expired():
+            with self.__lock:
+                # Another thread may have refreshed while we waited
+                if self.__expired():
+                    logging.debug("Token expired, renewing token")
+                    self.__fetch_token()
 
         return self.access_token
 
+    @property
+    def expires_in(self) -> float:
+        """Seconds until the cached token expires
+        """
+        return self.__expires_at - time.monotonic()
+
+    def close(self) -> None:
+        """Stops the background refresh
+        """
+        if self.__timer is not None:
+            self.__timer.cancel()
+            self.__timer = None
+
+    def __expired(self) -> bool:
+        return time.monotonic() >= self.__expires_at - self.refresh_margin
+
+    def __fetch_token(self) -> None:
+        # Get's the access token and remembers when it expires
+        token = self.session.fetch_token()
+        self.access_token = token['access_token']
+        expires_in = token.get('expires_in') or DEFAULT_TOKEN_LIFETIME
+        self.__expires_at = time.monotonic() + float(expires_in)
+        logging.debug("Token expires in %ss", expires_in)
+
+        if self.background_refresh:
+            self.__schedule_refresh()
+
+    def __schedule_refresh(self) -> None:
+        if self.__timer is not None:
+            self.__timer.cancel()
+        # A token that lives shorter than the margin is renewed at half its life, not every second
+        margin = min(self.refresh_margin, self.expires_in / 2)
+        delay = max(self.expires_in - margin, 1)
+        self.__timer = threading.Timer(delay, self.__background_refresh)
+        self.__timer.daemon = True
+        self.__timer.start()
+
+    def __background_refresh(self) -> None:
+        from authlib.integrations.requests_client import OAuthError
+
+        with self.__lock:
+            try:
+                self.__fetch_token()
+            except OAuthError as e:
+                logging.warning(f"Background token refresh failed {e}")
+            except requests.exceptions.RequestException as e:
+                logging.warning(f"Background token refresh failed {e}")
+
     def __check_file_and_open(self) -> str:
         contents = None
         if self.key_path.is_file():
@@ -111,9 +180,7 @@ class SuperfacilityAccessToken:
 
     def __renew_token(self):
         # Create access token from client_id/private_key
-        token_url = "https://oidc.nersc.gov/c2id/token"
-        logging.debug(f"{self.__token_lifetime - datetime.now()}")
-        self.__token_lifetime = datetime.now()
+        token_url = self.token_url
 
         if self.client_id is None:
             logging.debug("Getting client_id from file path")
@@ -121,20 +188,22 @@ class SuperfacilityAccessToken:
         else:
             cid = self.client_id
 
-        logging.debug(f"Getting token for {cid}")
+        logging.debug("Getting token for %s", cid)
 
         if self.key_path is not None:
-            logging.debug(
-                f"Getting private key from file path {self.key_path}")
+            logging.debug("Getting private key from file path %s", self.key_path)
             pkey = self.__check_file_and_open()
         elif self.private_key is not None:
             pkey = self.private_key
-            logging.debug(
-                f"Private key provided as string")
+            logging.debug("Private key provided as string")
         else:
             # If no private key don't look for getting a token
             return None
 
+        # authlib is only needed once there is a key to get a token with
+        from authlib.integrations.requests_client import OAuth2Session, OAuthError
+        from authlib.oauth2.rfc7523 import PrivateKeyJWT
+
         self.session = OAuth2Session(
             cid,  # client_id
             pkey,  # client_secret
@@ -143,10 +212,9 @@ class SuperfacilityAccessToken:
             token_endpoint=token_url  # token_endpoint
         )
 
-        # Get's the access token
         try:
-            self.access_token = self.session.fetch_token()['access_token']
+            with self.__lock:
+                self.__fetch_token()
         except OAuthError as e:
-            logging.debug(
-                f"Oauth error {e}\nMake sure your api key is still active in iris.nersc.gov")
+            logging.debug("Oauth error %s\nMake sure your api key is still active in iris.nersc.gov", e)
             return None
@@ -52,3 +52,11 @@ class SuperfacilityCmdFailed(SuperfacilityError):
 
 class SuperfacilitySiteDown(SuperfacilityError):
     pass
+
+
+class SuperfacilityCircuitOpen(SuperfacilityError):
+    pass
+
+
+class SuperfacilityRateLimited(SuperfacilityError):
+    pass
@@ -1,3 +1,4 @@
 
 from .SuperfacilityAccessToken import SuperfacilityAccessToken
 from .SuperfacilityAPI import SuperfacilityAPI
+from .AsyncSuperfacilityAPI import AsyncSuperfacilityAPI
@@ -0,0 +1,199 @@
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+
+from .frames import (
+    parse_datetimes,
+    parse_durations,
+    parse_integers,
+    parse_memory,
+    parse_unique
+)
+
+# sacct columns the metrics are computed from, e.g. sacct(dataframe=True, columns=ANALYTICS_COLUMNS)
+ANALYTICS_COLUMNS = ['jobid', 'jobidraw', 'account', 'partition', 'qos', 'user', 'state',
+                     'submit', 'start', 'end', 'elapsedraw', 'cputimeraw', 'totalcpu',
+                     'nnodes', 'alloccpus', 'reqmem', 'maxrss', 'alloctres']
+# TRES whose values are sizes like 490G rather than counts
+_TRES_MEMORY = ('mem', 'vmem')
+_TRES = r'(?:^|,)(?P<key>[^=,]+)=(?P<value>[^,]*)'
+
+_MISSING = {'datetime': 'datetime64[ns]', 'duration': 'timedelta64[ns]',
+            'integer': 'Int64', 'memory': 'Int64'}
+_PARSERS = {'datetime': parse_datetimes, 'duration': parse_durations,
+            'integer': parse_integers, 'memory': parse_memory}
+_PARSED = {'datetime': pd.api.types.is_datetime64_any_dtype,
+           'duration': pd.api.types.is_timedelta64_dtype,
+           'integer': pd.api.types.is_integer_dtype,
+           'memory': pd.api.types.is_integer_dtype}
+
+
+def _column(frame: "pd.DataFrame", name: str, kind: str) -> "pd.Series":
+    # Typed or raw sacct column, parsed if it is still text
+    if name not in frame.columns:
+        return pd.Series(None, index=frame.index, dtype=_MISSING[kind], name=name)
+    series = frame[name]
+    if _PARSED[kind](series.dtype):
+        return series
+    return parse_unique(series, _PARSERS[kind])
+
+
+def parse_tres(series: "pd.Series") -> "pd.DataFrame":
+    """Splits Slurm TRES strings into one column per resource
+
+    Parameters
+    ----------
+    series : pd.Series
+        Strings like billing=128,cpu=128,mem=490G,node=1,gres/gpu=4
+
+    Returns
+    -------
+    pd.DataFrame
+        float64 column per resource on the same index, mem in bytes, NaN where a row doesn't have it
+    """
+    # Every distinct TRES string is parsed once, then spread over the rows
+    codes, uniques = pd.factorize(series)
+    pairs = pd.Series(uniques, dtype='string').str.extractall(_TRES)
+    if len(pairs) == 0:
+        return pd.DataFrame(index=series.index)
+
+    pairs = pairs.droplevel('match')
+    wide = pairs.groupby([pairs.index, 'key'])['value'].last().unstack('key')
+    for key in wide.columns:
+        if key in _TRES_MEMORY:
+            wide[key] = parse_memory(wide[key]).astype('float64')
+        else:
+            wide[key] = pd.to_numeric(wide[key], errors='coerce').astype('float64')
+
+    # Rows without a TRES string have code -1, which reindexes to NaN
+    wide = wide.reindex(codes)
+    wide.index = series.index
+    wide.columns.name = None
+    return wide
+
+
+def _requested_memory(frame: "pd.DataFrame", nodes: "pd.Series", cpus: "pd.Series",
+                      tres: "pd.DataFrame") -> "pd.Series":
+    # Requested memory per node, from alloctres when there is one
+    per_node = pd.Series(np.nan, index=frame.index)
+    if 'mem' in tres.columns:
+        per_node = tres['mem'] / nodes
+
+    if 'reqmem' in frame.columns:
+        reqmem = frame['reqmem']
+        amount = _column(frame, 'reqmem', 'memory').astype('float64')
+        if pd.api.types.is_integer_dtype(reqmem.dtype):
+            # Already parsed, Slurm since 21.08 reports the total
+            scale = 1 / nodes
+        else:
+            # 4000Mn is per node, 4000Mc per cpu, anything else the total
+            suffix = reqmem.astype('string').str.strip().str[-1].str.lower().fillna('')
+            scale = (1 / nodes).mask(suffix == 'n', 1.0).mask(suffix == 'c', cpus / nodes)
+        per_node = per_node.fillna(amount * scale)
+    return per_node
+
+
+def job_metrics(jobs: Union["pd.DataFrame", List[Dict]]) -> "pd.DataFrame":
+    """Computes per job accounting metrics from sacct records
+
+    Steps (jobidraw like 1234.batch or 1234.0) are folded into their job,
+    which takes the largest maxrss of its steps. Raw and typed sacct frames
+    both work, columns still holding Slurm text are parsed vectorized.
+    Requested memory comes from alloctres, or from reqmem when there is no
+    mem in it. A typed reqmem has lost its per node (n) or per cpu (c)
+    suffix and is taken as the total.
+
+    Parameters
+    ----------
+    jobs : pd.DataFrame or List[Dict]
+        sacct records, e.g. sacct(dataframe=True, columns=ANALYTICS_COLUMNS)
+
+    Returns
+    -------
+    pd.DataFrame
+        One row per job with jobid, account, partition, qos, user, state,
+        submit, start, end, wait (start - submit), elapsed_s, nodes, cpus,
+        node_hours, cpu_hours, gpu_hours, cputime_s, totalcpu_s,
+        cpu_efficiency (totalcpu / cputime), mem_requested (bytes per node),
+        mem_peak (largest maxrss) and mem_headroom (1 - mem_peak / mem_requested)
+    """
+    frame = jobs if isinstance(jobs, pd.DataFrame) else pd.DataFrame.from_records(jobs)
+    if 'jobidraw' in frame.columns:
+        raw = frame['jobidraw'].astype('string')
+    else:
+        raw = frame['jobid'].astype('string')
+    base = raw.str.split('.', n=1).str[0]
+    is_step = raw.str.contains('.', regex=False).fillna(False).to_numpy(dtype=bool)
+
+    # Largest maxrss of any step of each job
+    peak = _column(frame, 'maxrss', 'memory').astype('float64').groupby(base.to_numpy()).max()
+
+    alloc = frame.loc[~is_step]
+    alloc_base = base[~is_step].to_numpy()
+    elapsed = _column(alloc, 'elapsedraw', 'integer').astype('float64')
+    cputime = _column(alloc, 'cputimeraw', 'integer').astype('float64')
+    totalcpu = _column(alloc, 'totalcpu', 'duration').dt.total_seconds()
+    nodes = _column(alloc, 'nnodes', 'integer').astype('float64')
+    cpus = _column(alloc, 'alloccpus', 'integer').astype('float64')
+    tres = parse_tres(alloc['alloctres']) if 'alloctres' in alloc.columns else pd.DataFrame(index=alloc.index)
+    submit = _column(alloc, 'submit', 'datetime')
+    start = _column(alloc, 'start', 'datetime')
+
+    metrics = pd.DataFrame({'jobid': alloc['jobid'] if 'jobid' in alloc.columns else alloc_base},
+                           index=alloc.index)
+    for name in ('account', 'partition', 'qos', 'user', 'state'):
+        if name in alloc.columns:
+            metrics[name] = alloc[name]
+    metrics['submit'] = submit
+    metrics['start'] = start
+    metrics['end'] = _column(alloc, 'end', 'datetime')
+    metrics['wait'] = start - submit
+    metrics['elapsed_s'] = elapsed
+    metrics['nodes'] = nodes
+    metrics['cpus'] = cpus
+    metrics['node_hours'] = nodes * elapsed / 3600
+    metrics['cpu_hours'] = cputime / 3600
+    gpus = tres['gres/gpu'] if 'gres/gpu' in tres.columns else pd.Series(0.0, index=alloc.index)
+    metrics['gpu_hours'] = gpus.fillna(0) * elapsed / 3600
+    metrics['cputime_s'] = cputime
+    metrics['totalcpu_s'] = totalcpu
+    metrics['cpu_efficiency'] = (totalcpu / cputime).where(cputime > 0)
+    metrics['mem_requested'] = _requested_memory(alloc, nodes, cpus, tres)
+    metrics['mem_peak'] = peak.reindex(alloc_base).to_numpy()
+    metrics['mem_headroom'] = (1 - metrics['mem_peak'] / metrics['mem_requested']).where(
+        metrics['mem_requested'] > 0)
+    return metrics.reset_index(drop=True)
+
+
+def report(metrics: "pd.DataFrame", by: Union[str, List[str]] = 'account') -> "pd.DataFrame":
+    """Aggregates job_metrics into a usage report
+
+    Parameters
+    ----------
+    metrics : pd.DataFrame
+        Output of job_metrics
+    by : str or List[str], optional
+        Columns to group by, e.g. account, partition, user or qos, by default account
+
+    Returns
+    -------
+    pd.DataFrame
+        jobs, node_hours, cpu_hours, gpu_hours, cpu_efficiency (weighted by
+        cputime), wait_mean, wait_median and mem_headroom_median per group,
+        most node hours first
+    """
+    by = [by] if isinstance(by, str) else list(by)
+    grouped = metrics.groupby(by, observed=True, dropna=False, sort=False)
+    out = grouped.agg(jobs=('jobid', 'size'),
+                      node_hours=('node_hours', 'sum'),
+                      cpu_hours=('cpu_hours', 'sum'),
+                      gpu_hours=('gpu_hours', 'sum'),
+                      cputime_s=('cputime_s', 'sum'),
+                      totalcpu_s=('totalcpu_s', 'sum'),
+                      wait_mean=('wait', 'mean'),
+                      wait_median=('wait', 'median'),
+                      mem_headroom_median=('mem_headroom', 'median'))
+    cputime = out.pop('cputime_s')
+    out.insert(4, 'cpu_efficiency', (out.pop('totalcpu_s') / cputime).where(cputime > 0))
+    return out.sort_values('node_hours', ascending=False)
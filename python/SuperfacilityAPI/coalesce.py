@@ -0,0 +1,146 @@
+from typing import Awaitable, Callable, Hashable
+import asyncio
+import threading
+import time
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    def __init__(self, window: float = 0.0):
+        """Shares one call between identical concurrent requests
+
+        While a call for a key is in flight, other callers with the same key
+        wait for it and get the same result (or exception) instead of making
+        their own call. Results are shared, not copied, so don't modify them.
+
+        Parameters
+        ----------
+        window : float, optional
+            Seconds to keep handing out a finished result, by default 0 (only in flight calls are shared)
+        """
+        self.window = window
+        self._calls = {}
+        self._recent = {}
+        self._lock = threading.Lock()
+        self.coalesced = 0
+        self.cached = 0
+
+    def _recent_result(self, key: Hashable, now: float):
+        # Gets a result finished inside the window, call with the lock held
+        hit = self._recent.get(key)
+        if hit is None:
+            return False, None
+        if now - hit[0] >= self.window:
+            del self._recent[key]
+            return False, None
+        self.cached += 1
+        return True, hit[1]
+
+    def _remember(self, key: Hashable, result) -> None:
+        # Call with the lock held
+        now = time.monotonic()
+        for old in [k for k, (stored, _) in self._recent.items() if now - stored >= self.window]:
+            del self._recent[old]
+        self._recent[key] = (now, result)
+
+    def do(self, key: Hashable, fn: Callable):
+        """Calls fn, unless a call for key is already in flight
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies identical calls, e.g. the url
+        fn : Callable
+            Makes the call
+
+        Returns
+        -------
+        Whatever fn returns
+        """
+        with self._lock:
+            if self.window > 0:
+                found, result = self._recent_result(key, time.monotonic())
+                if found:
+                    return result
+
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+                if call.error is None and self.window > 0:
+                    self._remember(key, call.result)
+            call.done.set()
+
+        return call.result
+
+
+class AsyncSingleFlight(SingleFlight):
+    def __init__(self, window: float = 0.0):
+        """asyncio version of SingleFlight, identical calls share one task
+
+        Parameters
+        ----------
+        window : float, optional
+            Seconds to keep handing out a finished result, by default 0 (only in flight calls are shared)
+        """
+        super().__init__(window)
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Awaits fn(), unless a call for key is already in flight
+
+        Parameters
+        ----------
+        key : Hashable
+            Identifies identical calls, e.g. the url
+        fn : Callable[[], Awaitable]
+            Makes the call
+
+        Returns
+        -------
+        Whatever fn returns
+        """
+        if self.window > 0:
+            found, result = self._recent_result(key, time.monotonic())
+            if found:
+                return result
+
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # Shield so one caller being cancelled doesn't cancel the shared call
+            return await asyncio.shield(future)
+
+        future = self._calls[key] = asyncio.ensure_future(fn())
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+        if self.window > 0:
+            self._remember(key, result)
+        return result
@@ -0,0 +1,386 @@
+from typing import Dict, Iterator
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from datetime import datetime
+from enum import Enum
+from pathlib import Path
+import argparse
+import builtins
+import json
+import logging
+import os
+import socket
+import socketserver
+import subprocess
+import sys
+import threading
+import time
+
+from . import SuperfacilityErrors
+
+# Seconds to wait for a freshly started daemon to accept connections
+DAEMON_START_TIMEOUT = 30
+# SuperfacilityAPI methods the CLI calls through the daemon, nothing else can be reached
+DAEMON_METHODS = frozenset([
+    'delete_job', 'get_groups', 'iter_download', 'iter_jobs', 'ls', 'post_job',
+    'projects', 'roles', 'status', 'status_many', 'system_names', 'system_status',
+    'task_poller.wait', 'upload_many', 'walk',
+])
+
+
+def default_socket_path(client: str = None) -> Path:
+    """Unix socket the daemon for a client listens on
+
+    Parameters
+    ----------
+    client : str, optional
+        Name or client id of the key the daemon uses, by default None
+
+    Returns
+    -------
+    Path
+        ~/.superfacility/sfapi-{client}.sock
+    """
+    return Path.joinpath(Path.home(), ".superfacility", f"sfapi-{client or 'default'}.sock")
+
+
+def _encode(obj):
+    # Things the api returns that json can't write on its own
+    if isinstance(obj, Enum):
+        return {'__enum__': type(obj).__name__, 'value': obj.value}
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    from .SuperfacilityAccessToken import SuperfacilityAccessToken
+    if isinstance(obj, SuperfacilityAccessToken):
+        return obj.token
+    raise TypeError(f"{type(obj).__name__} can't be sent by the sfapi daemon")
+
+
+def _decode(obj: Dict):
+    if '__enum__' in obj:
+        from .SuperfacilityAPI import NerscSystemState
+        from . import nersc_systems
+        enums = {'NerscSystemState': NerscSystemState,
+                 'NerscCompute': nersc_systems.NerscCompute,
+                 'NerscFilesystems': nersc_systems.NerscFilesystems}
+        if obj['__enum__'] in enums:
+            return enums[obj['__enum__']](obj['value'])
+        return obj['value']
+    return obj
+
+
+def _dumps(message: Dict) -> bytes:
+    return json.dumps(message, default=_encode).encode() + b'\n'
+
+
+def _error(name: str, message: str) -> Exception:
+    # Rebuilds an exception raised inside the daemon
+    if name == 'TimeoutError':
+        return FutureTimeoutError(message)
+    error = getattr(SuperfacilityErrors, name, None)
+    if isinstance(error, type) and issubclass(error, Exception):
+        return error(message)
+    error = getattr(builtins, name, None)
+    if isinstance(error, type) and issubclass(error, Exception):
+        return error(message)
+    return SuperfacilityErrors.SuperfacilityError(f"{name}: {message}")
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        try:
+            request = json.loads(self.rfile.readline())
+        except ValueError:
+            return
+
+        op = request.get('op', 'call')
+        server = self.server
+        if op == 'ping':
+            self.send({'result': {'pid': os.getpid(), 'uptime': time.time() - server.started,
+                                  'requests': server.requests}})
+            return
+        if op == 'shutdown':
+            self.send({'result': True})
+            server.shutdown_soon()
+            return
+
+        server.requests += 1
+        name = request.get('name', '')
+        try:
+            if op != 'call' or name not in DAEMON_METHODS:
+                raise AttributeError(f"{name} can't be called through the sfapi daemon")
+            target = server.sfapi
+            for part in name.split('.'):
+                target = getattr(target, part)
+            result = target(*request.get('args', []), **request.get('kwargs', {}))
+
+            if isinstance(result, Iterator):
+                for item in result:
+                    self.send({'item': item})
+                self.send({'done': True})
+            else:
+                self.send({'result': result})
+        except BrokenPipeError:
+            pass
+        except Exception as err:
+            logging.debug("daemon %s failed %s: %s", name, type(err).__name__, err)
+            try:
+                self.send({'error': type(err).__name__, 'message': str(err)})
+            except BrokenPipeError:
+                pass
+
+    def send(self, message: Dict) -> None:
+        try:
+            data = _dumps(message)
+        except TypeError as err:
+            data = _dumps({'error': 'TypeError', 'message': str(err)})
+        self.wfile.write(data)
+        self.wfile.flush()
+
+
+class SuperfacilityDaemon(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, sfapi, path: str = None):
+        """Serves calls on a warm SuperfacilityAPI over a Unix socket
+
+        The token, connection pool and caches of sfapi stay alive between
+        CLI invocations. Only the methods in DAEMON_METHODS can be called,
+        and the socket is only accessible by its owner.
+
+        Parameters
+        ----------
+        sfapi : SuperfacilityAPI
+            Client to serve
+        path : str, optional
+            Socket to listen on, by default default_socket_path()
+        """
+        self.sfapi = sfapi
+        self.path = default_socket_path() if path is None else Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if self.path.exists():
+            if DaemonClient.connect(self.path) is not None:
+                raise RuntimeError(f"An sfapi daemon is already running on {self.path}")
+            self.path.unlink()
+
+        self.started = time.time()
+        self.requests = 0
+        super().__init__(str(self.path), _Handler)
+
+    def server_bind(self) -> None:
+        # The socket is created owner only, so there is no window before the chmod
+        old = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(old)
+        os.chmod(self.server_address, 0o600)
+
+    def shutdown_soon(self) -> None:
+        # shutdown() waits for serve_forever, so it can't run on a handler thread directly
+        threading.Thread(target=self.shutdown, daemon=True).start()
+
+    def server_close(self) -> None:
+        super().server_close()
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class _Method:
+    def __init__(self, client: "DaemonClient", name: str):
+        self._client = client
+        self._name = name
+
+    def __getattr__(self, name: str) -> "_Method":
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return _Method(self._client, f"{self._name}.{name}")
+
+    def __call__(self, *args, **kwargs):
+        return self._client.call(self._name, *args, **kwargs)
+
+
+class DaemonClient:
+    def __init__(self, path: str = None, timeout: float = None):
+        """Stand-in for SuperfacilityAPI which forwards calls to a running daemon
+
+        Calls return the same json results as SuperfacilityAPI, generators
+        such as walk are streamed back item by item.
+
+        Parameters
+        ----------
+        path : str, optional
+            Socket the daemon listens on, by default default_socket_path()
+        timeout : float, optional
+            Seconds to wait on the daemon, by default None (forever)
+        """
+        self.path = default_socket_path() if path is None else Path(path)
+        self.timeout = timeout
+
+    @classmethod
+    def connect(cls, path: str = None, timeout: float = None) -> "DaemonClient":
+        """Gets a client if a daemon answers on path
+
+        Returns
+        -------
+        DaemonClient
+            None if no daemon is running
+        """
+        # A daemon that is up answers a ping right away
+        client = cls(path, timeout=1)
+        if not hasattr(socket, 'AF_UNIX') or not client.path.exists():
+            return None
+        try:
+            client.ping()
+        except (OSError, ValueError):
+            return None
+        client.timeout = timeout
+        return client
+
+    def __getattr__(self, name: str) -> _Method:
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return _Method(self, name)
+
+    def ping(self) -> Dict:
+        """Checks the daemon is up
+
+        Returns
+        -------
+        Dict
+            pid, uptime and number of requests served
+        """
+        return self.__request({'op': 'ping'})
+
+    def shutdown(self) -> None:
+        """Stops the daemon
+        """
+        self.__request({'op': 'shutdown'})
+
+    def call(self, method: str, /, *args, **kwargs):
+        """Calls a SuperfacilityAPI method in the daemon
+
+        Parameters
+        ----------
+        method : str
+            Name of the method in DAEMON_METHODS, e.g. ls or task_poller.wait
+        """
+        return self.__request({'op': 'call', 'name': method, 'args': args, 'kwargs': kwargs})
+
+    def __request(self, message: Dict):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(str(self.path))
+            sock.sendall(_dumps(message))
+            stream = sock.makefile('rb')
+            first = json.loads(stream.readline(), object_hook=_decode)
+        except BaseException:
+            sock.close()
+            raise
+
+        if 'item' not in first and 'done' not in first:
+            sock.close()
+            if 'error' in first:
+                raise _error(first['error'], first['message'])
+            return first['result']
+        return self.__items(sock, stream, first)
+
+    @staticmethod
+    def __items(sock, stream, first: Dict) -> Iterator:
+        try:
+            reply = first
+            while 'done' not in reply:
+                if 'error' in reply:
+                    raise _error(reply['error'], reply['message'])
+                yield reply['item']
+                line = stream.readline()
+                if not line:
+                    raise SuperfacilityErrors.SuperfacilityError("sfapi daemon closed the connection")
+                reply = json.loads(line, object_hook=_decode)
+        finally:
+            stream.close()
+            sock.close()
+
+
+def start_daemon(client: str = None, client_id: str = None, path: str = None,
+                 log_file: str = None) -> DaemonClient:
+    """Starts a daemon in the background and waits for it to answer
+
+    Parameters
+    ----------
+    client : str, optional
+        Name of the key in ~/.superfacility, by default None
+    client_id : str, optional
+        Client id of the key, by default None
+    path : str, optional
+        Socket to listen on, by default default_socket_path(client or client_id)
+    log_file : str, optional
+        File for the daemon's logs, by default the socket path with .log
+
+    Returns
+    -------
+    DaemonClient
+    """
+    path = default_socket_path(client or client_id) if path is None else Path(path)
+    running = DaemonClient.connect(path)
+    if running is not None:
+        return running
+
+    log_file = path.with_suffix('.log') if log_file is None else Path(log_file)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    cmd = [sys.executable, '-m', 'SuperfacilityAPI.daemon', '--path', str(path)]
+    if client is not None:
+        cmd += ['--client', client]
+    if client_id is not None:
+        cmd += ['--clientid', client_id]
+
+    with open(log_file, 'ab') as log:
+        proc = subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=log, stderr=log,
+                                start_new_session=True)
+
+    deadline = time.monotonic() + DAEMON_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"sfapi daemon exited with {proc.returncode}, see {log_file}")
+        running = DaemonClient.connect(path)
+        if running is not None:
+            return running
+        time.sleep(0.1)
+    raise RuntimeError(f"sfapi daemon didn't start in {DAEMON_START_TIMEOUT}s, see {log_file}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a warm SuperfacilityAPI over a Unix socket")
+    parser.add_argument('--client', '-c', default=None)
+    parser.add_argument('--clientid', '-id', default=None)
+    parser.add_argument('--path', default=None)
+    parser.add_argument('--debug', '-d', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    from .SuperfacilityAccessToken import SuperfacilityAccessToken
+    from .SuperfacilityAPI import SuperfacilityAPI
+    try:
+        # Keep the token object so it refreshes itself
+        token = SuperfacilityAccessToken(name=args.client, client_id=args.clientid)
+        token.token
+        sfapi = SuperfacilityAPI(token=token)
+    except Exception as err:
+        logging.warning(f"No token, only public calls will work {type(err).__name__}: {err}")
+        sfapi = SuperfacilityAPI()
+
+    path = default_socket_path(args.client or args.clientid) if args.path is None else args.path
+    with SuperfacilityDaemon(sfapi, path) as server:
+        logging.info(f"sfapi daemon {os.getpid()} listening on {server.path}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    sfapi.transport.close()
+
+
+if __name__ == '__main__':
+    main()
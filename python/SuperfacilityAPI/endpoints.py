@@ -0,0 +1,101 @@
+import re
+import urllib.parse
+
+# Endpoints whose next path segment is the site a request runs on
+_SITE_ENDPOINTS = ('/compute/jobs/', '/utilities/ls/', '/utilities/command/',
+                   '/utilities/download/', '/utilities/upload/', '/storage/')
+
+
+def endpoint_site(url: str) -> str:
+    """Gets the NERSC site a request goes to from its url
+
+    Parameters
+    ----------
+    url : str
+        Full or sub url of the request
+
+    Returns
+    -------
+    str
+        Name of the site, None for requests answered by the api itself (status, account, tasks)
+    """
+    path = urllib.parse.urlsplit(url).path
+    for endpoint in _SITE_ENDPOINTS:
+        start = path.find(endpoint)
+        if start != -1:
+            site = path[start + len(endpoint):].split('/', 1)[0]
+            return site or None
+    return None
+
+
+# Endpoint classes with their own request budgets, the first path segment after the api version
+ENDPOINT_CLASSES = ('status', 'compute', 'utilities', 'tasks')
+OTHER_ENDPOINTS = 'other'
+
+_API_PATH = re.compile(r'^(?:.*?/api/v[^/]+)?/+([^/?]*)')
+
+
+def endpoint_class(url: str) -> str:
+    """Gets the endpoint class of a request, e.g. compute for /compute/jobs/perlmutter
+
+    Parameters
+    ----------
+    url : str
+        Full or sub url of the request
+
+    Returns
+    -------
+    str
+        One of ENDPOINT_CLASSES or OTHER_ENDPOINTS
+    """
+    match = _API_PATH.match(urllib.parse.urlsplit(url).path)
+    name = match.group(1) if match else ''
+    return name if name in ENDPOINT_CLASSES else OTHER_ENDPOINTS
+
+
+# First path segment -> (fixed segments, names of the variable segments after them)
+_TEMPLATES = {
+    'status': (1, ('{name}',)),
+    'account': (2, ('{group}',)),
+    'tasks': (1, ('{task_id}',)),
+    'compute': (2, ('{site}', '{jobid}')),
+    'utilities': (2, ('{site}', '{path}')),
+    'storage': (2, ('{site}', '{path}')),
+}
+_VERSIONED_PATH = re.compile(r'^(?:.*?/api/v[^/]+)?(/.*)?$')
+
+
+def endpoint_template(url: str) -> str:
+    """Gets the endpoint a request goes to with its variable parts as names
+
+    /compute/jobs/perlmutter/123?sacct=true is /compute/jobs/{site}/{jobid},
+    so requests can be counted per endpoint without one entry per job or path.
+
+    Parameters
+    ----------
+    url : str
+        Full or sub url of the request
+
+    Returns
+    -------
+    str
+    """
+    path = _VERSIONED_PATH.match(urllib.parse.urlsplit(url).path).group(1) or '/'
+    parts = [part for part in path.split('/') if part]
+    if not parts:
+        return '/'
+
+    fixed, names = _TEMPLATES.get(parts[0], (1, ()))
+    if parts[0] == 'status':
+        # /status/notes, /status/outages and /status/outages/planned
+        if parts[1:3] == ['outages', 'planned']:
+            fixed = 3
+        elif parts[1:2] in (['notes'], ['outages']):
+            fixed = 2
+
+    variable = parts[fixed:]
+    template = parts[:fixed] + list(names[:len(variable)])
+    # Unquoted paths on a site span several segments, they all fall under {path}
+    if len(variable) > len(names) and template[-1] != '{path}':
+        template.append('{...}')
+    return '/' + '/'.join(template)
@@ -0,0 +1,177 @@
+from typing import Dict, List
+
+global HAVE_PANDAS
+try:
+    import pandas as pd
+    HAVE_PANDAS = True
+except ImportError:
+    HAVE_PANDAS = False
+
+# Slurm time formats, [DD-][HH:]MM:SS[.mmm]
+_DURATION = r'^(?:(?P<days>\d+)-)?(?:(?P<hours>\d+):)?(?P<minutes>\d+):(?P<seconds>\d+(?:\.\d+)?)$'
+# Slurm sizes, 1234K, 1.5G, 4000Mn/4000Mc for per node/cpu memory requests
+_MEMORY = r'^(?P<number>\d+(?:\.\d+)?)(?P<unit>[KMGTP]?)'
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40, 'P': 1 << 50}
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+sacct_types = {
+    'datetime': ['submit', 'start', 'end', 'eligible'],
+    'duration': ['elapsed', 'cputime', 'totalcpu', 'systemcpu', 'usercpu', 'timelimit',
+                 'reserved', 'resvcpu', 'suspended', 'avecpu', 'mincpu'],
+    'memory': ['maxrss', 'averss', 'maxvmsize', 'avevmsize', 'maxdiskread', 'maxdiskwrite',
+               'avediskread', 'avediskwrite', 'reqmem'],
+    'integer': ['alloccpus', 'allocnodes', 'ncpus', 'nnodes', 'ntasks', 'elapsedraw',
+                'cputimeraw', 'timelimitraw', 'resvcpuraw', 'uid', 'gid', 'priority',
+                'reqcpus', 'reqnodes', 'associd', 'dbindex', 'qosraw', 'consumedenergyraw',
+                'wckeyid', 'reservationid', 'maxpages', 'avepages'],
+    'category': ['state', 'partition', 'qos', 'account', 'user', 'group', 'cluster',
+                 'exitcode', 'derivedexitcode', 'wckey', 'reservation'],
+}
+
+squeue_types = {
+    'datetime': ['submit_time', 'start_time', 'end_time'],
+    'duration': ['time', 'time_left', 'time_limit'],
+    'memory': ['min_memory', 'min_tmp_disk'],
+    'integer': ['cpus', 'nodes', 'min_cpus', 'uid', 'nice', 'array_job_id'],
+    'category': ['state', 'st', 'partition', 'qos', 'account', 'user', 'group',
+                 'reason', 'features', 'reservation'],
+}
+
+
+def parse_datetimes(series: "pd.Series") -> "pd.Series":
+    """Parses Slurm timestamps, Unknown/None become NaT
+
+    Parameters
+    ----------
+    series : pd.Series
+        Strings like 2022-04-14T23:03:00
+
+    Returns
+    -------
+    pd.Series
+        datetime64 series
+    """
+    return pd.to_datetime(series, format=_DATETIME_FORMAT, errors='coerce')
+
+
+def parse_durations(series: "pd.Series") -> "pd.Series":
+    """Parses Slurm durations, UNLIMITED/INVALID become NaT
+
+    Parameters
+    ----------
+    series : pd.Series
+        Strings like 1-02:03:04, 02:03:04, 03:04 or 03:04.567
+
+    Returns
+    -------
+    pd.Series
+        timedelta64 series
+    """
+    parts = series.astype('string').str.strip().str.extract(_DURATION)
+    parts = parts.apply(pd.to_numeric, errors='coerce')
+    seconds = (parts['days'].fillna(0) * 86400 + parts['hours'].fillna(0) * 3600 +
+               parts['minutes'] * 60 + parts['seconds'])
+    return pd.to_timedelta(seconds, unit='s')
+
+
+def parse_memory(series: "pd.Series") -> "pd.Series":
+    """Parses Slurm sizes with K/M/G/T/P suffixes into bytes
+
+    Parameters
+    ----------
+    series : pd.Series
+        Strings like 1234K, 1.5G or 4000Mn
+
+    Returns
+    -------
+    pd.Series
+        Nullable integer series of bytes
+    """
+    parts = series.astype('string').str.strip().str.upper().str.extract(_MEMORY)
+    number = pd.to_numeric(parts['number'], errors='coerce')
+    scale = parts['unit'].map(_UNITS).astype('float64')
+    return (number * scale).round().astype('Int64')
+
+
+def parse_integers(series: "pd.Series") -> "pd.Series":
+    """Parses integer columns, anything else becomes NA
+
+    Parameters
+    ----------
+    series : pd.Series
+
+    Returns
+    -------
+    pd.Series
+        Nullable integer series
+    """
+    return pd.to_numeric(series, errors='coerce').round().astype('Int64')
+
+
+def parse_unique(series: "pd.Series", parser) -> "pd.Series":
+    """Runs a parser over the distinct values of a series only
+
+    Slurm columns repeat the same few values, so this is much faster
+    than parsing every row.
+
+    Parameters
+    ----------
+    series : pd.Series
+    parser : Callable[[pd.Series], pd.Series]
+
+    Returns
+    -------
+    pd.Series
+    """
+    codes, uniques = pd.factorize(series)
+    parsed = parser(pd.Series(uniques))
+    return pd.Series(parsed.array.take(codes, allow_fill=True), index=series.index,
+                     name=series.name)
+
+
+_PARSERS = {
+    'datetime': lambda series: parse_unique(series, parse_datetimes),
+    'duration': lambda series: parse_unique(series, parse_durations),
+    'memory': lambda series: parse_unique(series, parse_memory),
+    'integer': lambda series: parse_unique(series, parse_integers),
+    'category': lambda series: series.astype('category'),
+}
+
+
+def jobs_frame(jobs: List[Dict], columns: List[str], types: Dict[str, List[str]],
+               projection: List[str] = None, typed: bool = True) -> "pd.DataFrame":
+    """Builds a typed DataFrame of slurm jobs
+
+    Only the projected columns are pulled out of the records, then each one
+    is converted with a single vectorized parse.
+
+    Parameters
+    ----------
+    jobs : List[Dict]
+        Job records from sacct/squeue
+    columns : List[str]
+        All the columns the records can have, used when there are no records
+    types : Dict[str, List[str]]
+        Column names for each kind of parser, e.g. sacct_types
+    projection : List[str], optional
+        Columns to keep, by default all of them
+    typed : bool, optional
+        Convert the columns to proper dtypes, by default True
+
+    Returns
+    -------
+    pd.DataFrame
+    """
+    if projection is None:
+        projection = list(jobs[0].keys()) if len(jobs) > 0 else columns
+
+    frame = pd.DataFrame.from_records(jobs, columns=list(projection))
+    if not typed:
+        return frame
+
+    for kind, names in types.items():
+        for name in names:
+            if name in frame.columns:
+                frame[name] = _PARSERS[kind](frame[name])
+
+    return frame
@@ -0,0 +1,304 @@
+from typing import Callable, Dict, Iterator, List
+from contextlib import contextmanager
+import bisect
+import contextvars
+import json
+import logging
+import threading
+import time
+
+from .endpoints import endpoint_template
+
+# Upper bounds in seconds of the request duration histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Cache being refilled by the requests made in the current context
+_cache = contextvars.ContextVar('sfapi_cache', default=None)
+
+
+@contextmanager
+def cache_miss(name: str):
+    """Marks the requests made inside the block as refilling a cache
+
+    Parameters
+    ----------
+    name : str
+        Name of the cache, e.g. status or ls
+    """
+    token = _cache.set(name)
+    try:
+        yield
+    finally:
+        _cache.reset(token)
+
+
+def _labels(labels: Dict) -> str:
+    if not labels:
+        return ''
+    pairs = ','.join('{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                     for k, v in labels.items())
+    return '{' + pairs + '}'
+
+
+class Metrics:
+    def __init__(self, buckets=DEFAULT_BUCKETS, prefix: str = 'sfapi'):
+        """In memory counters and histograms of the requests a client makes
+
+        Parameters
+        ----------
+        buckets : Iterable[float], optional
+            Upper bounds of the duration histogram buckets, by default DEFAULT_BUCKETS
+        prefix : str, optional
+            Prefix of the metric names, by default sfapi
+        """
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        # name -> labels tuple -> value
+        self._counters = {}
+        # name -> labels tuple -> [bucket counts, sum, count]
+        self._histograms = {}
+        self._help = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, help: str = None, **labels) -> None:
+        """Adds to a counter
+
+        Parameters
+        ----------
+        name : str
+            Name of the counter without the prefix
+        value : float, optional
+            Amount to add, by default 1
+        help : str, optional
+            Description of the counter, by default None
+        **labels
+            Labels of the series
+        """
+        key = tuple(labels.items())
+        with self._lock:
+            if help is not None:
+                self._help.setdefault(name, help)
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, help: str = None, **labels) -> None:
+        """Adds a value to a histogram
+
+        Parameters
+        ----------
+        name : str
+            Name of the histogram without the prefix
+        value : float
+            Value to add
+        help : str, optional
+            Description of the histogram, by default None
+        **labels
+            Labels of the series
+        """
+        key = tuple(labels.items())
+        with self._lock:
+            if help is not None:
+                self._help.setdefault(name, help)
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = [[0] * len(self.buckets), 0.0, 0]
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                hist[0][index] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    def record(self, event: Dict) -> None:
+        """Counts a request event, used as a post request hook
+        """
+        labels = {'method': event['method'], 'endpoint': event['endpoint']}
+        if event['cache'] == 'hit':
+            self.inc('cache_total', help='Cache lookups', cache=event['cache_name'], result='hit')
+            return
+        if event['cache'] == 'miss':
+            self.inc('cache_total', help='Cache lookups', cache=event['cache_name'], result='miss')
+
+        status = event['status'] if event['status'] is not None else type(event['error']).__name__
+        self.inc('requests_total', help='Requests sent to the api', **labels, status=status)
+        self.observe('request_duration_seconds', event['duration'],
+                     help='Time from sending a request to its response, retries included', **labels)
+        if event['bytes']:
+            self.inc('response_bytes_total', event['bytes'], help='Bytes of response bodies', **labels)
+        if event['retries']:
+            self.inc('retries_total', event['retries'], help='Requests sent again after a failure', **labels)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def to_dict(self) -> Dict:
+        """Snapshot of every metric
+
+        Returns
+        -------
+        Dict
+            counters and histograms, each a list of series with their labels
+        """
+        with self._lock:
+            counters = {name: [{'labels': dict(key), 'value': value} for key, value in series.items()]
+                        for name, series in self._counters.items()}
+            histograms = {}
+            for name, series in self._histograms.items():
+                histograms[name] = []
+                for key, (counts, total, count) in series.items():
+                    cumulative, buckets = 0, {}
+                    for bound, n in zip(self.buckets, counts):
+                        cumulative += n
+                        buckets[str(bound)] = cumulative
+                    buckets['+Inf'] = count
+                    histograms[name].append({'labels': dict(key), 'buckets': buckets,
+                                             'sum': total, 'count': count})
+        return {'counters': counters, 'histograms': histograms}
+
+    def to_json(self, **kwargs) -> str:
+        """Metrics as JSON, see to_dict
+        """
+        return json.dumps(self.to_dict(), **kwargs)
+
+    def to_prometheus(self) -> str:
+        """Metrics in the Prometheus text exposition format
+
+        Returns
+        -------
+        str
+        """
+        snapshot = self.to_dict()
+        lines = []
+        for kind, metrics in (('counter', snapshot['counters']), ('histogram', snapshot['histograms'])):
+            for name, series in sorted(metrics.items()):
+                full = f"{self.prefix}_{name}"
+                if name in self._help:
+                    lines.append(f"# HELP {full} {self._help[name]}")
+                lines.append(f"# TYPE {full} {kind}")
+                for entry in series:
+                    if kind == 'counter':
+                        lines.append(f"{full}{_labels(entry['labels'])} {entry['value']}")
+                        continue
+                    for bound, count in entry['buckets'].items():
+                        labels = dict(entry['labels'], le=bound)
+                        lines.append(f"{full}_bucket{_labels(labels)} {count}")
+                    lines.append(f"{full}_sum{_labels(entry['labels'])} {entry['sum']}")
+                    lines.append(f"{full}_count{_labels(entry['labels'])} {entry['count']}")
+        return '\n'.join(lines) + '\n'
+
+
+class Instrumentation:
+    def __init__(self, metrics: Metrics = None):
+        """Hooks called around every request a client makes
+
+        Pre request hooks get an event with the method, url, endpoint
+        template and cache. Post request hooks get the same event with the
+        status code (None if no response came back), error, response bytes,
+        duration in seconds and number of retries added. Streamed responses
+        call them once the body is read or the response closed. Answers served
+        from a cache or shared with an identical request in flight show up as
+        post request events with cache set to hit, without a pre request event.
+
+        Parameters
+        ----------
+        metrics : Metrics, optional
+            Built in counters and histograms, by default a new Metrics()
+        """
+        self.metrics = Metrics() if metrics is None else metrics
+        self.pre_hooks = []
+        self.post_hooks = [self.metrics.record]
+
+    def add_hook(self, pre: Callable[[Dict], None] = None,
+                 post: Callable[[Dict], None] = None) -> None:
+        """Adds hooks called before and after each request
+
+        Parameters
+        ----------
+        pre : Callable[[Dict], None], optional
+            Called with the event before a request is sent, by default None
+        post : Callable[[Dict], None], optional
+            Called with the event once a request finished or failed, by default None
+        """
+        if pre is not None:
+            self.pre_hooks.append(pre)
+        if post is not None:
+            self.post_hooks.append(post)
+
+    def remove_hook(self, pre: Callable[[Dict], None] = None,
+                    post: Callable[[Dict], None] = None) -> None:
+        if pre is not None:
+            self.pre_hooks.remove(pre)
+        if post is not None:
+            self.post_hooks.remove(post)
+
+    @staticmethod
+    def __call(hooks: List[Callable], event: Dict) -> None:
+        for hook in list(hooks):
+            try:
+                hook(event)
+            except Exception as err:
+                # A broken hook shouldn't fail the request
+                logging.warning("Request hook %s failed %s: %s",
+                                getattr(hook, '__name__', hook), type(err).__name__, err)
+
+    def before(self, method: str, url: str) -> Dict:
+        """Starts the event for a request and calls the pre request hooks
+
+        Returns
+        -------
+        Dict
+            Event to pass to after
+        """
+        name = _cache.get()
+        event = {'method': method, 'url': url, 'endpoint': endpoint_template(url),
+                 'cache': None if name is None else 'miss', 'cache_name': name,
+                 'retries': 0, 'start': time.time(), '_start': time.perf_counter()}
+        self.__call(self.pre_hooks, event)
+        return event
+
+    def after(self, event: Dict, status: int = None, nbytes: int = None,
+              error: BaseException = None) -> None:
+        """Finishes the event for a request and calls the post request hooks
+
+        The sender keeps event['retries'] up to date while it retries.
+        """
+        event['duration'] = time.perf_counter() - event.pop('_start')
+        event.update(status=status, bytes=nbytes, error=error)
+        self.__call(self.post_hooks, event)
+
+    def cache_hit(self, name: str, method: str, url: str) -> None:
+        """Reports an answer that didn't need a request
+
+        Parameters
+        ----------
+        name : str
+            Cache that answered, e.g. status, ls or coalesce
+        method : str
+            HTTP method the request would have used
+        url : str
+            Url the request would have gone to
+        """
+        event = {'method': method, 'url': url, 'endpoint': endpoint_template(url),
+                 'cache': 'hit', 'cache_name': name, 'start': time.time(), 'duration': 0.0,
+                 'status': None, 'bytes': 0, 'retries': 0, 'error': None}
+        self.__call(self.post_hooks, event)
+
+    @contextmanager
+    def trace(self) -> Iterator[List[Dict]]:
+        """Collects the post request events of every call made inside the block
+
+        Calls from other threads during the block are collected too.
+
+        Yields
+        ------
+        List[Dict]
+            Filled with the events as they finish
+        """
+        events = []
+        self.add_hook(post=events.append)
+        try:
+            yield events
+        finally:
+            self.remove_hook(post=events.append)
@@ -0,0 +1,303 @@
+from typing import Dict, Iterable, List
+from datetime import datetime, timedelta
+from pathlib import Path
+import json
+import re
+import sqlite3
+import threading
+import zlib
+
+# Slurm states a job doesn't leave, its sacct record won't change anymore
+TERMINAL_STATES = ('BOOT_FAIL', 'CANCELLED', 'COMPLETED', 'DEADLINE', 'FAILED',
+                   'NODE_FAIL', 'OUT_OF_MEMORY', 'PREEMPTED', 'REVOKED', 'TIMEOUT')
+# Seconds before the watermark a delta sync starts from, for records written late
+DEFAULT_SYNC_OVERLAP = 300
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+_SLURM_TIME = re.compile(r'^\d{4}-\d\d-\d\dT\d\d:\d\d:\d\d$')
+# Record times a sync watermark is taken from
+_WATERMARK_FIELDS = ('submit', 'start', 'end')
+
+
+def default_job_history_path() -> Path:
+    return Path.joinpath(Path.home(), ".superfacility", "job_history.sqlite")
+
+
+def job_state(state: str) -> str:
+    """Slurm state without its details, e.g. CANCELLED for "CANCELLED by 1234"
+
+    Parameters
+    ----------
+    state : str
+
+    Returns
+    -------
+    str
+    """
+    return (state or '').split(' ', 1)[0].rstrip('+').upper()
+
+
+def slurm_time(value) -> str:
+    """Formats a time the way Slurm does, so stored times compare as strings
+
+    Parameters
+    ----------
+    value : datetime, float or str
+        datetime, unix time or an already formatted time
+
+    Returns
+    -------
+    str
+        e.g. 2022-04-14T23:03:00
+    """
+    if value is None or isinstance(value, str):
+        return value
+    if not isinstance(value, datetime):
+        value = datetime.fromtimestamp(value)
+    return value.strftime(_DATETIME_FORMAT)
+
+
+def latest_time(records: Iterable[Dict], since: str = None) -> str:
+    """Latest submit, start or end time in sacct records
+
+    The times are the cluster's own, so a watermark taken from them doesn't
+    depend on the clock or timezone of the client.
+
+    Parameters
+    ----------
+    records : Iterable[Dict]
+        sacct records
+    since : str, optional
+        Time to start from, by default None
+
+    Returns
+    -------
+    str
+        e.g. 2022-04-14T23:03:00, since if no record has a later time
+    """
+    latest = since
+    for record in records:
+        for field in _WATERMARK_FIELDS:
+            value = record.get(field)
+            if isinstance(value, str) and _SLURM_TIME.match(value) and (latest is None or value > latest):
+                latest = value
+    return latest
+
+
+def shift_time(value: str, seconds: float) -> str:
+    """Moves a Slurm time by some seconds, staying in the cluster's time
+
+    Parameters
+    ----------
+    value : str
+        e.g. 2022-04-14T23:03:00
+    seconds : float
+        Seconds to add, negative to go back
+
+    Returns
+    -------
+    str
+    """
+    return (datetime.strptime(value, _DATETIME_FORMAT) + timedelta(seconds=seconds)).strftime(_DATETIME_FORMAT)
+
+
+class JobHistory:
+    def __init__(self, path: str = None):
+        """Local store of sacct records keyed by (site, jobidraw)
+
+        Records are kept as compressed JSON in an SQLite file, with the
+        columns queries filter on alongside. A watermark per site and user
+        records the latest time seen in their records, in the cluster's
+        time, so the next sync only asks sacct for what changed since.
+
+        Parameters
+        ----------
+        path : str, optional
+            SQLite file to keep the history in, by default ~/.superfacility/job_history.sqlite
+        """
+        self.path = default_job_history_path() if path is None else Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS jobs (
+                                site TEXT NOT NULL,
+                                jobidraw TEXT NOT NULL,
+                                jobid TEXT,
+                                user TEXT,
+                                partition TEXT,
+                                state TEXT,
+                                submit TEXT,
+                                record BLOB NOT NULL,
+                                PRIMARY KEY (site, jobidraw))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_user ON jobs (site, user, submit)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_state ON jobs (site, state)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_submit ON jobs (site, submit)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS sync (
+                                site TEXT NOT NULL,
+                                user TEXT NOT NULL,
+                                watermark TEXT NOT NULL,
+                                PRIMARY KEY (site, user))""")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM jobs").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    def put(self, site: str, records: Iterable[Dict]) -> int:
+        """Stores sacct records, replacing the ones already there
+
+        Parameters
+        ----------
+        site : str
+            Site the jobs ran on
+        records : Iterable[Dict]
+            sacct records
+
+        Returns
+        -------
+        int
+            Number of records stored
+        """
+        rows = []
+        for record in records:
+            jobidraw = record.get('jobidraw') or record.get('jobid')
+            if jobidraw is None:
+                continue
+            rows.append((str(site), str(jobidraw), record.get('jobid'), record.get('user'),
+                         record.get('partition'), job_state(record.get('state')), record.get('submit'),
+                         zlib.compress(json.dumps(record, separators=(',', ':')).encode())))
+        with self._lock:
+            # One transaction for the batch, much faster than one per record
+            self._db.execute("BEGIN")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+        return len(rows)
+
+    def watermark(self, site: str, user: str = None) -> str:
+        """Latest time in the records synced for site and user
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+        user : str, optional
+            User the sync was for, by default None (every user)
+
+        Returns
+        -------
+        str
+            Slurm time on the cluster, None if they were never synced
+        """
+        with self._lock:
+            row = self._db.execute("SELECT watermark FROM sync WHERE site=? AND user=?",
+                                   (str(site), user or '')).fetchone()
+        return None if row is None else row[0]
+
+    def set_watermark(self, site: str, user: str = None, watermark: str = None) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sync VALUES (?, ?, ?)",
+                             (str(site), user or '', watermark))
+
+    def unfinished(self, site: str, user: str = None) -> List[str]:
+        """Jobs whose stored record isn't in a terminal state, so can still change
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+        user : str, optional
+            Only the jobs of this user, by default None
+
+        Returns
+        -------
+        List[str]
+            jobidraw of the jobs
+        """
+        sql = f"SELECT jobidraw FROM jobs WHERE site=? AND state NOT IN ({','.join('?' * len(TERMINAL_STATES))})"
+        args = [str(site), *TERMINAL_STATES]
+        if user is not None:
+            sql += " AND user=?"
+            args.append(user)
+        with self._lock:
+            return [row[0] for row in self._db.execute(sql, args)]
+
+    def query(self, site: str = None, user: str = None, partition: str = None,
+              state=None, jobid: str = None, start=None, end=None,
+              limit: int = None) -> List[Dict]:
+        """Stored sacct records matching every filter given, oldest submitted first
+
+        Parameters
+        ----------
+        site : str, optional
+            Name of the site, by default every site
+        user : str, optional
+            User the jobs ran as, by default None
+        partition : str, optional
+            Partition the jobs ran in, by default None
+        state : str or List[str], optional
+            Slurm state(s), e.g. COMPLETED or [FAILED, TIMEOUT], by default None
+        jobid : str, optional
+            Slurm job id, by default None
+        start : datetime, float or str, optional
+            Only jobs submitted at or after this time, by default None
+        end : datetime, float or str, optional
+            Only jobs submitted before this time, by default None
+        limit : int, optional
+            Most records to return, by default None (all of them)
+
+        Returns
+        -------
+        List[Dict]
+        """
+        where, args = [], []
+        for column, value in (('site', site), ('user', user), ('partition', partition), ('jobid', jobid)):
+            if value is not None:
+                where.append(f"{column}=?")
+                args.append(str(value))
+        if state is not None:
+            states = [state] if isinstance(state, str) else list(state)
+            where.append(f"state IN ({','.join('?' * len(states))})")
+            args.extend(job_state(s) for s in states)
+        if start is not None:
+            where.append("submit>=?")
+            args.append(slurm_time(start))
+        if end is not None:
+            where.append("submit<?")
+            args.append(slurm_time(end))
+
+        sql = "SELECT record FROM jobs"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY submit, jobidraw"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [json.loads(zlib.decompress(row[0])) for row in rows]
+
+    def clear(self, site: str = None) -> None:
+        """Drops the stored records and watermarks
+
+        Parameters
+        ----------
+        site : str, optional
+            Only drop those of this site, by default all of them
+        """
+        with self._lock:
+            if site is None:
+                self._db.execute("DELETE FROM jobs")
+                self._db.execute("DELETE FROM sync")
+            else:
+                self._db.execute("DELETE FROM jobs WHERE site=?", (str(site),))
+                self._db.execute("DELETE FROM sync WHERE site=?", (str(site),))
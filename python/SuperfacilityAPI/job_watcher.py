@@ -0,0 +1,165 @@
+from typing import Callable, Dict, Iterator, List
+from datetime import datetime
+import logging
+import threading
+
+from .SuperfacilityErrors import SuperfacilityError
+from .job_history import TERMINAL_STATES, job_state
+from .ratelimit import request_priority, BACKGROUND
+from .lazy import lazy_import
+
+requests = lazy_import('requests')
+
+# Seconds between polls of the queue
+DEFAULT_WATCH_INTERVAL = 30
+# Watched jobs asked for per squeue/sacct request
+WATCH_JOBS_PER_REQUEST = 200
+
+
+class JobWatcher:
+    def __init__(self, sfapi, site: str, user: str = None, jobids: List = None,
+                 interval: float = DEFAULT_WATCH_INTERVAL):
+        """Follows slurm jobs and reports only their state changes
+
+        With a user the whole queue for that user is fetched once per poll,
+        with jobids the jobs still running are fetched together, up to
+        WATCH_JOBS_PER_REQUEST per request. Jobs that leave the queue get
+        their final state from one sacct lookup per poll and are not polled
+        again.
+
+        Parameters
+        ----------
+        sfapi : SuperfacilityAPI
+            Client to poll with
+        site : str
+            Site the jobs run on
+        user : str, optional
+            Follow every job of this user, by default None
+        jobids : List, optional
+            Follow only these jobs, by default None
+        interval : float, optional
+            Seconds between polls, by default DEFAULT_WATCH_INTERVAL
+        """
+        self.sfapi = sfapi
+        self.site = site
+        self.user = user
+        self.jobids = None if jobids is None else {str(jobid) for jobid in jobids}
+        self.interval = interval
+        # jobid -> last seen state
+        self.states = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def done(self) -> bool:
+        """True once every watched job has reached a terminal state
+        """
+        if self.jobids is None:
+            return False
+        return all(self.states.get(jobid) in TERMINAL_STATES for jobid in self.jobids)
+
+    def __get_jobs(self, sacct: bool, jobids: List[str]) -> Dict[str, Dict]:
+        jobs = {}
+        wanted = set(jobids)
+        for i in range(0, len(jobids), WATCH_JOBS_PER_REQUEST):
+            ret = self.sfapi.get_jobs(site=self.site, sacct=sacct,
+                                      jobids=jobids[i:i + WATCH_JOBS_PER_REQUEST])
+            for job in ret.get('output', []):
+                # sacct also lists the .batch/.extern steps, which don't match a watched id
+                jobid = str(job.get('jobid'))
+                if jobid in wanted:
+                    jobs[jobid] = job
+        return jobs
+
+    def __queue(self) -> Dict[str, Dict]:
+        if self.jobids is not None and self.user is None:
+            running = sorted(jobid for jobid in self.jobids
+                             if self.states.get(jobid) not in TERMINAL_STATES)
+            return self.__get_jobs(False, running)
+
+        ret = self.sfapi.get_jobs(site=self.site, sacct=False, user=self.user)
+        jobs = {str(job['jobid']): job for job in ret.get('output', [])}
+        if self.jobids is not None:
+            jobs = {jobid: job for jobid, job in jobs.items() if jobid in self.jobids}
+        return jobs
+
+    def __transition(self, jobid: str, state: str, job: Dict) -> Dict:
+        transition = {'jobid': jobid, 'old_state': self.states.get(jobid),
+                      'new_state': state, 'time': datetime.now(), 'job': job}
+        self.states[jobid] = state
+        return transition
+
+    def poll(self) -> List[Dict]:
+        """Polls the queue once
+
+        Returns
+        -------
+        List[Dict]
+            jobid, old_state, new_state, time and the job record for every job whose state changed
+        """
+        with request_priority(BACKGROUND):
+            return self.__poll()
+
+    def __poll(self) -> List[Dict]:
+        transitions = []
+        queue = self.__queue()
+        for jobid, job in queue.items():
+            state = job_state(job.get('state')) or 'UNKNOWN'
+            if self.states.get(jobid) != state:
+                transitions.append(self.__transition(jobid, state, job))
+
+        # Jobs which left the queue get their final state from sacct once
+        expected = self.states.keys() if self.jobids is None else self.jobids
+        gone = sorted(jobid for jobid in expected
+                      if jobid not in queue and self.states.get(jobid) not in TERMINAL_STATES)
+        final = self.__get_jobs(True, gone)
+        for jobid in gone:
+            job = final.get(jobid)
+            # sacct can lag behind squeue, look again on the next poll
+            if job is None:
+                continue
+            state = job_state(job.get('state')) or 'UNKNOWN'
+            if state not in TERMINAL_STATES and jobid in self.states:
+                continue
+            if self.states.get(jobid) != state:
+                transitions.append(self.__transition(jobid, state, job))
+
+        return transitions
+
+    def __iter__(self) -> Iterator[Dict]:
+        while not self._stop.is_set():
+            try:
+                yield from self.poll()
+            except (SuperfacilityError, requests.exceptions.RequestException) as err:
+                logging.warning(f"Polling jobs on {self.site} failed {type(err).__name__}: {err}")
+
+            if self.done:
+                return
+            self._stop.wait(self.interval)
+
+    def start(self, callback: Callable[[Dict], None]) -> "JobWatcher":
+        """Watches in a background thread, calling callback for every transition
+
+        Parameters
+        ----------
+        callback : Callable[[Dict], None]
+            Called with each transition
+
+        Returns
+        -------
+        JobWatcher
+        """
+        def run():
+            for transition in self:
+                callback(transition)
+
+        self._thread = threading.Thread(target=run, daemon=True, name="sfapi-job-watcher")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops watching after the current poll
+        """
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
@@ -0,0 +1,47 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name: str):
+    """Imports a module the first time one of its attributes is used
+
+    Keeps heavy dependencies like requests off the import path of the
+    package and the CLI until a call actually needs them.
+
+    Parameters
+    ----------
+    name : str
+        Absolute name of the module, e.g. requests
+
+    Returns
+    -------
+    module
+        The module, loaded on first attribute access
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ImportError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+def have_module(name: str) -> bool:
+    """Checks an optional dependency is installed without importing it
+
+    Parameters
+    ----------
+    name : str
+        Absolute name of the module, e.g. pandas
+
+    Returns
+    -------
+    bool
+    """
+    return name in sys.modules or importlib.util.find_spec(name) is not None
@@ -0,0 +1,180 @@
+from typing import Dict
+from pathlib import Path
+import json
+import posixpath
+import sqlite3
+import threading
+import time
+import zlib
+
+# Seconds an ls result is trusted before it is fetched again
+DEFAULT_LS_TTL = 300
+# Number of directories kept before the least recently used are dropped
+DEFAULT_LS_MAX_ENTRIES = 10000
+
+
+def default_ls_cache_path() -> Path:
+    return Path.joinpath(Path.home(), ".superfacility", "ls_cache.sqlite")
+
+
+class LsCache:
+    def __init__(self, path: str = None, ttl: float = DEFAULT_LS_TTL,
+                 max_entries: int = DEFAULT_LS_MAX_ENTRIES):
+        """On disk cache of ls results keyed by (site, path)
+
+        Results are stored as compressed JSON in an SQLite file, expire after
+        ttl seconds and the least recently used are dropped past max_entries.
+
+        Parameters
+        ----------
+        path : str, optional
+            SQLite file to keep the cache in, by default ~/.superfacility/ls_cache.sqlite
+        ttl : float, optional
+            Seconds to keep a result, by default DEFAULT_LS_TTL
+        max_entries : int, optional
+            Most directories to keep, by default DEFAULT_LS_MAX_ENTRIES
+        """
+        self.path = default_ls_cache_path() if path is None else Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(str(self.path), check_same_thread=False,
+                                   isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS ls (
+                                site TEXT NOT NULL,
+                                path TEXT NOT NULL,
+                                response BLOB NOT NULL,
+                                stored REAL NOT NULL,
+                                used REAL NOT NULL,
+                                PRIMARY KEY (site, path))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS ls_used ON ls (used)")
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM ls").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
+
+    @staticmethod
+    def _key(site: str, path: str):
+        return str(site), posixpath.normpath(path)
+
+    def get(self, site: str, path: str) -> Dict:
+        """Gets a cached ls result if it hasn't expired
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+        path : str
+            Path on the site
+
+        Returns
+        -------
+        Dict
+            The ls responce, None if missing or expired
+        """
+        site, path = self._key(site, path)
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT response, stored FROM ls WHERE site=? AND path=?",
+                                   (site, path)).fetchone()
+            if row is None:
+                return None
+            if now - row[1] >= self.ttl:
+                self._db.execute("DELETE FROM ls WHERE site=? AND path=?", (site, path))
+                return None
+            self._db.execute("UPDATE ls SET used=? WHERE site=? AND path=?",
+                             (now, site, path))
+
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, site: str, path: str, response: Dict) -> None:
+        """Stores an ls result, dropping the least recently used past max_entries
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+        path : str
+            Path on the site
+        response : Dict
+            The ls responce
+        """
+        site, path = self._key(site, path)
+        blob = zlib.compress(json.dumps(response, separators=(',', ':')).encode())
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO ls VALUES (?, ?, ?, ?, ?)",
+                             (site, path, blob, now, now))
+            self._db.execute("""DELETE FROM ls WHERE rowid IN (
+                                    SELECT rowid FROM ls ORDER BY used DESC LIMIT -1 OFFSET ?)""",
+                             (self.max_entries,))
+
+    def invalidate(self, site: str, path: str = None) -> None:
+        """Drops cached results touched by a change to path
+
+        Drops path, everything under it and its parent directory, whose
+        listing includes path.
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+        path : str, optional
+            Path that changed, by default drops everything for the site
+        """
+        if path is None:
+            with self._lock:
+                self._db.execute("DELETE FROM ls WHERE site=?", (str(site),))
+            return
+
+        site, path = self._key(site, path)
+        prefix = path.rstrip('/') + '/'
+        with self._lock:
+            self._db.execute("""DELETE FROM ls WHERE site=? AND
+                                    (path=? OR path=? OR substr(path, 1, ?)=?)""",
+                             (site, path, posixpath.dirname(path), len(prefix), prefix))
+
+    def clear(self) -> None:
+        """Drops every cached result
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM ls")
+
+    def exists(self, site: str, path: str) -> bool:
+        """Answers whether path exists from cached listings
+
+        A cached listing only proves that path exists. One without it may be
+        older than path, so that is left to a live ls.
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+        path : str
+            Path on the site
+
+        Returns
+        -------
+        bool
+            True if a cached listing has path, None if unknown
+        """
+        own = self.get(site, path)
+        if own is not None and own.get('status') != "ERROR":
+            return True
+
+        parent = self.get(site, posixpath.dirname(posixpath.normpath(path)))
+        if parent is None or parent.get('status') == "ERROR":
+            return None
+
+        name = posixpath.basename(posixpath.normpath(path))
+        if any(posixpath.basename(entry.get('name', '')) == name
+               for entry in parent.get('entries', [])):
+            return True
+        return None
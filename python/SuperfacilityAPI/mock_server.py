@@ -0,0 +1,900 @@
+from typing import Dict, List, Tuple
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.parser import BytesParser
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, unquote, urlsplit
+import argparse
+import base64
+import email.policy
+import hashlib
+import itertools
+import json
+import logging
+import posixpath
+import random
+import re
+import shlex
+import threading
+import time
+import uuid
+
+from .api_version import API_VERSION
+from .nersc_systems import nersc_systems, NerscCompute
+from .lazy import lazy_import
+
+# Only record mode talks to a real api
+requests = lazy_import('requests')
+
+# Seconds before a submitted job or command task completes
+DEFAULT_TASK_DELAY = 0.5
+# Lifetime of the tokens handed out by the token endpoint
+MOCK_TOKEN_LIFETIME = 600
+MOCK_USER = 'mockuser'
+MOCK_HOME = f'/global/homes/m/{MOCK_USER}'
+
+# Times are the cluster's local ones like sacct's, whatever the timezone of the client
+MOCK_TIMEZONE = timezone(timedelta(hours=-8), 'PST')
+
+_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+# Endpoints that answer without a token
+_PUBLIC = ('status',)
+
+
+def _now() -> str:
+    return datetime.now(MOCK_TIMEZONE).strftime(_DATETIME_FORMAT)
+
+
+def _sbatch_option(script: str, short: str, long: str) -> str:
+    match = re.search(rf'^#SBATCH\s+(?:-{short}\s*|--{long}[=\s])(\S+)', script, re.MULTILINE)
+    return None if match is None else match.group(1)
+
+
+class Fixtures:
+    def __init__(self, path: str = None):
+        """Recorded responses keyed by method and url
+
+        Responses recorded for the same request are replayed in order,
+        the last one is repeated once they run out.
+
+        Parameters
+        ----------
+        path : str, optional
+            JSON file to load from and save to, by default None (kept in memory)
+        """
+        self.path = None if path is None else Path(path)
+        self.responses = {}
+        self._replayed = Counter()
+        self._lock = threading.Lock()
+        if self.path is not None and self.path.exists():
+            self.responses = json.loads(self.path.read_text())
+
+    @staticmethod
+    def key(method: str, path: str) -> str:
+        return f"{method.upper()} {path}"
+
+    def record(self, method: str, path: str, status: int, body) -> None:
+        """Adds a response for a request
+
+        Parameters
+        ----------
+        method : str
+            HTTP method
+        path : str
+            Url path and query below the api base url
+        status : int
+            HTTP status code
+        body : Dict or List or str
+            Decoded json body
+        """
+        with self._lock:
+            self.responses.setdefault(self.key(method, path), []).append(
+                {'status': status, 'body': body})
+
+    def replay(self, method: str, path: str) -> Dict:
+        """Gets the next recorded response for a request
+
+        Returns
+        -------
+        Dict
+            status and body, None if nothing was recorded for the request
+        """
+        key = self.key(method, path)
+        with self._lock:
+            recorded = self.responses.get(key)
+            if not recorded:
+                return None
+            index = min(self._replayed[key], len(recorded) - 1)
+            self._replayed[key] += 1
+            return recorded[index]
+
+    def save(self, path: str = None) -> None:
+        """Writes the fixtures as JSON
+
+        Parameters
+        ----------
+        path : str, optional
+            File to write, by default the file the fixtures were loaded from
+        """
+        path = self.path if path is None else Path(path)
+        if path is None:
+            raise ValueError("No path to save the fixtures to")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            path.write_text(json.dumps(self.responses, indent=1, sort_keys=True))
+
+
+class MockSuperfacility:
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 task_delay: float = DEFAULT_TASK_DELAY, job_runtime: float = None,
+                 require_token: bool = True, seed: int = None):
+        """In memory stand-in for the Superfacility API and the NERSC systems behind it
+
+        Holds the system status, account info, a slurm queue and history,
+        files on each site and the tasks created by job and command posts.
+        Jobs and commands complete task_delay seconds after they are posted,
+        the same way the real api finishes them in the background.
+
+        Parameters
+        ----------
+        latency : float, optional
+            Seconds added to every response, by default 0
+        jitter : float, optional
+            Up to this many more seconds added at random, by default 0
+        task_delay : float, optional
+            Seconds before a task completes, by default DEFAULT_TASK_DELAY
+        job_runtime : float, optional
+            Seconds a job runs before it completes, by default None (until finish_job)
+        require_token : bool, optional
+            Answer 403 to calls outside /status without a token from the token endpoint, by default True
+        seed : int, optional
+            Seed for the latency jitter and error injection, by default None
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.task_delay = task_delay
+        self.job_runtime = job_runtime
+        self.require_token = require_token
+        self.user = MOCK_USER
+
+        self.systems = {name: {'name': name, 'full_name': name, 'description': 'System is active',
+                               'system_type': 'compute' if name in NerscCompute else 'service',
+                               'notes': [], 'status': 'active', 'updated_at': _now()}
+                        for name in nersc_systems}
+        self.notes = {}
+        self.outages = {}
+        self.planned = {}
+        self.projects = [{'id': 1, 'repo_name': 'm0000', 'description': 'Mock project',
+                          'hours_given': 1000.0, 'hours_used': 0.0}]
+        self.groups = {'m0000': {'gid': 60000, 'name': 'm0000', 'users': [self.user]}}
+        self.roles = [{'id': 1, 'repo_name': 'm0000', 'iris_role': 'PI',
+                       'description': 'Mock project'}]
+        # site -> path -> bytes, directories are kept as None
+        self.files = {site.value: {'/': None} for site in NerscCompute}
+        # site -> jobid -> job, jobs leave the queue for the history when they end
+        self.queue = {site.value: {} for site in NerscCompute}
+        self.history = {site.value: {} for site in NerscCompute}
+        self.tasks = {}
+        self.commands = {'echo': self.__echo, 'cat': self.__cat, 'sha256sum': self.__sha256sum,
+                         'mkdir': self.__mkdir, 'rm': self.__rm}
+        self.tokens = set()
+        self.errors = []
+        # "METHOD /path" -> number of requests
+        self.requests = Counter()
+
+        self._random = random.Random(seed)
+        self._jobids = itertools.count(1000)
+        self._taskids = itertools.count(1)
+        self._lock = threading.RLock()
+        for site in self.files:
+            self.add_dir(site, MOCK_HOME)
+
+    # Setting up the mock
+
+    def issue_token(self) -> str:
+        """Hands out a token accepted by the mock
+
+        Returns
+        -------
+        str
+        """
+        token = uuid.uuid4().hex
+        with self._lock:
+            self.tokens.add(token)
+        return token
+
+    def set_status(self, name: str, status: str, notes: List = None) -> None:
+        """Changes the status of a system
+
+        Parameters
+        ----------
+        name : str
+            Name of the system
+        status : str
+            active, degraded, down or unknown
+        notes : List, optional
+            Notes for the system, by default None
+        """
+        with self._lock:
+            self.systems[name] = dict(self.systems.get(name, {'name': name, 'full_name': name,
+                                                              'system_type': 'service'}),
+                                      status=status, notes=notes or [], updated_at=_now())
+            if notes is not None:
+                self.notes[name] = notes
+
+    def add_file(self, site: str, path: str, content=b'') -> None:
+        """Puts a file on a site, creating its directories
+
+        Parameters
+        ----------
+        site : str
+            Site the file is on
+        path : str
+            Absolute path of the file
+        content : bytes or str, optional
+            Contents of the file, by default empty
+        """
+        if isinstance(content, str):
+            content = content.encode('utf8')
+        with self._lock:
+            self.add_dir(site, posixpath.dirname(path))
+            self.files[str(site)][path] = content
+
+    def add_dir(self, site: str, path: str) -> None:
+        """Makes a directory and its parents on a site
+
+        Parameters
+        ----------
+        site : str
+            Site the directory is on
+        path : str
+            Absolute path of the directory
+        """
+        with self._lock:
+            files = self.files.setdefault(str(site), {'/': None})
+            while path and path not in files:
+                files[path] = None
+                path = posixpath.dirname(path)
+
+    def add_job(self, site: str, state: str = 'RUNNING', **fields) -> str:
+        """Puts a job in the queue of a site, or in its history if it has ended
+
+        Parameters
+        ----------
+        site : str
+            Site the job runs on
+        state : str, optional
+            Slurm state, by default RUNNING
+        **fields
+            squeue/sacct fields to set on the job
+
+        Returns
+        -------
+        str
+            jobid
+        """
+        with self._lock:
+            job = self.__new_job(str(site), fields.pop('name', 'mock'), state)
+            job.update(fields)
+            if state in ('PENDING', 'RUNNING'):
+                self.queue[str(site)][job['jobid']] = job
+            else:
+                if 'end' not in fields:
+                    job['end'] = _now()
+                self.history[str(site)][job['jobid']] = job
+            return job['jobid']
+
+    def finish_job(self, site: str, jobid, state: str = 'COMPLETED') -> None:
+        """Ends a queued job and moves it to the history
+
+        Parameters
+        ----------
+        site : str
+            Site the job runs on
+        jobid : str or int
+            Job to end
+        state : str, optional
+            Final slurm state, by default COMPLETED
+        """
+        with self._lock:
+            job = self.queue[str(site)].pop(str(jobid))
+            job['state'] = state
+            job['end'] = _now()
+            self.history[str(site)][job['jobid']] = job
+
+    def inject_error(self, status: int, path: str = '', method: str = None,
+                     rate: float = 1.0, count: int = None, retry_after: float = None) -> None:
+        """Makes matching requests fail
+
+        Parameters
+        ----------
+        status : int
+            HTTP status to answer with, e.g. 403, 404, 500 or 503
+        path : str, optional
+            Only fail urls starting with this path below the api base url, by default every url
+        method : str, optional
+            Only fail this HTTP method, by default every method
+        rate : float, optional
+            Fraction of matching requests to fail, by default 1 (all of them)
+        count : int, optional
+            Stop failing after this many errors, by default None (keep failing)
+        retry_after : float, optional
+            Retry-After header to send with the error, by default None
+        """
+        with self._lock:
+            self.errors.append({'status': status, 'path': path, 'rate': rate, 'count': count,
+                                'method': None if method is None else method.upper(),
+                                'retry_after': retry_after})
+
+    def clear_errors(self) -> None:
+        with self._lock:
+            self.errors.clear()
+
+    # Serving requests
+
+    def delay(self) -> float:
+        """Seconds to wait before answering a request
+        """
+        with self._lock:
+            return self.latency + self.jitter * self._random.random()
+
+    def handle(self, method: str, path: str, query: Dict[str, List[str]] = None,
+               form: Dict[str, str] = None, token: str = None) -> Tuple[int, object, Dict]:
+        """Answers one request
+
+        Parameters
+        ----------
+        method : str
+            HTTP method
+        path : str
+            Url path below the api base url, e.g. /status/perlmutter
+        query : Dict[str, List[str]], optional
+            Parsed query string, by default None
+        form : Dict[str, str], optional
+            Form fields of a POST, by default None
+        token : str, optional
+            Bearer token sent with the request, by default None
+
+        Returns
+        -------
+        Tuple[int, object, Dict]
+            HTTP status, json body and extra headers
+        """
+        query = query or {}
+        form = form or {}
+        raw = [part for part in path.split('?')[0].split('/') if part]
+        parts = [unquote(part) for part in raw]
+        endpoint = parts[0] if parts else ''
+
+        with self._lock:
+            self.requests[f"{method} /{'/'.join(raw)}"] += 1
+            error = self.__injected_error(method, path)
+            if error is not None:
+                return error
+
+            if self.require_token and endpoint not in _PUBLIC and token not in self.tokens:
+                return 403, {'detail': 'The security token included in the request is invalid.'}, {}
+
+            self.__advance()
+            routes = {'status': self.__status, 'account': self.__account, 'tasks': self.__tasks,
+                      'compute': self.__compute, 'utilities': self.__utilities}
+            route = routes.get(endpoint)
+            if route is None:
+                return 404, {'detail': 'Not Found'}, {}
+            return route(method, parts[1:], query, form)
+
+    def __injected_error(self, method: str, path: str):
+        for rule in self.errors:
+            if rule['method'] not in (None, method) or not path.startswith(rule['path']):
+                continue
+            if rule['count'] is not None and rule['count'] <= 0:
+                continue
+            if self._random.random() >= rule['rate']:
+                continue
+            if rule['count'] is not None:
+                rule['count'] -= 1
+            headers = {}
+            if rule['retry_after'] is not None:
+                headers['Retry-After'] = str(rule['retry_after'])
+            return rule['status'], {'detail': f"Injected {rule['status']} error"}, headers
+        return None
+
+    def __advance(self) -> None:
+        # Finishes the tasks and jobs whose time has come
+        now = time.time()
+        for task in self.tasks.values():
+            if task['status'] != 'completed' and now >= task['done_at']:
+                task['status'] = 'completed'
+                task['result'] = json.dumps(task.pop('complete')())
+
+        for site, jobs in self.queue.items():
+            for job in list(jobs.values()):
+                started = job.pop('_start_at', None)
+                if started is not None:
+                    job['state'] = 'RUNNING'
+                    job['start_time'] = job['start'] = _now()
+                    job['reason'] = 'None'
+                    job['_end_at'] = None if self.job_runtime is None else started + self.job_runtime
+                end = job.get('_end_at')
+                if end is not None and now >= end:
+                    del job['_end_at']
+                    self.finish_job(site, job['jobid'])
+
+    def __new_task(self, complete) -> Dict:
+        task_id = str(next(self._taskids))
+        self.tasks[task_id] = {'id': task_id, 'status': 'new', 'result': None,
+                               'done_at': time.time() + self.task_delay, 'complete': complete}
+        return {'task_id': task_id, 'status': 'ok', 'error': None}
+
+    def __new_job(self, site: str, name: str, state: str) -> Dict:
+        jobid = str(next(self._jobids))
+        now = _now()
+        return {'jobid': jobid, 'jobidraw': jobid, 'name': name, 'jobname': name,
+                'user': self.user, 'account': 'm0000', 'partition': 'regular', 'qos': 'regular',
+                'cpus': 1, 'nodes': 1, 'alloccpus': 1, 'nnodes': 1, 'features': 'cpu',
+                'state': state, 'reason': 'None' if state == 'RUNNING' else 'Priority',
+                'submit_time': now, 'submit': now, 'start_time': now if state != 'PENDING' else 'N/A',
+                'start': now if state != 'PENDING' else 'Unknown', 'end': 'Unknown',
+                'time': '0:00', 'time_left': '30:00', 'time_limit': '30:00', 'timelimit': '00:30:00',
+                'elapsed': '00:00:00', 'exitcode': '0:0', 'cluster': site}
+
+    # /status
+
+    def __status(self, method, parts, query, form):
+        if method != 'GET':
+            return 405, {'detail': 'Method Not Allowed'}, {}
+        kind = None
+        if parts and parts[0] == 'notes':
+            kind, parts = self.notes, parts[1:]
+        elif parts[:2] == ['outages', 'planned']:
+            kind, parts = self.planned, parts[2:]
+        elif parts and parts[0] == 'outages':
+            kind, parts = self.outages, parts[1:]
+
+        if kind is not None:
+            if parts:
+                return 200, kind.get(parts[0], []), {}
+            # One list per system with anything to report
+            return 200, [entries for entries in kind.values() if entries], {}
+
+        if not parts:
+            return 200, list(self.systems.values()), {}
+        if parts[0] not in self.systems:
+            return 404, {'detail': f"System {parts[0]} not found"}, {}
+        return 200, self.systems[parts[0]], {}
+
+    # /account
+
+    def __account(self, method, parts, query, form):
+        if parts == ['projects']:
+            return 200, self.projects, {}
+        if parts == ['roles']:
+            return 200, self.roles, {}
+        if parts == ['groups']:
+            return 200, list(self.groups.values()), {}
+        if parts[:1] == ['groups'] and len(parts) == 2:
+            if parts[1] not in self.groups:
+                return 404, {'detail': f"Group {parts[1]} not found"}, {}
+            return 200, self.groups[parts[1]], {}
+        return 404, {'detail': 'Not Found'}, {}
+
+    # /tasks
+
+    def __tasks(self, method, parts, query, form):
+        def view(task):
+            return {'id': task['id'], 'status': task['status'], 'result': task['result']}
+
+        if not parts:
+            return 200, {'tasks': [view(task) for task in self.tasks.values()]}, {}
+        if parts[0] not in self.tasks:
+            return 404, {'detail': f"Task {parts[0]} not found"}, {}
+        return 200, view(self.tasks[parts[0]]), {}
+
+    # /compute/jobs
+
+    def __compute(self, method, parts, query, form):
+        if parts[:1] != ['jobs'] or len(parts) < 2 or parts[1] not in self.queue:
+            return 404, {'detail': 'Not Found'}, {}
+        site = parts[1]
+        jobid = parts[2] if len(parts) > 2 else None
+
+        if method == 'GET':
+            sacct = query.get('sacct', ['false'])[0] == 'true'
+            jobs = list(self.queue[site].values())
+            if sacct:
+                jobs = list(self.history[site].values()) + jobs
+            filters = dict(kwarg.split('=', 1) for kwarg in query.get('kwargs', []) if '=' in kwarg)
+            if jobid is not None:
+                filters['jobid'] = jobid
+            # Like sacct -S, jobs that were still going at starttime or ended after it
+            starttime = filters.pop('starttime', None)
+            if starttime is not None:
+                jobs = [job for job in jobs if job.get('end', 'Unknown') == 'Unknown' or job['end'] >= starttime]
+            # Like sacct -j
+            if 'jobs' in filters:
+                wanted = set(filters.pop('jobs').split(','))
+                jobs = [job for job in jobs if job['jobidraw'] in wanted or job['jobid'] in wanted]
+            jobs = [{k: v for k, v in job.items() if not k.startswith('_')} for job in jobs
+                    if all(str(job.get(k)) == v for k, v in filters.items())]
+            return 200, {'status': 'OK', 'output': jobs, 'error': None}, {}
+
+        if method == 'POST':
+            script = form.get('job', '')
+            is_path = form.get('isPath', 'true') == 'true'
+            return 200, self.__new_task(lambda: self.__sbatch(site, script, is_path)), {}
+
+        if method == 'DELETE':
+            if jobid not in self.queue[site]:
+                return 200, {'status': 'ERROR', 'output': None,
+                             'error': f"Invalid job id specified {jobid}"}, {}
+            self.finish_job(site, jobid, state='CANCELLED')
+            return 200, {'status': 'OK', 'output': f"Job {jobid} cancelled", 'error': None}, {}
+
+        return 405, {'detail': 'Method Not Allowed'}, {}
+
+    def __sbatch(self, site: str, script: str, is_path: bool) -> Dict:
+        name = 'mock'
+        if is_path:
+            if self.files[site].get(script) is None:
+                return {'status': 'ERROR', 'jobid': None,
+                        'error': f"sbatch: error: Unable to open file {script}"}
+            name = posixpath.basename(script)
+            script = self.files[site][script].decode('utf8', 'replace')
+        name = _sbatch_option(script, 'J', 'job-name') or name
+
+        # Like slurm, a dependency on a job it doesn't know is refused
+        dependency = _sbatch_option(script, 'd', 'dependency')
+        if dependency is not None:
+            known = set(self.queue[site]) | set(self.history[site])
+            for spec in dependency.replace('?', ',').split(','):
+                if any(jobid.split('_')[0] not in known for jobid in spec.split(':')[1:]):
+                    return {'status': 'ERROR', 'jobid': None,
+                            'error': "sbatch: error: Batch job submission failed: Job dependency problem"}
+
+        job = self.__new_job(site, name, 'PENDING')
+        job['start_time'], job['start'] = 'N/A', 'Unknown'
+        job['dependency'] = dependency or '(null)'
+        job['_start_at'] = time.time()
+        self.queue[site][job['jobid']] = job
+        return {'status': 'OK', 'jobid': job['jobid'], 'error': None}
+
+    # /utilities
+
+    def __utilities(self, method, parts, query, form):
+        if len(parts) < 2 or parts[1] not in self.files:
+            return 404, {'detail': 'Not Found'}, {}
+        kind, site = parts[0], parts[1]
+        path = '/'.join(parts[2:])
+        if path and not path.startswith('/'):
+            path = f'/{path}'
+        path = posixpath.normpath(path) if path else path
+
+        if kind == 'ls' and method == 'GET':
+            return 200, self.__ls(site, path), {}
+        if kind == 'download' and method == 'GET':
+            binary = query.get('binary', ['false'])[0] == 'true'
+            return 200, self.__download(site, path, binary), {}
+        if kind == 'upload' and method == 'PUT':
+            content = form.get('file')
+            if not isinstance(content, bytes):
+                return 400, {'detail': 'No file in the request'}, {}
+            if path not in self.files[site] and posixpath.dirname(path) not in self.files[site]:
+                return 200, {'status': 'ERROR', 'error': f"{posixpath.dirname(path)}: No such directory"}, {}
+            self.add_file(site, path, content)
+            return 200, {'status': 'OK', 'error': None}, {}
+        if kind == 'command' and method == 'POST':
+            cmd = form.get('executable', '')
+            return 200, self.__new_task(lambda: self.__command(site, cmd)), {}
+        return 404, {'detail': 'Not Found'}, {}
+
+    def __entry(self, site: str, path: str, name: str) -> Dict:
+        content = self.files[site][path]
+        return {'perms': '-rw-r--r--' if content is not None else 'drwxr-xr-x',
+                'hardlinks': 1, 'user': self.user, 'group': 'm0000',
+                'size': 4096 if content is None else len(content),
+                'date': _now(), 'name': name}
+
+    def __ls(self, site: str, path: str) -> Dict:
+        files = self.files[site]
+        if path not in files:
+            return {'status': 'ERROR', 'entries': None,
+                    'error': f"ls: cannot access '{path}': No such file or directory"}
+        if files[path] is not None:
+            return {'status': 'OK', 'entries': [self.__entry(site, path, path)], 'error': None}
+        entries = [self.__entry(site, child, posixpath.basename(child)) for child in sorted(files)
+                   if child != path and posixpath.dirname(child) == path]
+        return {'status': 'OK', 'entries': entries, 'error': None}
+
+    def __download(self, site: str, path: str, binary: bool) -> Dict:
+        content = self.files[site].get(path)
+        if content is None:
+            return {'status': 'ERROR', 'file': None, 'is_binary': binary,
+                    'error': f"{path} is not a file"}
+        if binary:
+            data = base64.b64encode(content).decode('ascii')
+        else:
+            data = content.decode('utf8', 'replace')
+        return {'status': 'OK', 'file': data, 'is_binary': binary, 'error': None}
+
+    def __command(self, site: str, cmd: str) -> Dict:
+        # Commands can be chained with && and write to a file with >
+        try:
+            words = shlex.split(cmd)
+        except ValueError as err:
+            return {'status': 'ERROR', 'output': None, 'error': str(err)}
+        commands = [[]]
+        for word in words:
+            if word == '&&':
+                commands.append([])
+            else:
+                commands[-1].append(word)
+
+        output = ''
+        for args in commands:
+            target = None
+            if '>' in args:
+                index = args.index('>')
+                args, target = args[:index], args[index + 1] if index + 1 < len(args) else None
+            if not args or args[0] not in self.commands:
+                name = args[0] if args else ''
+                return {'status': 'ERROR', 'output': output or None, 'error': f"{name}: command not found"}
+            try:
+                out = self.commands[args[0]](site, args[1:])
+            except (KeyError, ValueError) as err:
+                return {'status': 'ERROR', 'output': output or None, 'error': f"{args[0]}: {err}"}
+            if target is None:
+                output += out
+            else:
+                self.add_file(site, target, out.encode('utf8', 'surrogateescape'))
+        return {'status': 'OK', 'output': output, 'error': None}
+
+    def __echo(self, site: str, args: List[str]) -> str:
+        return ' '.join(args) + '\n'
+
+    def __cat(self, site: str, args: List[str]) -> str:
+        # surrogateescape so binary files survive cat > file
+        return ''.join(self.files[site][path].decode('utf8', 'surrogateescape') for path in args)
+
+    def __sha256sum(self, site: str, args: List[str]) -> str:
+        # Like sha256sum, files that aren't there are left out of the output
+        return ''.join(f"{hashlib.sha256(self.files[site][path]).hexdigest()}  {path}\n"
+                       for path in args if self.files[site].get(path) is not None)
+
+    def __mkdir(self, site: str, args: List[str]) -> str:
+        for path in args:
+            if not path.startswith('-'):
+                self.add_dir(site, path)
+        return ''
+
+    def __rm(self, site: str, args: List[str]) -> str:
+        force = '-f' in args
+        for path in args:
+            if path.startswith('-'):
+                continue
+            if path in self.files[site] or not force:
+                del self.files[site][path]
+        return ''
+
+
+def _parse_form(content_type: str, body: bytes) -> Dict:
+    """Reads a urlencoded or multipart form, files in a multipart form are bytes
+    """
+    if not content_type.startswith('multipart/form-data'):
+        return {k: v[-1] for k, v in parse_qs(body.decode('utf8'), keep_blank_values=True).items()}
+    message = BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    form = {}
+    for part in message.iter_parts():
+        name = part.get_param('name', header='content-disposition')
+        content = part.get_payload(decode=True)
+        form[name] = content if part.get_filename() is not None else content.decode('utf8')
+    return form
+
+
+class _Handler(BaseHTTPRequestHandler):
+    # Keep connections alive so pooled clients behave like they do against the real api
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, don't let Nagle hold back the body
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        self.__respond()
+
+    def do_POST(self):
+        self.__respond()
+
+    def do_PUT(self):
+        self.__respond()
+
+    def do_DELETE(self):
+        self.__respond()
+
+    def log_message(self, format, *args):
+        logging.debug("mock sfapi %s", format % args)
+
+    def __respond(self):
+        server = self.server
+        url = urlsplit(self.path)
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+
+        if url.path.rstrip('/') == server.TOKEN_PATH and self.command == 'POST':
+            self.__send(200, {'access_token': server.state.issue_token(), 'token_type': 'Bearer',
+                              'expires_in': MOCK_TOKEN_LIFETIME})
+            return
+
+        match = re.match(r'^/api/v[^/]+(/.*)?$', url.path)
+        path = (match.group(1) or '/') if match else url.path
+        full_path = f'{path}?{url.query}' if url.query else path
+
+        delay = server.state.delay()
+        if delay > 0:
+            time.sleep(delay)
+
+        if server.upstream is not None:
+            status, payload, headers = self.__forward(full_path, body)
+            server.fixtures.record(self.command, full_path, status, payload)
+        elif server.fixtures is not None:
+            recorded = server.fixtures.replay(self.command, full_path)
+            if recorded is None:
+                status, payload, headers = 404, {'detail': f"No fixture for {self.command} {full_path}"}, {}
+            else:
+                status, payload, headers = recorded['status'], recorded['body'], {}
+        else:
+            auth = self.headers.get('Authorization', '')
+            token = auth[len('Bearer '):] if auth.startswith('Bearer ') else None
+            form = _parse_form(self.headers.get('Content-Type', ''), body)
+            status, payload, headers = server.state.handle(self.command, path, parse_qs(url.query),
+                                                           form, token)
+        self.__send(status, payload, headers)
+
+    def __forward(self, full_path: str, body: bytes):
+        headers = {k: self.headers[k] for k in ('Authorization', 'Content-Type') if k in self.headers}
+        resp = requests.request(self.command, self.server.upstream + full_path,
+                                headers=headers, data=body or None)
+        try:
+            payload = resp.json()
+        except ValueError:
+            payload = resp.text
+        return resp.status_code, payload, {}
+
+    def __send(self, status: int, payload, headers: Dict = None):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    TOKEN_PATH = '/token'
+
+    def __init__(self, state: MockSuperfacility = None, host: str = '127.0.0.1', port: int = 0,
+                 fixtures: Fixtures = None, upstream: str = None):
+        """HTTP server for a MockSuperfacility
+
+        By default requests are answered by state. With fixtures and an
+        upstream base url requests are forwarded to the real api and the
+        responses recorded, with fixtures alone the recorded responses are
+        replayed.
+
+        Parameters
+        ----------
+        state : MockSuperfacility, optional
+            Mock to serve, by default a new MockSuperfacility()
+        host : str, optional
+            Address to listen on, by default 127.0.0.1
+        port : int, optional
+            Port to listen on, by default 0 (any free port)
+        fixtures : Fixtures, optional
+            Responses to replay or record into, by default None
+        upstream : str, optional
+            Base url of the api to record from, by default None
+        """
+        if upstream is not None and fixtures is None:
+            raise ValueError("Recording from upstream needs fixtures to record into")
+        self.state = MockSuperfacility() if state is None else state
+        self.fixtures = fixtures
+        self.upstream = None if upstream is None else upstream.rstrip('/')
+        self._thread = None
+        super().__init__((host, port), _Handler)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    @property
+    def base_url(self) -> str:
+        """base_url to give SuperfacilityAPI
+        """
+        return f"{self.url}/api/v{API_VERSION}"
+
+    @property
+    def token_url(self) -> str:
+        """token_url to give SuperfacilityAccessToken
+        """
+        return f"{self.url}{self.TOKEN_PATH}"
+
+    def start(self) -> "MockServer":
+        """Serves in a background thread
+
+        Returns
+        -------
+        MockServer
+        """
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True,
+                                        name="sfapi-mock-server")
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Stops serving and saves recorded fixtures
+        """
+        if self._thread is not None:
+            self.shutdown()
+            self._thread.join()
+            self._thread = None
+        self.server_close()
+        if self.upstream is not None and self.fixtures.path is not None:
+            self.fixtures.save()
+
+    def __enter__(self) -> "MockServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock Superfacility API")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', '-p', type=int, default=8000)
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Up to this many more seconds at random')
+    parser.add_argument('--task-delay', type=float, default=DEFAULT_TASK_DELAY,
+                        help='Seconds before jobs and commands complete')
+    parser.add_argument('--job-runtime', type=float, default=None, help='Seconds submitted jobs run for')
+    parser.add_argument('--error', action='append', default=[], metavar='STATUS[:PATH[:RATE]]',
+                        help='Inject errors, e.g. 503:/compute:0.1')
+    parser.add_argument('--no-auth', action='store_true', help='Accept requests without a token')
+    parser.add_argument('--record', default=None, metavar='FIXTURES',
+                        help='Forward to --upstream and record the responses into this file')
+    parser.add_argument('--upstream', default=f'https://api.nersc.gov/api/v{API_VERSION}')
+    parser.add_argument('--replay', default=None, metavar='FIXTURES', help='Replay recorded responses')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--debug', '-d', action='store_true')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.DEBUG if args.debug else logging.INFO)
+
+    state = MockSuperfacility(latency=args.latency, jitter=args.jitter, task_delay=args.task_delay,
+                              job_runtime=args.job_runtime, require_token=not args.no_auth,
+                              seed=args.seed)
+    for error in args.error:
+        status, path, rate = (error.split(':') + ['', '1'])[:3]
+        state.inject_error(int(status), path=path, rate=float(rate or 1))
+
+    fixtures, upstream = None, None
+    if args.record is not None:
+        fixtures, upstream = Fixtures(args.record), args.upstream
+    elif args.replay is not None:
+        fixtures = Fixtures(args.replay)
+
+    server = MockServer(state, host=args.host, port=args.port, fixtures=fixtures, upstream=upstream)
+    logging.info(f"mock sfapi serving {server.base_url}, tokens from {server.token_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -20,6 +20,9 @@ class NerscCompute(str, Enum, metaclass=MyEnumMeta):
     PERLMUTTER = 'perlmutter'
     MULLER = 'muller'
 
+    def __str__(self):
+        return self.value
+
 
 class NerscFilesystems(str, Enum, metaclass=MyEnumMeta):
     DNA = 'dna'
@@ -28,5 +31,8 @@ class NerscFilesystems(str, Enum, metaclass=MyEnumMeta):
     GLOBAL_COMMON = 'global_common'
     CFS = 'community_filesystem'
 
+    def __str__(self):
+        return self.value
+
 
 NERSC_DEFAULT_COMPUTE = NerscCompute.PERLMUTTER
@@ -0,0 +1,290 @@
+from typing import Dict, Tuple
+from contextlib import contextmanager
+from pathlib import Path
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import threading
+import time
+
+from .endpoints import endpoint_class, OTHER_ENDPOINTS
+
+global HAVE_FCNTL
+try:
+    import fcntl
+    HAVE_FCNTL = True
+except ImportError:
+    HAVE_FCNTL = False
+
+# Lower goes first when requests are waiting on the same budget
+INTERACTIVE = 0
+NORMAL = 5
+BACKGROUND = 10
+
+# Endpoint class -> (requests per second, burst)
+DEFAULT_RATES = {
+    'status': (5, 10),
+    'compute': (2, 5),
+    'utilities': (5, 10),
+    'tasks': (2, 5),
+    OTHER_ENDPOINTS: (5, 10),
+}
+
+_priority = contextvars.ContextVar('sfapi_request_priority', default=NORMAL)
+
+
+def current_priority() -> int:
+    """Priority of requests sent from the current thread or task
+    """
+    return _priority.get()
+
+
+@contextmanager
+def request_priority(priority: int):
+    """Sends the requests made inside the block with a priority
+
+    Parameters
+    ----------
+    priority : int
+        INTERACTIVE, NORMAL, BACKGROUND or any int, lower goes first
+    """
+    reset = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(reset)
+
+
+def _take(state: Tuple[float, float], now: float, rate: float, burst: float):
+    # Refills a bucket and takes a token, returns the new state and seconds to wait
+    tokens, last = (burst, now) if state is None else state
+    tokens = min(burst, tokens + max(0.0, now - last) * rate)
+    if tokens >= 1:
+        return (tokens - 1, now), 0.0
+    return (tokens, now), (1 - tokens) / rate
+
+
+class MemoryBackend:
+    def __init__(self):
+        """Token buckets shared by the threads of one process
+        """
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, name: str, rate: float, burst: float) -> float:
+        """Takes a token from a bucket
+
+        Returns
+        -------
+        float
+            0 if a token was taken, else seconds until one is available
+        """
+        with self._lock:
+            self._buckets[name], wait = _take(self._buckets.get(name), time.monotonic(),
+                                              rate, burst)
+        return wait
+
+
+def default_ratelimit_path() -> Path:
+    return Path.joinpath(Path.home(), ".superfacility", "ratelimit.json")
+
+
+class FileBackend:
+    def __init__(self, path: str = None):
+        """Token buckets shared by every process using the same file
+
+        The buckets are kept in a small JSON file guarded by flock, point it
+        at /dev/shm to keep it in shared memory.
+
+        Parameters
+        ----------
+        path : str, optional
+            File to keep the buckets in, by default ~/.superfacility/ratelimit.json
+        """
+        if not HAVE_FCNTL:
+            raise ImportError("FileBackend needs fcntl, which isn't available on this platform")
+        self.path = default_ratelimit_path() if path is None else Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+
+    def take(self, name: str, rate: float, burst: float) -> float:
+        """Takes a token from a bucket
+
+        Returns
+        -------
+        float
+            0 if a token was taken, else seconds until one is available
+        """
+        with open(self.path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            f.seek(0)
+            try:
+                buckets = json.loads(f.read() or '{}')
+            except ValueError:
+                buckets = {}
+            state, wait = _take(buckets.get(name), time.time(), rate, burst)
+            buckets[name] = state
+            f.seek(0)
+            f.truncate()
+            json.dump(buckets, f)
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, rates: Dict[str, Tuple[float, float]] = None, backend=None):
+        """Token bucket rate limiter with a budget per endpoint class
+
+        Requests waiting on the same budget go out in priority order, then
+        in the order they arrived. Set the priority of a block of calls with
+        request_priority.
+
+        Parameters
+        ----------
+        rates : Dict[str, Tuple[float, float]], optional
+            Endpoint class -> (requests per second, burst), merged over DEFAULT_RATES.
+            A rate of None leaves that class unlimited.
+        backend : MemoryBackend or FileBackend, optional
+            Where the buckets are kept, by default MemoryBackend()
+        """
+        self.rates = dict(DEFAULT_RATES)
+        if rates is not None:
+            self.rates.update(rates)
+        self.backend = MemoryBackend() if backend is None else backend
+
+        self._cond = threading.Condition()
+        self._waiting = {}
+        # Waiting coroutines, entry -> (their loop, event to wake them)
+        self._wakeups = {}
+        self._order = itertools.count()
+        self.throttled = 0
+        self.waited = 0.0
+
+    def acquire(self, url: str, priority: int = None) -> float:
+        """Blocks until a request to url fits in its budget
+
+        Parameters
+        ----------
+        url : str
+            Full or sub url of the request
+        priority : int, optional
+            Priority of the request, by default current_priority()
+
+        Returns
+        -------
+        float
+            Seconds spent waiting
+        """
+        name = endpoint_class(url)
+        rate = self.rates.get(name)
+        if rate is None or rate[0] is None:
+            return 0.0
+
+        entry = (current_priority() if priority is None else priority, next(self._order))
+        start = time.monotonic()
+        throttled = False
+        with self._cond:
+            queue = self._waiting.setdefault(name, [])
+            heapq.heappush(queue, entry)
+            try:
+                while True:
+                    wait = None
+                    if queue[0] == entry:
+                        # Only the head takes, so the lock isn't held through the backend's I/O
+                        self._cond.release()
+                        try:
+                            wait = self.backend.take(name, *rate)
+                        finally:
+                            self._cond.acquire()
+                        if wait <= 0:
+                            break
+                    throttled = True
+                    self._cond.wait(wait)
+            finally:
+                self.__leave(queue, entry)
+
+            if not throttled:
+                return 0.0
+            waited = time.monotonic() - start
+            self.throttled += 1
+            self.waited += waited
+        return waited
+
+    async def acquire_async(self, url: str, priority: int = None) -> float:
+        """Waits, without blocking the event loop, until a request to url fits in its budget
+
+        Shares the budgets and the priority order with acquire. Backends other
+        than MemoryBackend, e.g. FileBackend with its flock, are called from
+        the default executor so their I/O doesn't block the loop.
+
+        Parameters
+        ----------
+        url : str
+            Full or sub url of the request
+        priority : int, optional
+            Priority of the request, by default current_priority()
+
+        Returns
+        -------
+        float
+            Seconds spent waiting
+        """
+        name = endpoint_class(url)
+        rate = self.rates.get(name)
+        if rate is None or rate[0] is None:
+            return 0.0
+
+        entry = (current_priority() if priority is None else priority, next(self._order))
+        wakeup = asyncio.Event()
+        start = time.monotonic()
+        throttled = False
+        with self._cond:
+            queue = self._waiting.setdefault(name, [])
+            heapq.heappush(queue, entry)
+            self._wakeups[entry] = (asyncio.get_running_loop(), wakeup)
+        try:
+            while True:
+                with self._cond:
+                    # Cleared first so a wakeup from here on isn't missed
+                    wakeup.clear()
+                    head = queue[0] == entry
+                wait = None
+                if head:
+                    wait = await self.__take_async(name, rate)
+                    if wait <= 0:
+                        break
+                throttled = True
+                try:
+                    await asyncio.wait_for(wakeup.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            with self._cond:
+                self.__leave(queue, entry)
+
+        if not throttled:
+            return 0.0
+        waited = time.monotonic() - start
+        with self._cond:
+            self.throttled += 1
+            self.waited += waited
+        return waited
+
+    async def __take_async(self, name: str, rate: Tuple[float, float]) -> float:
+        if isinstance(self.backend, MemoryBackend):
+            return self.backend.take(name, *rate)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.backend.take, name, *rate)
+
+    def __leave(self, queue: list, entry: Tuple[int, int]) -> None:
+        # Takes entry out of the line, holding _cond, and wakes everyone waiting behind it
+        queue.remove(entry)
+        heapq.heapify(queue)
+        self._wakeups.pop(entry, None)
+        self._cond.notify_all()
+        for loop, wakeup in self._wakeups.values():
+            try:
+                loop.call_soon_threadsafe(wakeup.set)
+            except RuntimeError:
+                # Its loop is closed, nothing to wake
+                pass
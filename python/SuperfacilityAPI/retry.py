@@ -0,0 +1,215 @@
+from typing import Dict, Iterable
+from datetime import datetime, timezone
+import logging
+import random
+import threading
+import time
+
+# Responses that mean the server is busy or a proxy in front of it failed
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+# Requests that are safe to send again
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BACKOFF_FACTOR = 0.5
+DEFAULT_MAX_BACKOFF = 30
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 30
+
+# Circuit key for requests answered by the api itself rather than a site
+API_SITE = 'api'
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+
+def parse_retry_after(value: str) -> float:
+    """Parses a Retry-After header, either seconds or an HTTP date
+
+    Parameters
+    ----------
+    value : str
+        Value of the header
+
+    Returns
+    -------
+    float
+        Seconds to wait, None if missing or malformed
+    """
+    if value is None:
+        return None
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+class RetryPolicy:
+    def __init__(self, max_retries: int = DEFAULT_MAX_RETRIES,
+                 backoff_factor: float = DEFAULT_BACKOFF_FACTOR,
+                 max_backoff: float = DEFAULT_MAX_BACKOFF,
+                 statuses: Iterable[int] = RETRY_STATUSES,
+                 methods: Iterable[str] = IDEMPOTENT_METHODS):
+        """When and how long to wait before sending a request again
+
+        Only idempotent requests are retried, after a connection error or one
+        of the retry statuses. Waits are drawn uniformly from
+        [0, backoff_factor * 2**attempt] capped at max_backoff, unless the
+        server asks for a longer wait with Retry-After.
+
+        Parameters
+        ----------
+        max_retries : int, optional
+            Retries after the first attempt, by default DEFAULT_MAX_RETRIES
+        backoff_factor : float, optional
+            Seconds of the first backoff window, by default DEFAULT_BACKOFF_FACTOR
+        max_backoff : float, optional
+            Longest wait in seconds, by default DEFAULT_MAX_BACKOFF
+        statuses : Iterable[int], optional
+            Status codes to retry, by default RETRY_STATUSES
+        methods : Iterable[str], optional
+            HTTP methods to retry, by default IDEMPOTENT_METHODS
+        """
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.statuses = frozenset(statuses)
+        self.methods = frozenset(method.upper() for method in methods)
+
+    def delay(self, method: str, attempt: int, status: int = None,
+              retry_after: str = None) -> float:
+        """Seconds to wait before retrying a failed attempt
+
+        Parameters
+        ----------
+        method : str
+            HTTP method of the request
+        attempt : int
+            Number of the failed attempt, starting at 0
+        status : int, optional
+            Status code of the response, None for a connection error
+        retry_after : str, optional
+            Retry-After header of the response, by default None
+
+        Returns
+        -------
+        float
+            Seconds to wait, None if the request shouldn't be retried
+        """
+        if method.upper() not in self.methods or attempt >= self.max_retries:
+            return None
+        if status is not None and status not in self.statuses:
+            return None
+
+        backoff = random.uniform(0, min(self.max_backoff, self.backoff_factor * 2 ** attempt))
+        requested = parse_retry_after(retry_after)
+        if requested is not None:
+            return min(max(backoff, requested), self.max_backoff)
+        return backoff
+
+
+# Never retry, for callers that handle failures themselves
+NO_RETRY = RetryPolicy(max_retries=0)
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout: float = DEFAULT_RESET_TIMEOUT):
+        """Per site circuit breaker
+
+        After failure_threshold failures in a row the circuit for a site opens
+        and requests to it fail fast. Once reset_timeout seconds have passed a
+        single trial request is let through, closing the circuit if it works.
+
+        Parameters
+        ----------
+        failure_threshold : int, optional
+            Failures in a row that open the circuit, by default DEFAULT_FAILURE_THRESHOLD
+        reset_timeout : float, optional
+            Seconds to fail fast before trying the site again, by default DEFAULT_RESET_TIMEOUT
+        """
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        # site -> [failures in a row, time opened, state]
+        self._sites = {}
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.rejected = 0
+
+    def state(self, site: str) -> str:
+        """Gets the state of a site's circuit, closed, open or half-open
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+
+        Returns
+        -------
+        str
+        """
+        with self._lock:
+            entry = self._sites.get(site)
+            if entry is None:
+                return CLOSED
+            if entry[2] == OPEN and time.monotonic() - entry[1] >= self.reset_timeout:
+                return HALF_OPEN
+            return entry[2]
+
+    def allow(self, site: str) -> bool:
+        """Checks whether a request to site may be sent
+
+        Parameters
+        ----------
+        site : str
+            Name of the site
+
+        Returns
+        -------
+        bool
+        """
+        with self._lock:
+            entry = self._sites.get(site)
+            if entry is None or entry[2] == CLOSED:
+                return True
+            if entry[2] == OPEN and time.monotonic() - entry[1] >= self.reset_timeout:
+                # Let one trial request through
+                entry[2] = HALF_OPEN
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self, site: str) -> None:
+        with self._lock:
+            self._sites.pop(site, None)
+
+    def record_failure(self, site: str) -> None:
+        with self._lock:
+            entry = self._sites.setdefault(site, [0, 0.0, CLOSED])
+            entry[0] += 1
+            if entry[2] == HALF_OPEN or (entry[2] == CLOSED and entry[0] >= self.failure_threshold):
+                logging.warning(f"Opening circuit for {site} after {entry[0]} failures")
+                entry[1] = time.monotonic()
+                entry[2] = OPEN
+                self.opened += 1
+
+    def open_sites(self) -> Dict[str, str]:
+        """Sites whose circuit isn't closed
+
+        Returns
+        -------
+        Dict[str, str]
+            site -> open or half-open
+        """
+        with self._lock:
+            sites = list(self._sites)
+        return {site: state for site in sites if (state := self.state(site)) != CLOSED}
@@ -0,0 +1,140 @@
+from typing import Dict, List
+import threading
+import time
+
+# Seconds a system status is trusted before it is fetched again
+DEFAULT_STATUS_TTL = 60
+
+# Key used for the full /status list
+ALL_SYSTEMS = None
+
+
+class StatusCache:
+    def __init__(self, ttl: float = DEFAULT_STATUS_TTL, ttls: Dict[str, float] = None):
+        """TTL cache for NERSC system status
+
+        One full /status responce fills in the status of every system,
+        so per-system lookups are served from it until it expires.
+
+        Parameters
+        ----------
+        ttl : float, optional
+            Seconds to keep a status, by default DEFAULT_STATUS_TTL
+        ttls : Dict[str, float], optional
+            Seconds to keep the status of specific systems, by default None
+        """
+        self.ttl = ttl
+        self.ttls = {} if ttls is None else dict(ttls)
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def ttl_for(self, name: str = ALL_SYSTEMS) -> float:
+        """Seconds the status of a system is kept
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the system, by default the full status list
+
+        Returns
+        -------
+        float
+        """
+        return self.ttls.get(name, self.ttl)
+
+    def get(self, name: str = ALL_SYSTEMS):
+        """Gets a cached status if it hasn't expired
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the system, by default the full status list
+
+        Returns
+        -------
+        Dict or List or None
+            The status, None if missing or expired
+        """
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return None
+
+            stored, status = entry
+            if time.monotonic() - stored >= self.ttl_for(name):
+                del self._entries[name]
+                return None
+
+            return status
+
+    def put(self, name: str, status: Dict) -> None:
+        """Stores the status of one system
+
+        Parameters
+        ----------
+        name : str
+            Name of the system
+        status : Dict
+            Status responce for the system
+        """
+        with self._lock:
+            self._entries[name] = (time.monotonic(), status)
+
+    def put_all(self, statuses: List[Dict]) -> None:
+        """Stores a full /status responce and the status of every system in it
+
+        Parameters
+        ----------
+        statuses : List[Dict]
+            Responce from /status
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._entries[ALL_SYSTEMS] = (now, statuses)
+            for status in statuses:
+                if isinstance(status, dict) and 'name' in status:
+                    self._entries[status['name']] = (now, status)
+
+    def invalidate(self, name: str = ALL_SYSTEMS) -> None:
+        """Drops cached statuses
+
+        Parameters
+        ----------
+        name : str, optional
+            Name of the system to drop, by default drops everything
+        """
+        with self._lock:
+            if name is ALL_SYSTEMS:
+                self._entries.clear()
+            else:
+                self._entries.pop(name, None)
+
+
+def group_by_system(entries) -> Dict[str, List[Dict]]:
+    """Splits a bulk notes/outages responce into the entries of each system
+
+    Parameters
+    ----------
+    entries : List
+        Responce from /status/notes, /status/outages or /status/outages/planned,
+        a list of entries or of lists of entries with a name field
+
+    Returns
+    -------
+    Dict[str, List[Dict]]
+        System name -> entries, None if the responce isn't shaped like that
+    """
+    if not isinstance(entries, list):
+        return None
+
+    grouped = {}
+    pending = list(entries)
+    while pending:
+        entry = pending.pop(0)
+        if isinstance(entry, list):
+            pending[:0] = entry
+        elif isinstance(entry, dict) and 'name' in entry:
+            grouped.setdefault(entry['name'], []).append(entry)
+        else:
+            return None
+    return grouped
@@ -0,0 +1,295 @@
+from typing import Dict, Iterable, Iterator
+import base64
+import binascii
+import codecs
+import json
+from json.decoder import scanstring
+
+# Bytes read from the socket at a time when streaming
+DEFAULT_CHUNK_SIZE = 1 << 20
+
+_decoder = json.JSONDecoder()
+_WHITESPACE = ' \t\n\r'
+
+
+def iter_text(byte_chunks: Iterable[bytes], encoding: str = 'utf-8') -> Iterator[str]:
+    """Decodes a stream of bytes into text without splitting characters
+
+    Parameters
+    ----------
+    byte_chunks : Iterable[bytes]
+        Raw chunks, e.g. from requests.Response.iter_content
+    encoding : str, optional
+        Encoding of the stream, by default 'utf-8'
+
+    Yields
+    ------
+    str
+    """
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for chunk in byte_chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b'', final=True)
+    if text:
+        yield text
+
+
+def rechunk(pieces: Iterable[bytes], chunk_size: int = DEFAULT_CHUNK_SIZE) -> Iterator[bytes]:
+    """Regroups a stream of bytes into fixed size chunks, the last one may be shorter
+
+    Parameters
+    ----------
+    pieces : Iterable[bytes]
+        Bytes of any size
+    chunk_size : int, optional
+        Size of the chunks, by default DEFAULT_CHUNK_SIZE
+
+    Yields
+    ------
+    bytes
+    """
+    buffer = bytearray()
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_size:
+            yield bytes(buffer[:chunk_size])
+            del buffer[:chunk_size]
+    if buffer:
+        yield bytes(buffer)
+
+
+def iter_base64(pieces: Iterable[str]) -> Iterator[bytes]:
+    """Decodes base64 text incrementally
+
+    Parameters
+    ----------
+    pieces : Iterable[str]
+        base64 text in pieces of any size
+
+    Yields
+    ------
+    bytes
+    """
+    pending = ''
+    for piece in pieces:
+        pending += ''.join(piece.split())
+        usable = len(pending) - len(pending) % 4
+        if usable:
+            yield base64.b64decode(pending[:usable])
+            pending = pending[usable:]
+    if pending:
+        try:
+            yield base64.b64decode(pending)
+        except binascii.Error as err:
+            raise ValueError(f"Truncated base64 data {err}")
+
+
+def _escape_start(text: str, start: int, index: int) -> bool:
+    # Whether the backslash at index starts an escape, rather than ends a \\
+    run = index
+    while run > start and text[run - 1] == '\\':
+        run -= 1
+    return (index - run) % 2 == 0
+
+
+def _complete_end(text: str, start: int) -> int:
+    """End of the part of JSON string text from start that can be decoded on its own
+
+    Leaves out an escape cut off at the end of the text, and a high surrogate
+    whose low half may still come.
+    """
+    end = len(text)
+    index = text.rfind('\\', max(start, end - 5), end)
+    if index != -1 and _escape_start(text, start, index):
+        if end - index < (6 if text[index + 1:index + 2] in ('u', '') else 2):
+            end = index
+
+    index = end - 6
+    if index >= start and text[index:index + 2] == '\\u' and text[index + 2] in 'dD' and \
+            text[index + 3] in '89abAB' and _escape_start(text, start, index):
+        end = index
+    return end
+
+
+class JsonObjectStream:
+    def __init__(self, text_chunks: Iterable[str], stream_key: str):
+        """Reads a JSON object from a stream, handing out one value in pieces
+
+        Iterating gives the decoded value of stream_key as it arrives, pieces
+        of text for a string or one element at a time for an array. The other
+        values of the object are small and end up in fields once the
+        iteration is done.
+
+        Parameters
+        ----------
+        text_chunks : Iterable[str]
+            JSON text of a single object in pieces of any size
+        stream_key : str
+            Key of the string or array value to hand out in pieces
+        """
+        self.stream_key = stream_key
+        self.fields = {}
+        self._chunks = iter(text_chunks)
+        self._buf = ''
+        self._pos = 0
+
+    def _fill(self) -> bool:
+        # Drop what has been parsed already so memory stays bounded
+        self._buf = self._buf[self._pos:]
+        self._pos = 0
+        for chunk in self._chunks:
+            if chunk:
+                self._buf += chunk
+                return True
+        return False
+
+    def _peek(self) -> str:
+        while True:
+            while self._pos < len(self._buf) and self._buf[self._pos] in _WHITESPACE:
+                self._pos += 1
+            if self._pos < len(self._buf):
+                return self._buf[self._pos]
+            if not self._fill():
+                raise ValueError("Unexpected end of JSON stream")
+
+    def _expect(self, char: str) -> None:
+        if self._peek() != char:
+            raise ValueError(
+                f"Expected {char!r} in JSON stream, got {self._buf[self._pos]!r}")
+        self._pos += 1
+
+    def _value(self):
+        self._peek()
+        while True:
+            try:
+                value, end = _decoder.raw_decode(self._buf, self._pos)
+            except json.JSONDecodeError:
+                if self._fill():
+                    continue
+                raise
+            # A number could continue in the next chunk
+            if end == len(self._buf) and not isinstance(value, (str, dict, list)):
+                if self._fill():
+                    continue
+            self._pos = end
+            return value
+
+    def _string(self) -> Iterator[str]:
+        # Opening quote is already consumed. Each buffer is decoded with one call
+        # into the json C scanner, so escapes cost what they do in json.loads.
+        while True:
+            buf, pos = self._buf, self._pos
+            try:
+                value, end = scanstring(buf, pos, False)
+            except json.JSONDecodeError:
+                # The closing quote is in a later chunk
+                pass
+            else:
+                if value:
+                    yield value
+                self._pos = end
+                return
+
+            end = _complete_end(buf, pos)
+            if end > pos:
+                # Raises for an invalid escape
+                yield json.loads(f'"{buf[pos:end]}"', strict=False)
+                self._pos = end
+            if not self._fill():
+                raise ValueError("Unterminated string in JSON stream")
+
+    def _array(self) -> Iterator:
+        # Opening bracket is already consumed
+        if self._peek() == ']':
+            self._pos += 1
+            return
+        while True:
+            yield self._value()
+            if self._peek() == ']':
+                self._pos += 1
+                return
+            self._expect(',')
+
+    def __iter__(self) -> Iterator:
+        self._expect('{')
+        if self._peek() == '}':
+            self._pos += 1
+            return
+
+        while True:
+            key = self._value()
+            self._expect(':')
+
+            if key == self.stream_key and self._peek() in '"[':
+                self._pos += 1
+                yield from self._string() if self._buf[self._pos - 1] == '"' else self._array()
+                self.fields[key] = None
+            else:
+                self.fields[key] = self._value()
+
+            if self._peek() == '}':
+                self._pos += 1
+                return
+            self._expect(',')
+
+
+def iter_json_string(text_chunks: Iterable[str], key: str, fields: Dict = None) -> Iterator[str]:
+    """Streams the string value of key from a JSON object
+
+    Parameters
+    ----------
+    text_chunks : Iterable[str]
+        JSON text of a single object
+    key : str
+        Key of the string value to stream
+    fields : Dict, optional
+        Filled in with the other values of the object, by default None
+
+    Yields
+    ------
+    str
+    """
+    stream = JsonObjectStream(text_chunks, key)
+    yield from stream
+    if fields is not None:
+        fields.update(stream.fields)
+
+
+def iter_json_array(text_chunks: Iterable[str], key: str, fields: Dict = None,
+                    batch_size: int = None) -> Iterator:
+    """Streams the elements of the array value of key from a JSON object
+
+    Only the element being parsed and the current batch are held in memory,
+    not the whole array.
+
+    Parameters
+    ----------
+    text_chunks : Iterable[str]
+        JSON text of a single object
+    key : str
+        Key of the array value to stream
+    fields : Dict, optional
+        Filled in with the other values of the object, by default None
+    batch_size : int, optional
+        Yield lists of up to batch_size elements instead of single ones, by default None
+
+    Yields
+    ------
+    object or List
+    """
+    stream = JsonObjectStream(text_chunks, key)
+    if batch_size is None:
+        yield from stream
+    else:
+        batch = []
+        for element in stream:
+            batch.append(element)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+    if fields is not None:
+        fields.update(stream.fields)
@@ -0,0 +1,344 @@
+from typing import Callable, Dict, List
+from concurrent.futures import Future
+import asyncio
+import concurrent.futures
+import logging
+import threading
+import time
+
+# Consecutive failed polls before the outstanding futures are failed
+MAX_POLL_FAILURES = 5
+
+
+class Backoff:
+    def __init__(self, initial: float = 0.5, factor: float = 1.5,
+                 ceiling: float = 10.0):
+        """Poll interval which starts quick and grows toward a ceiling
+
+        Parameters
+        ----------
+        initial : float, optional
+            First interval in seconds, by default 0.5
+        factor : float, optional
+            Growth of the interval after each poll, by default 1.5
+        ceiling : float, optional
+            Largest interval in seconds, by default 10.0
+        """
+        self.initial = initial
+        self.factor = factor
+        self.ceiling = ceiling
+        self.interval = initial
+
+    def reset(self) -> None:
+        """Go back to polling quickly
+        """
+        self.interval = self.initial
+
+    def next(self) -> float:
+        """Gets the next interval and grows the one after it
+
+        Returns
+        -------
+        float
+        """
+        interval = self.interval
+        self.interval = min(self.interval * self.factor, self.ceiling)
+        return interval
+
+
+def task_list(resp) -> List[Dict]:
+    """Gets the list of tasks from a /tasks responce
+
+    Parameters
+    ----------
+    resp : Dict or List
+        Responce from GET /tasks
+
+    Returns
+    -------
+    List[Dict]
+    """
+    if isinstance(resp, dict):
+        return resp.get('tasks', [])
+    return resp or []
+
+
+def completed_tasks(tasks: List[Dict], pending) -> List[Dict]:
+    """Picks out the tasks which are pending and have completed
+
+    Parameters
+    ----------
+    tasks : List[Dict]
+        Tasks from GET /tasks
+    pending : Container
+        task_ids, as strings, being waited on
+
+    Returns
+    -------
+    List[Dict]
+    """
+    return [task for task in tasks
+            if str(task.get('id')) in pending and task.get('status') == 'completed']
+
+
+class TaskPoller:
+    def __init__(self, fetch_tasks: Callable[[], List[Dict]],
+                 backoff: Backoff = None):
+        """Tracks outstanding SuperfacilityAPI tasks with one poll of /tasks per tick
+
+        A background thread polls while any task is outstanding and stops
+        when nothing is left to wait on.
+
+        Parameters
+        ----------
+        fetch_tasks : Callable[[], List[Dict]]
+            Gets every task from the api, normally GET /tasks
+        backoff : Backoff, optional
+            Interval between polls, by default Backoff()
+        """
+        self.fetch_tasks = fetch_tasks
+        self.backoff = Backoff() if backoff is None else backoff
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def submit(self, task_id, callback: Callable[[Dict], None] = None) -> Future:
+        """Start tracking a task
+
+        Parameters
+        ----------
+        task_id : int or str
+            SuperfacilityAPI task number
+        callback : Callable[[Dict], None], optional
+            Called with the task once it has completed, by default None
+
+        Returns
+        -------
+        Future
+            Resolves to the task dict when its status is completed
+        """
+        future = Future()
+        if callback is not None:
+            future.add_done_callback(
+                lambda f: not f.cancelled() and f.exception() is None and callback(f.result()))
+
+        with self._lock:
+            self._pending.setdefault(str(task_id), []).append(future)
+            # New tasks usually finish quickly, so poll quickly again
+            self.backoff.reset()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True,
+                                                name="sfapi-task-poller")
+                self._thread.start()
+        self._wakeup.set()
+
+        return future
+
+    def wait(self, task_id, timeout: float = None) -> Dict:
+        """Waits for a task to complete
+
+        Parameters
+        ----------
+        task_id : int or str
+            SuperfacilityAPI task number
+        timeout : float, optional
+            Seconds to wait, by default None waits forever
+
+        Returns
+        -------
+        Dict
+            The completed task
+
+        Raises
+        ------
+        concurrent.futures.TimeoutError
+            If the task isn't completed within timeout
+        """
+        future = self.submit(task_id)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            self.cancel(task_id, future)
+            raise
+
+    def cancel(self, task_id, future: Future = None) -> None:
+        """Stop tracking a task, or just one future waiting on it
+        """
+        with self._lock:
+            futures = self._pending.get(str(task_id), [])
+            for fut in list(futures):
+                if future is None or fut is future:
+                    futures.remove(fut)
+                    fut.cancel()
+            if not futures:
+                self._pending.pop(str(task_id), None)
+
+    def poll(self) -> int:
+        """Polls /tasks once and resolves every completed task
+
+        Returns
+        -------
+        int
+            Number of tasks resolved
+        """
+        tasks = self.fetch_tasks()
+        with self._lock:
+            done = completed_tasks(tasks, self._pending)
+            resolved = [(task, self._pending.pop(str(task['id']), []))
+                        for task in done]
+
+        for task, futures in resolved:
+            for future in futures:
+                if not future.done():
+                    future.set_result(task)
+
+        return len(resolved)
+
+    def _fail_all(self, err: Exception) -> None:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for futures in pending.values():
+            for future in futures:
+                if not future.done():
+                    future.set_exception(err)
+
+    def _run(self) -> None:
+        failures = 0
+        while True:
+            with self._lock:
+                if not self._pending:
+                    self._thread = None
+                    return
+                delay = self.backoff.next()
+
+            target = time.monotonic() + delay
+            while True:
+                remaining = target - time.monotonic()
+                if remaining <= 0:
+                    break
+                if self._wakeup.wait(remaining):
+                    self._wakeup.clear()
+                    # A new task came in, poll it soon without delaying the others
+                    target = min(target, time.monotonic() + self.backoff.initial)
+
+            try:
+                self.poll()
+                failures = 0
+            except Exception as err:
+                failures += 1
+                logging.warning(f"Polling tasks failed {type(err).__name__}: {err}")
+                if failures >= MAX_POLL_FAILURES:
+                    self._fail_all(err)
+
+
+class AsyncTaskPoller:
+    def __init__(self, fetch_tasks, backoff: Backoff = None):
+        """asyncio version of TaskPoller
+
+        Parameters
+        ----------
+        fetch_tasks : Callable[[], Awaitable[List[Dict]]]
+            Coroutine function getting every task from the api
+        backoff : Backoff, optional
+            Interval between polls, by default Backoff()
+        """
+        self.fetch_tasks = fetch_tasks
+        self.backoff = Backoff() if backoff is None else backoff
+        self._pending = {}
+        self._wakeup = None
+        self._runner = None
+
+    def submit(self, task_id) -> "asyncio.Future":
+        """Start tracking a task
+
+        Parameters
+        ----------
+        task_id : int or str
+            SuperfacilityAPI task number
+
+        Returns
+        -------
+        asyncio.Future
+            Resolves to the task dict when its status is completed
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.setdefault(str(task_id), []).append(future)
+        self.backoff.reset()
+
+        if self._wakeup is None:
+            self._wakeup = asyncio.Event()
+        self._wakeup.set()
+        if self._runner is None or self._runner.done():
+            self._runner = loop.create_task(self._run())
+
+        return future
+
+    async def wait(self, task_id, timeout: float = None) -> Dict:
+        """Waits for a task to complete
+
+        Raises
+        ------
+        asyncio.TimeoutError
+            If the task isn't completed within timeout
+        """
+        future = self.submit(task_id)
+        try:
+            return await asyncio.wait_for(future, timeout)
+        finally:
+            futures = self._pending.get(str(task_id), [])
+            if future in futures:
+                futures.remove(future)
+            if not futures:
+                self._pending.pop(str(task_id), None)
+
+    async def poll(self) -> int:
+        """Polls /tasks once and resolves every completed task
+
+        Returns
+        -------
+        int
+            Number of tasks resolved
+        """
+        tasks = await self.fetch_tasks()
+        done = completed_tasks(tasks, self._pending)
+        for task in done:
+            for future in self._pending.pop(str(task['id']), []):
+                if not future.done():
+                    future.set_result(task)
+
+        return len(done)
+
+    async def _run(self) -> None:
+        failures = 0
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            target = loop.time() + self.backoff.next()
+            while True:
+                remaining = target - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), remaining)
+                    self._wakeup.clear()
+                    # A new task came in, poll it soon without delaying the others
+                    target = min(target, loop.time() + self.backoff.initial)
+                except asyncio.TimeoutError:
+                    pass
+
+            try:
+                await self.poll()
+                failures = 0
+            except Exception as err:
+                failures += 1
+                logging.warning(f"Polling tasks failed {type(err).__name__}: {err}")
+                if failures >= MAX_POLL_FAILURES:
+                    pending, self._pending = self._pending, {}
+                    for futures in pending.values():
+                        for future in futures:
+                            if not future.done():
+                                future.set_exception(err)
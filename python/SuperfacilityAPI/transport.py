@@ -0,0 +1,357 @@
+from typing import Dict, Tuple, Union
+import logging
+import threading
+import time
+import urllib.parse
+
+from .lazy import lazy_import
+from .SuperfacilityAccessToken import SuperfacilityAccessToken
+from .SuperfacilityErrors import (
+    warning_fourOfour,
+    no_client,
+    FourOfourException,
+    InternalServerError,
+    NoClientException,
+    ApiTokenError,
+    SuperfacilityCircuitOpen,
+    SuperfacilityRateLimited
+)
+from .endpoints import endpoint_site
+from .retry import RetryPolicy, CircuitBreaker, API_SITE
+from .ratelimit import RateLimiter
+from .instrument import Instrumentation
+
+requests = lazy_import('requests')
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (5, 60)
+# Number of keep-alive connections kept open per host
+DEFAULT_POOL_MAXSIZE = 10
+
+
+class SuperfacilityTransport:
+    headers = None
+
+    def __init__(self, pool_connections: int = 4,
+                 pool_maxsize: int = DEFAULT_POOL_MAXSIZE,
+                 timeout: Union[float, Tuple[float, float]] = DEFAULT_TIMEOUT,
+                 session: "requests.Session" = None,
+                 retry: RetryPolicy = None,
+                 breaker: CircuitBreaker = None,
+                 rate_limiter: RateLimiter = None,
+                 instrumentation: Instrumentation = None):
+        """Pooled, keep-alive HTTP transport used by SuperfacilityAPI
+
+        Idempotent requests are retried with backoff on connection errors and
+        busy responses, and requests to a site that keeps failing are
+        rejected by its circuit breaker without being sent.
+
+        Parameters
+        ----------
+        pool_connections : int, optional
+            Number of hosts to keep connection pools for, by default 4
+        pool_maxsize : int, optional
+            Number of keep-alive connections kept per host, by default DEFAULT_POOL_MAXSIZE
+        timeout : float or (float, float), optional
+            Connect and read timeouts in seconds, by default DEFAULT_TIMEOUT
+        session : requests.Session, optional
+            Session to send requests with, by default a new one is created
+        retry : RetryPolicy, optional
+            When to retry failed requests, by default RetryPolicy()
+        breaker : CircuitBreaker, optional
+            Per site circuit breaker, by default CircuitBreaker()
+        rate_limiter : RateLimiter, optional
+            Budgets for each endpoint class, by default None (no limit)
+        instrumentation : Instrumentation, optional
+            Request hooks and metrics, by default a new Instrumentation()
+        """
+        self.timeout = timeout
+        self.retry = RetryPolicy() if retry is None else retry
+        self.breaker = CircuitBreaker() if breaker is None else breaker
+        self.rate_limiter = rate_limiter
+        self.instrumentation = Instrumentation() if instrumentation is None else instrumentation
+        self.retries = 0
+        self.headers = {'accept': 'application/json',
+                        'Content-Type': 'application/x-www-form-urlencoded'}
+
+        # The session is built on first use, so creating a client doesn't import requests
+        self._session = session
+        self._pool = (pool_connections, pool_maxsize)
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self) -> "requests.Session":
+        """Pooled session the requests are sent with
+        """
+        if self._pool is not None:
+            with self._session_lock:
+                if self._pool is not None:
+                    session = requests.Session() if self._session is None else self._session
+                    pool_connections, pool_maxsize = self._pool
+                    adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections,
+                                                            pool_maxsize=pool_maxsize)
+                    session.mount('https://', adapter)
+                    session.mount('http://', adapter)
+                    self._session = session
+                    self._pool = None
+        return self._session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self) -> None:
+        """Closes all pooled connections
+        """
+        if self._session is not None:
+            self._session.close()
+
+    @property
+    def counters(self) -> Dict:
+        """Retries sent, circuits opened, requests rejected by an open circuit and the sites currently open
+        """
+        return {'retries': self.retries,
+                'circuits_opened': self.breaker.opened,
+                'circuit_rejections': self.breaker.rejected,
+                'open_circuits': self.breaker.open_sites()}
+
+    def auth_headers(self, token=None, header: Dict = None) -> Dict:
+        """Builds the headers for a request, including the Authorization header.
+
+        Parameters
+        ----------
+        token : str or SuperfacilityAccessToken
+            Token to authorize the request with
+        header : Dict, optional
+            Extra headers which override the defaults, by default None
+
+        Returns
+        -------
+        Dict
+        """
+        headers = dict(self.headers)
+        if isinstance(token, str):
+            headers['Authorization'] = f'Bearer {token}'
+        elif isinstance(token, SuperfacilityAccessToken):
+            headers['Authorization'] = f'Bearer {token.token}'
+        else:
+            raise PermissionError("No Token Provided")
+
+        if header is not None:
+            headers.update(header)
+
+        return headers
+
+    def request(self, method: str, url: str, token=None,
+                header: Dict = None, data: Dict = None,
+                stream: bool = False, files: Dict = None) -> "requests.Response":
+        """Sends a request over the pooled session and maps HTTP errors to SuperfacilityErrors.
+
+        Parameters
+        ----------
+        method : str
+            HTTP method, GET/POST/DELETE
+        url : str
+            Fully qualified url to send the request to
+        token : str or SuperfacilityAccessToken
+            Token to authorize the request with
+        header : Dict, optional
+            Extra headers for the request, by default None
+        data : Dict, optional
+            Form data to urlencode into the body, by default None
+        stream : bool, optional
+            Leave the body unread so it can be streamed, the request is reported
+            to the instrumentation once the body is read or the response closed,
+            by default False
+        files : Dict, optional
+            Files to send as multipart/form-data along with data, by default None
+
+        Returns
+        -------
+        requests.Response
+        """
+        headers = self.auth_headers(token, header)
+        body = None
+        if files is not None:
+            # requests builds the multipart body and its Content-Type
+            headers.pop('Content-Type', None)
+            body = data
+        elif method != 'GET' and method != 'DELETE':
+            body = "" if data is None else urllib.parse.urlencode(data)
+
+        event = self.instrumentation.before(method, url)
+        try:
+            resp = self.__send(method, url, headers, body, stream, files, event)
+        except BaseException as err:
+            self.instrumentation.after(event, error=err)
+            raise
+
+        try:
+            self.raise_for_status(resp, url, token)
+        except BaseException as err:
+            self.instrumentation.after(event, status=resp.status_code, error=err)
+            raise
+        if stream:
+            report_when_read(resp, self.instrumentation, event)
+        else:
+            self.instrumentation.after(event, status=resp.status_code, nbytes=len(resp.content))
+        return resp
+
+    def __send(self, method: str, url: str, headers: Dict, body: str,
+               stream: bool, files: Dict, event: Dict) -> "requests.Response":
+        """PRIVATE: Sends a request, retrying it as the policy allows, and counts the retries in event
+        """
+        site = endpoint_site(url) or API_SITE
+        attempt = 0
+        while True:
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(url)
+            # Checked last, a half-open circuit lets its trial through only once it is sent
+            if not self.breaker.allow(site):
+                raise SuperfacilityCircuitOpen(
+                    f"{site} is failing, not sending {method} {url}")
+
+            try:
+                resp = self.session.request(method, url, headers=headers, data=body,
+                                            files=files, timeout=self.timeout, stream=stream)
+            except requests.exceptions.TooManyRedirects as err:
+                self.breaker.record_failure(site)
+                logging.warning(f"TooManyRedirects {err}")
+                raise InternalServerError(f"TooManyRedirects {err}")
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as err:
+                self.breaker.record_failure(site)
+                delay = self.retry.delay(method, attempt)
+                if delay is None:
+                    raise
+                logging.warning(f"{method} {url} failed {type(err).__name__}, retrying in {delay:.1f}s")
+            except BaseException:
+                # No response, count it so a half-open circuit doesn't wait for one forever
+                self.breaker.record_failure(site)
+                raise
+            else:
+                if resp.status_code >= 500:
+                    self.breaker.record_failure(site)
+                else:
+                    self.breaker.record_success(site)
+
+                delay = self.retry.delay(method, attempt, resp.status_code,
+                                         resp.headers.get('Retry-After'))
+                if delay is None:
+                    break
+                logging.warning(f"{method} {url} returned {resp.status_code}, retrying in {delay:.1f}s")
+                resp.close()
+
+            self.retries += 1
+            attempt += 1
+            event['retries'] = attempt
+            time.sleep(delay)
+
+        return resp
+
+    @staticmethod
+    def raise_for_status(resp: "requests.Response", url: str, token=None) -> None:
+        """Raises the SuperfacilityError matching the response status code.
+
+        Parameters
+        ----------
+        resp : requests.Response
+            Response to check
+        url : str
+            Url the response came from, used in error messages
+        token : str or SuperfacilityAccessToken, optional
+            Token used for the request, by default None
+        """
+        try:
+            # Raise error based on reposnce status [200 OK] [500 err]
+            resp.raise_for_status()
+        except requests.exceptions.HTTPError as err:
+            check_status_code(resp.status_code, url, token, err)
+
+
+def report_when_read(resp: "requests.Response", instrumentation: Instrumentation, event: Dict) -> None:
+    """Finishes the event of a streamed response once its body is read or it is closed
+
+    So the duration covers reading the body and the bytes are those read,
+    rather than the time to the headers and the Content-Length.
+
+    Parameters
+    ----------
+    resp : requests.Response
+        Streamed response, its iter_content and close are wrapped
+    instrumentation : Instrumentation
+        Instrumentation the event was started on
+    event : Dict
+        Event from instrumentation.before
+    """
+    iter_content, close = resp.iter_content, resp.close
+    nbytes = 0
+    reported = False
+
+    def report(error: BaseException = None) -> None:
+        nonlocal reported
+        if not reported:
+            reported = True
+            instrumentation.after(event, status=resp.status_code, nbytes=nbytes, error=error)
+
+    def counted(*args, **kwargs):
+        nonlocal nbytes
+        try:
+            for chunk in iter_content(*args, **kwargs):
+                nbytes += len(chunk) if isinstance(chunk, bytes) else len(chunk.encode())
+                yield chunk
+        except Exception as err:
+            report(err)
+            raise
+        report()
+
+    def closing() -> None:
+        try:
+            close()
+        finally:
+            report()
+
+    resp.iter_content = counted
+    resp.close = closing
+
+
+def check_status_code(status: int, url: str, token=None, err=None) -> None:
+    """Raises the SuperfacilityError matching an HTTP error status code.
+
+    Parameters
+    ----------
+    status : int
+        HTTP status code of the response
+    url : str
+        Url the response came from, used in error messages
+    token : str or SuperfacilityAccessToken, optional
+        Token used for the request, by default None
+    err : Exception, optional
+        Error raised by the http client, used in error messages, by default None
+    """
+    if status < 400:
+        return
+
+    if status == 404:
+        logging.warning(warning_fourOfour.format(url))
+        raise FourOfourException(f"404 not found {url}")
+    elif status == 403:
+        logging.warning(
+            f"The security token included in the request is invalid. {err}")
+        raise ApiTokenError(
+            f"The security token included in the request is invalid.  {err}")
+    elif status == 500:
+        if token is None:
+            logging.warning(no_client)
+            raise NoClientException(no_client)
+        logging.warning(f"500 Internal Server Error {err}")
+        raise InternalServerError(f"500 Internal Server Error {err}")
+    elif status == 429:
+        logging.warning(f"429 Too many requests {err}")
+        raise SuperfacilityRateLimited(f"429 Too many requests to {url}")
+    elif status in (502, 503, 504):
+        logging.warning(f"{status} Server unavailable {err}")
+        raise InternalServerError(f"{status} Server unavailable {err}")
+    else:
+        logging.warning(f"{status} {err}")
@@ -0,0 +1,172 @@
+from typing import Dict, Iterator, List, Tuple
+from pathlib import Path
+import hashlib
+import json
+import os
+
+# Bytes sent per upload request
+DEFAULT_UPLOAD_CHUNK_SIZE = 8 << 20
+# Times missing or corrupt chunks are sent before giving up
+UPLOAD_ROUNDS = 2
+# Chunks of a file are uploaded next to it as {remote_path}{PART_SUFFIX}{index}
+PART_SUFFIX = '.sfapi-part'
+
+
+def default_manifest_dir() -> Path:
+    return Path.joinpath(Path.home(), ".superfacility", "uploads")
+
+
+def part_path(remote_path: str, index: int) -> str:
+    """Where chunk index of an upload is kept until the file is put together
+
+    Parameters
+    ----------
+    remote_path : str
+        Path of the uploaded file on the site
+    index : int
+        Number of the chunk
+
+    Returns
+    -------
+    str
+    """
+    return f"{remote_path}{PART_SUFFIX}{index:05d}"
+
+
+def iter_chunks(local_path: str, chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE,
+                skip: set = frozenset()) -> Iterator[Tuple[int, bytes]]:
+    """Reads a file one chunk at a time
+
+    Parameters
+    ----------
+    local_path : str
+        File to read
+    chunk_size : int, optional
+        Size of the chunks, by default DEFAULT_UPLOAD_CHUNK_SIZE
+    skip : set, optional
+        Numbers of chunks not to read, by default none
+
+    Yields
+    ------
+    Tuple[int, bytes]
+        Number of the chunk and its bytes
+    """
+    size = os.path.getsize(local_path)
+    count = max(1, -(-size // chunk_size))
+    with open(local_path, 'rb') as f:
+        for index in range(count):
+            if index in skip:
+                continue
+            f.seek(index * chunk_size)
+            yield index, f.read(chunk_size)
+
+
+def chunk_checksums(local_path: str, chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE) -> Tuple[List[str], str]:
+    """sha256 of every chunk of a file and of the whole file, reading it once
+
+    Parameters
+    ----------
+    local_path : str
+        File to read
+    chunk_size : int, optional
+        Size of the chunks, by default DEFAULT_UPLOAD_CHUNK_SIZE
+
+    Returns
+    -------
+    Tuple[List[str], str]
+        Hex digests of the chunks and of the file
+    """
+    whole = hashlib.sha256()
+    chunks = []
+    for _, chunk in iter_chunks(local_path, chunk_size):
+        whole.update(chunk)
+        chunks.append(hashlib.sha256(chunk).hexdigest())
+    return chunks, whole.hexdigest()
+
+
+def parse_sha256sum(output: str) -> Dict[str, str]:
+    """Reads the output of sha256sum
+
+    Parameters
+    ----------
+    output : str
+        Lines of "digest  path"
+
+    Returns
+    -------
+    Dict[str, str]
+        path -> digest
+    """
+    sums = {}
+    for line in (output or '').splitlines():
+        digest, _, path = line.partition('  ')
+        if path:
+            sums[path] = digest.lower()
+    return sums
+
+
+class UploadManifest:
+    def __init__(self, local_path: str, remote_path: str, site: str,
+                 chunk_size: int = DEFAULT_UPLOAD_CHUNK_SIZE, directory: str = None):
+        """Record of the chunks of an upload already sent, so it can resume
+
+        Kept as JSON in ~/.superfacility/uploads, and only trusted while the
+        local file has the same size and modification time.
+
+        Parameters
+        ----------
+        local_path : str
+            File being uploaded
+        remote_path : str
+            Path of the file on the site
+        site : str
+            Site uploaded to
+        chunk_size : int, optional
+            Size of the chunks, by default DEFAULT_UPLOAD_CHUNK_SIZE
+        directory : str, optional
+            Where manifests are kept, by default ~/.superfacility/uploads
+        """
+        self.local_path = str(Path(local_path).absolute())
+        self.remote_path = remote_path
+        self.site = str(site)
+        self.chunk_size = chunk_size
+        key = hashlib.sha256(f"{self.site}:{remote_path}".encode()).hexdigest()[:32]
+        self.path = Path(default_manifest_dir() if directory is None else directory) / f"{key}.json"
+
+        stat = os.stat(local_path)
+        self._source = {'local_path': self.local_path, 'size': stat.st_size,
+                        'mtime': stat.st_mtime, 'chunk_size': chunk_size}
+        self.chunks = []
+        self.sha256 = None
+        # Numbers of the chunks on the site
+        self.sent = set()
+
+    def load(self) -> bool:
+        """Reads the chunks sent by an earlier attempt
+
+        Returns
+        -------
+        bool
+            True if there was a manifest for the same file
+        """
+        try:
+            saved = json.loads(self.path.read_text())
+        except (OSError, ValueError):
+            return False
+        if saved.get('source') != self._source:
+            return False
+        self.chunks = saved['chunks']
+        self.sha256 = saved['sha256']
+        self.sent = set(saved['sent'])
+        return True
+
+    def save(self) -> None:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        part = self.path.with_suffix('.part')
+        part.write_text(json.dumps({'source': self._source, 'site': self.site,
+                                    'remote_path': self.remote_path, 'chunks': self.chunks,
+                                    'sha256': self.sha256, 'sent': sorted(self.sent)}))
+        os.replace(part, self.path)
+
+    def remove(self) -> None:
+        self.path.unlink(missing_ok=True)
@@ -0,0 +1,369 @@
+from typing import Dict, Iterator, List
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+import hashlib
+import json
+import os
+import posixpath
+import re
+import time
+
+from .SuperfacilityErrors import SuperfacilityCmdFailed, SuperfacilityError
+from .lazy import lazy_import
+
+requests = lazy_import('requests')
+
+# Submissions posted at once
+DEFAULT_MAX_IN_FLIGHT = 8
+DEPENDENCY_TYPES = ('afterok', 'afterany')
+
+_CHDIR = re.compile(r'^#SBATCH\s+(?:-D\s*|--chdir[=\s])', re.MULTILINE)
+_DEPENDENCY = re.compile(r'^#SBATCH\s+(?:-d\s*|--dependency[=\s])')
+
+
+def _header_end(lines: List[str]) -> int:
+    # Line after the script's last #SBATCH, sbatch stops reading them at the first command
+    end = 1 if lines and lines[0].startswith('#!') else 0
+    for i in range(end, len(lines)):
+        line = lines[i].strip()
+        if line and not line.startswith('#'):
+            break
+        if line.startswith('#SBATCH'):
+            end = i + 1
+    return end
+
+
+def add_directives(script: str, directives: List[str]) -> str:
+    """Adds #SBATCH lines after the ones a script already has
+
+    Later options win in sbatch, so the ones added override the script's.
+    A --dependency isn't added to a script with its own, as that would
+    silently drop one of them.
+
+    Parameters
+    ----------
+    script : str
+        Text of the batch script
+    directives : List[str]
+        Options to add, e.g. --dependency=afterok:1234
+
+    Returns
+    -------
+    str
+
+    Raises
+    ------
+    SuperfacilityCmdFailed
+        If both the script and directives have a --dependency
+    """
+    lines = script.splitlines(keepends=True)
+    end = _header_end(lines)
+    if any(directive.startswith('--dependency') for directive in directives) and \
+            any(_DEPENDENCY.match(line) for line in lines[:end]):
+        raise SuperfacilityCmdFailed("The script has its own --dependency, "
+                                     "use afterok/afterany in the workflow instead")
+    if end and not lines[end - 1].endswith('\n'):
+        lines[end - 1] += '\n'
+    return ''.join(lines[:end] + [f'#SBATCH {directive}\n' for directive in directives] + lines[end:])
+
+
+def dependency_option(parents: Dict[str, List[str]]) -> str:
+    """Builds the sbatch --dependency option for the parents of a job
+
+    Parameters
+    ----------
+    parents : Dict[str, List[str]]
+        Dependency type, e.g. afterok, -> jobids
+
+    Returns
+    -------
+    str
+        e.g. --dependency=afterok:1:2,afterany:3, None without parents
+    """
+    specs = [':'.join([kind, *map(str, jobids)]) for kind, jobids in parents.items() if jobids]
+    return None if not specs else f"--dependency={','.join(specs)}"
+
+
+class Workflow:
+    def __init__(self, sfapi, site: str, checkpoint: str = None,
+                 max_in_flight: int = DEFAULT_MAX_IN_FLIGHT):
+        """Graph of batch scripts submitted with slurm dependencies between them
+
+        Jobs are submitted as soon as the jobids of their parents are known,
+        with --dependency added to their script, so slurm holds them until
+        the parents finish. Independent branches are submitted at the same
+        time rather than one jobid after another.
+
+        With a checkpoint file every task id and jobid is written down as it
+        arrives, and submitting again after an interruption skips the jobs
+        already submitted and waits on the tasks already posted.
+
+        Parameters
+        ----------
+        sfapi : SuperfacilityAPI
+            Client to submit with
+        site : str
+            Site to submit to
+        checkpoint : str, optional
+            JSON file to keep the state of the submission in, by default None
+        max_in_flight : int, optional
+            Most submissions posted at once, by default DEFAULT_MAX_IN_FLIGHT
+        """
+        self.sfapi = sfapi
+        self.site = site
+        self.checkpoint = None if checkpoint is None else Path(checkpoint)
+        self.max_in_flight = max_in_flight
+        # name -> script, is_path, array and parents by dependency type
+        self.nodes = {}
+        # name -> task_id and jobid once known
+        self.state = {}
+
+    def add(self, name: str, script: str, is_path: bool = False,
+            afterok: List[str] = (), afterany: List[str] = (),
+            array: str = None) -> str:
+        """Adds a job to the workflow
+
+        Parameters
+        ----------
+        name : str
+            Name of the job in the workflow
+        script : str
+            Text of the batch script, a local file or with is_path a path on the site
+        is_path : bool, optional
+            script is a path on the site, by default False
+        afterok : List[str], optional
+            Jobs to start after once they completed successfully, by default none
+        afterany : List[str], optional
+            Jobs to start after once they ended in any way, by default none
+        array : str, optional
+            Submit as a job array with these indices, e.g. 0-99%10, by default None
+
+        Returns
+        -------
+        str
+            name
+        """
+        if name in self.nodes:
+            raise SuperfacilityCmdFailed(f"{name} is already in the workflow")
+        if not is_path and Path(script).is_file():
+            script = Path(script).read_text()
+        self.nodes[name] = {'script': script, 'is_path': is_path, 'array': array,
+                            'parents': {'afterok': list(afterok), 'afterany': list(afterany)}}
+        return name
+
+    @property
+    def jobids(self) -> Dict[str, str]:
+        """Jobids of the jobs submitted so far by name
+        """
+        return {name: state['jobid'] for name, state in self.state.items()
+                if state.get('jobid') is not None}
+
+    def parents(self, name: str) -> List[str]:
+        return [parent for kind in DEPENDENCY_TYPES for parent in self.nodes[name]['parents'][kind]]
+
+    def order(self) -> List[str]:
+        """Names of the jobs, every one after its parents
+
+        Raises
+        ------
+        SuperfacilityCmdFailed
+            If a parent isn't in the workflow or the dependencies have a cycle
+        """
+        children = {name: [] for name in self.nodes}
+        waiting = {}
+        for name in self.nodes:
+            parents = set(self.parents(name))
+            for parent in parents:
+                if parent not in self.nodes:
+                    raise SuperfacilityCmdFailed(f"{name} depends on {parent} which is not in the workflow")
+                children[parent].append(name)
+            waiting[name] = len(parents)
+
+        ready = [name for name, count in waiting.items() if count == 0]
+        order = []
+        while ready:
+            name = ready.pop()
+            order.append(name)
+            for child in children[name]:
+                waiting[child] -= 1
+                if waiting[child] == 0:
+                    ready.append(child)
+        if len(order) != len(self.nodes):
+            cycle = sorted(name for name, count in waiting.items() if count > 0)
+            raise SuperfacilityCmdFailed(f"Dependency cycle between {', '.join(cycle)}")
+        return order
+
+    def __digest(self, name: str) -> str:
+        # Identifies a job by everything that was submitted for it
+        node = self.nodes[name]
+        text = json.dumps([name, node['script'], node['is_path'], node['array'], node['parents']])
+        return hashlib.sha256(text.encode()).hexdigest()
+
+    def __load(self) -> None:
+        self.state = {}
+        if self.checkpoint is None or not self.checkpoint.exists():
+            return
+        saved = json.loads(self.checkpoint.read_text())
+        if saved.get('site') != str(self.site):
+            raise SuperfacilityCmdFailed(f"{self.checkpoint} is for a workflow on {saved.get('site')}")
+        for name, state in saved.get('jobs', {}).items():
+            if name not in self.nodes or state.get('digest') != self.__digest(name):
+                raise SuperfacilityCmdFailed(
+                    f"{name} changed since {self.checkpoint} was written, remove it to submit again")
+            self.state[name] = state
+
+    def __save(self) -> None:
+        if self.checkpoint is None:
+            return
+        self.checkpoint.parent.mkdir(parents=True, exist_ok=True)
+        part = self.checkpoint.with_suffix('.part')
+        part.write_text(json.dumps({'site': str(self.site), 'jobs': self.state}, indent=1))
+        os.replace(part, self.checkpoint)
+
+    def __script(self, name: str):
+        """Script and isPath to submit for a job, with its dependencies added
+        """
+        node = self.nodes[name]
+        directives = []
+        dependency = dependency_option({kind: [self.state[parent]['jobid'] for parent in parents]
+                                        for kind, parents in node['parents'].items()})
+        if dependency is not None:
+            directives.append(dependency)
+        if node['array'] is not None:
+            directives.append(f"--array={node['array']}")
+        if not directives:
+            return node['script'], node['is_path']
+
+        script = node['script']
+        if node['is_path']:
+            # Options can only be added to the text, run it from the script's directory as sbatch would
+            ret = self.sfapi.download(site=self.site, remote_path=script)
+            if ret is None or ret.get('file') is None:
+                raise SuperfacilityCmdFailed(f"Could not read {script} on {self.site}")
+            if _CHDIR.search(ret['file']) is None:
+                directives.append(f"--chdir={posixpath.dirname(script)}")
+            script = ret['file']
+        return add_directives(script, directives), False
+
+    def __post(self, name: str) -> str:
+        script, is_path = self.__script(name)
+        ret = self.sfapi.post_job(site=self.site, script=script, isPath=is_path, run_async=True)
+        if ret.get('task_id') is None:
+            raise SuperfacilityCmdFailed(f"Submitting {name} failed: {ret.get('error')}")
+        return ret['task_id']
+
+    def submit(self, timeout: float = None) -> Iterator[Dict]:
+        """Submits the jobs not submitted yet
+
+        Parameters
+        ----------
+        timeout : float, optional
+            Seconds to wait for all the submissions, by default None (no limit)
+
+        Yields
+        ------
+        Dict
+            name, task_id, jobid, error and whether it was submitted before
+            resuming, for each job as its jobid is known or it fails. Jobs
+            whose parents failed to submit aren't submitted and get an error.
+        """
+        order = self.order()
+        self.__load()
+        children = {name: [] for name in self.nodes}
+        for name in order:
+            for parent in set(self.parents(name)):
+                children[parent].append(name)
+
+        for name in order:
+            if self.state.get(name, {}).get('jobid') is not None:
+                yield dict(name=name, error=None, resumed=True, **self.state[name])
+
+        started = set()
+        failed = set()
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def ready(name):
+            return (name not in started and self.state.get(name, {}).get('jobid') is None and
+                    all(self.state.get(parent, {}).get('jobid') is not None for parent in self.parents(name)))
+
+        def start(name):
+            started.add(name)
+            task_id = self.state.get(name, {}).get('task_id')
+            if task_id is not None:
+                # Posted before the interruption, wait for it instead of posting again
+                futures[self.sfapi.task_poller.submit(task_id)] = (name, task_id)
+            else:
+                futures[pool.submit(self.__post, name)] = (name, None)
+
+        def fail(name, error):
+            # The job and everything after it are left unsubmitted
+            results = []
+            pending = [name]
+            while pending:
+                current = pending.pop()
+                if current in failed:
+                    continue
+                failed.add(current)
+                reason = error if current == name else f"{name} was not submitted"
+                results.append({'name': current, 'task_id': self.state.get(current, {}).get('task_id'),
+                                'jobid': None, 'error': reason, 'resumed': False})
+                pending.extend(children[current])
+            return results
+
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as pool:
+            futures = {}
+            for name in order:
+                if ready(name):
+                    start(name)
+
+            while futures:
+                remaining = None if deadline is None else max(deadline - time.monotonic(), 0)
+                done, _ = wait(futures, timeout=remaining, return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+
+                for future in done:
+                    name, task_id = futures.pop(future)
+                    try:
+                        result = future.result()
+                    except (SuperfacilityError, OSError, requests.exceptions.RequestException) as err:
+                        yield from fail(name, f"{type(err).__name__}: {err}")
+                        continue
+
+                    if task_id is None:
+                        # Written down before waiting so a resume doesn't post it twice
+                        self.state[name] = {'digest': self.__digest(name), 'task_id': result, 'jobid': None}
+                        self.__save()
+                        futures[self.sfapi.task_poller.submit(result)] = (name, result)
+                        continue
+
+                    jobinfo = json.loads(result['result'])
+                    if jobinfo.get('jobid') is None:
+                        # Nothing was queued, a resume posts it again
+                        self.state.pop(name, None)
+                        self.__save()
+                        yield from fail(name, jobinfo.get('error') or 'no jobid')
+                        continue
+
+                    self.state[name] = {'digest': self.__digest(name), 'task_id': task_id,
+                                        'jobid': str(jobinfo['jobid'])}
+                    self.__save()
+                    yield {'name': name, 'task_id': task_id, 'jobid': str(jobinfo['jobid']),
+                           'error': None, 'resumed': False}
+                    for child in children[name]:
+                        if child not in failed and ready(child):
+                            start(child)
+
+            for future, (name, task_id) in futures.items():
+                if task_id is not None:
+                    self.sfapi.task_poller.cancel(task_id, future)
+                else:
+                    future.cancel()
+
+        # Posts still running at the deadline have finished now, keep their tasks for a resume
+        for future, (name, task_id) in futures.items():
+            if task_id is None and not future.cancelled() and future.exception() is None:
+                self.state[name] = {'digest': self.__digest(name), 'task_id': future.result(), 'jobid': None}
+        self.__save()
+        for name, _ in futures.values():
+            yield from fail(name, f'not submitted after {timeout}s')
@@ -41,6 +41,7 @@ setup(
     version='0.3.1b',
     scripts=['python/SuperfacilityAPI/bin/sfapi'],
     install_requires=install_requires,
+    extras_require={'async': ['httpx']},
     classifiers=[
         "Programming Language :: Python :: 3",
         "Operating System :: OS Independent",
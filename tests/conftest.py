@@ -0,0 +1,10 @@
+import pytest
+
+from SuperfacilityAPI.mock_server import MockServer, MockSuperfacility
+
+
+@pytest.fixture
+def mock_server():
+    # Local stand-in for api.nersc.gov, tasks finish quickly
+    with MockServer(MockSuperfacility(task_delay=0.05)) as server:
+        yield server
@@ -0,0 +1,97 @@
+import threading
+
+import authlib.integrations.requests_client
+
+from SuperfacilityAPI import SuperfacilityAccessToken
+
+
+class FakeSession:
+    fetches = 0
+    lifetime = 600
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def fetch_token(self):
+        FakeSession.fetches += 1
+        return {'access_token': f'token{FakeSession.fetches}', 'expires_in': FakeSession.lifetime}
+
+
+def make_token(monkeypatch, lifetime=600, **kwargs):
+    FakeSession.fetches = 0
+    FakeSession.lifetime = lifetime
+    # authlib is imported when the token is fetched, so patch it at the source
+    monkeypatch.setattr(authlib.integrations.requests_client, 'OAuth2Session', FakeSession)
+    kwargs.setdefault('background_refresh', False)
+    return SuperfacilityAccessToken(client_id='cid', private_key='key', **kwargs)
+
+
+def test_token_is_cached(monkeypatch):
+    token = make_token(monkeypatch)
+    assert token.token == 'token1'
+    assert token.token == 'token1'
+    assert FakeSession.fetches == 1
+    assert 0 < token.expires_in <= 600
+
+
+def test_token_refreshes_early(monkeypatch):
+    # Margin larger than the lifetime means every read is due for a refresh
+    token = make_token(monkeypatch, refresh_margin=700)
+    assert token.token == 'token2'
+    assert FakeSession.fetches == 2
+
+
+def test_concurrent_refresh_is_single(monkeypatch):
+    token = make_token(monkeypatch)
+    token.refresh_margin = 700
+    barrier = threading.Barrier(8)
+
+    def read():
+        barrier.wait()
+        token.token
+
+    # Only lower the margin after the first refresh so later readers hit the cache
+    original = FakeSession.fetch_token
+
+    def fetch_once(self):
+        token.refresh_margin = 0
+        return original(self)
+
+    FakeSession.fetch_token = fetch_once
+    try:
+        threads = [threading.Thread(target=read) for _ in range(8)]
+        [t.start() for t in threads]
+        [t.join() for t in threads]
+    finally:
+        FakeSession.fetch_token = original
+
+    assert FakeSession.fetches == 2
+
+
+class FakeTimer:
+    started = []
+
+    def __init__(self, delay, function):
+        self.delay = delay
+        self.function = function
+        self.daemon = False
+
+    def start(self):
+        FakeTimer.started.append(self)
+
+    def cancel(self):
+        pass
+
+
+def test_short_lived_token_refresh(monkeypatch):
+    FakeTimer.started = []
+    monkeypatch.setattr(threading, 'Timer', FakeTimer)
+    # Lives shorter than the margin
+    token = make_token(monkeypatch, lifetime=20, refresh_margin=60, background_refresh=True)
+    for _ in range(3):
+        FakeTimer.started[-1].function()
+
+    # One refresh per half lifetime, rather than one a second
+    assert FakeSession.fetches == 4
+    assert all(9 <= timer.delay <= 10 for timer in FakeTimer.started)
+    token.close()
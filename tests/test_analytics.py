@@ -0,0 +1,63 @@
+import pandas as pd
+import pytest
+
+from SuperfacilityAPI.analytics import job_metrics, parse_tres, report
+from SuperfacilityAPI.SuperfacilityAPI import sacct_columns
+from SuperfacilityAPI.frames import jobs_frame, sacct_types
+
+JOBS = [
+    {'jobid': '10', 'jobidraw': '10', 'account': 'm1', 'partition': 'regular', 'user': 'alice',
+     'state': 'COMPLETED', 'submit': '2022-04-14T10:00:00', 'start': '2022-04-14T10:30:00',
+     'end': '2022-04-14T12:30:00', 'elapsedraw': '7200', 'cputimeraw': '1843200', 'totalcpu': '3-08:00:00',
+     'nnodes': '2', 'alloccpus': '256', 'reqmem': '400Gn', 'maxrss': '',
+     'alloctres': 'billing=256,cpu=256,mem=800G,node=2'},
+    {'jobid': '10.batch', 'jobidraw': '10.batch', 'maxrss': '100G'},
+    {'jobid': '10.0', 'jobidraw': '10.0', 'maxrss': '300G'},
+    {'jobid': '11', 'jobidraw': '11', 'account': 'm1', 'partition': 'gpu', 'user': 'bob',
+     'state': 'FAILED', 'submit': '2022-04-14T11:00:00', 'start': '2022-04-14T11:10:00',
+     'end': '2022-04-14T12:10:00', 'elapsedraw': '3600', 'cputimeraw': '460800', 'totalcpu': '00:00:00',
+     'nnodes': '1', 'alloccpus': '128', 'reqmem': '1000Mc', 'maxrss': '',
+     'alloctres': 'billing=128,cpu=128,node=1,gres/gpu=4'},
+    {'jobid': '12', 'jobidraw': '12', 'account': 'm2', 'partition': 'regular', 'user': 'alice',
+     'state': 'PENDING', 'submit': '2022-04-14T12:00:00', 'start': 'Unknown', 'end': 'Unknown',
+     'elapsedraw': '0', 'cputimeraw': '0', 'totalcpu': '00:00:00', 'nnodes': '1', 'alloccpus': '0',
+     'reqmem': '', 'maxrss': '', 'alloctres': ''},
+]
+
+
+def test_parse_tres():
+    tres = parse_tres(pd.Series(['cpu=128,mem=490G,node=1,gres/gpu=4', None, 'cpu=2,node=1',
+                                 'cpu=128,mem=490G,node=1,gres/gpu=4']))
+    assert tres.loc[0, 'mem'] == 490 << 30 and tres.loc[0, 'gres/gpu'] == 4
+    assert tres.loc[1].isna().all()
+    assert tres.loc[2, 'cpu'] == 2 and pd.isna(tres.loc[2, 'gres/gpu'])
+    assert tres.loc[3].equals(tres.loc[0].rename(3))
+
+
+@pytest.mark.parametrize('typed', [False, True])
+def test_job_metrics(typed):
+    frame = jobs_frame(JOBS, sacct_columns, sacct_types, projection=list(JOBS[0]), typed=typed)
+    metrics = job_metrics(frame).set_index('jobid')
+
+    assert list(metrics.index) == ['10', '11', '12']
+    assert metrics.loc['10', 'wait'] == pd.Timedelta(minutes=30)
+    assert metrics.loc['10', 'node_hours'] == 4
+    assert metrics.loc['10', 'cpu_efficiency'] == pytest.approx(288000 / 1843200)
+    assert metrics.loc['10', 'mem_peak'] == 300 << 30
+    assert metrics.loc['10', 'mem_headroom'] == pytest.approx(0.25)
+    assert metrics.loc['11', 'gpu_hours'] == 4
+    # A typed frame has lost the per cpu suffix of reqmem and takes it as the total
+    assert metrics.loc['11', 'mem_requested'] == (128 * 1000 << 20 if not typed else 1000 << 20)
+    assert pd.isna(metrics.loc['12', 'wait']) and pd.isna(metrics.loc['12', 'cpu_efficiency'])
+
+
+def test_report():
+    metrics = job_metrics(JOBS)
+    by_account = report(metrics)
+    assert list(by_account.index) == ['m1', 'm2']
+    assert by_account.loc['m1', 'jobs'] == 2 and by_account.loc['m1', 'node_hours'] == 5
+    assert by_account.loc['m1', 'cpu_efficiency'] == pytest.approx(288000 / (1843200 + 460800))
+    assert by_account.loc['m1', 'wait_mean'] == pd.Timedelta(minutes=20)
+
+    by_user = report(metrics, by=['partition', 'user'])
+    assert by_user.loc[('gpu', 'bob'), 'gpu_hours'] == 4
@@ -0,0 +1,65 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from SuperfacilityAPI import AsyncSuperfacilityAPI
+from SuperfacilityAPI.SuperfacilityErrors import SuperfacilitySiteDown
+
+
+ACTIVE = {'name': 'perlmutter', 'status': 'active', 'description': 'System is active'}
+
+
+def handler(request):
+    path = request.url.path
+    if path.endswith('/status/'):
+        return httpx.Response(200, json=[ACTIVE])
+    if path.endswith('/compute/jobs/perlmutter') and request.method == 'POST':
+        return httpx.Response(200, json={'task_id': request.headers['Authorization'][-1]})
+    if path.endswith('/tasks'):
+        result = json.dumps({'error': None, 'jobid': '1'})
+        return httpx.Response(200, json={'tasks': [{'id': '1', 'status': 'completed', 'result': result}]})
+    return httpx.Response(404)
+
+
+def mock_api():
+    client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return AsyncSuperfacilityAPI(token="abc1", client=client)
+
+
+def test_async_post_job():
+    async def run():
+        async with mock_api() as sfapi:
+            return await asyncio.gather(*[sfapi.post_job(script='/a.sh')
+                                          for _ in range(5)])
+
+    jobs = asyncio.run(run())
+    assert [job['jobid'] for job in jobs] == ['1'] * 5
+
+
+def test_async_status():
+    async def run():
+        async with mock_api() as sfapi:
+            return await sfapi.check_status('perlmutter')
+
+    assert asyncio.run(run())
+
+
+def test_async_delete_job_checks_status():
+    deleted = []
+
+    def down(request):
+        if request.url.path.endswith('/status/'):
+            return httpx.Response(200, json=[dict(ACTIVE, status='down')])
+        deleted.append(request.url.path)
+        return httpx.Response(200, json={'status': 'OK'})
+
+    async def run():
+        client = httpx.AsyncClient(transport=httpx.MockTransport(down))
+        async with AsyncSuperfacilityAPI(token="abc1", client=client) as sfapi:
+            return await sfapi.delete_job(site='perlmutter', jobid=1)
+
+    with pytest.raises(SuperfacilitySiteDown):
+        asyncio.run(run())
+    assert deleted == []
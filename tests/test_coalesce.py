@@ -0,0 +1,66 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from SuperfacilityAPI.coalesce import SingleFlight, AsyncSingleFlight
+
+
+def test_concurrent_calls_share_one_result():
+    flight = SingleFlight()
+    calls = []
+    release = threading.Event()
+
+    def fetch():
+        calls.append(1)
+        release.wait()
+        return {'status': 'active'}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flight.do('/status', fetch)))
+               for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    while flight.coalesced < 7:
+        time.sleep(0.001)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert all(result is results[0] for result in results)
+    # Nothing is kept once the call finished
+    flight.do('/status', fetch)
+    assert len(calls) == 2
+
+
+def test_window_and_errors():
+    flight = SingleFlight(window=60)
+    assert flight.do('a', lambda: 1) == 1
+    assert flight.do('a', lambda: 2) == 1
+    assert flight.cached == 1
+
+    def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do('b', fail)
+    assert flight.do('b', lambda: 3) == 3
+
+
+def test_async_single_flight():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return [1, 2]
+
+    async def main():
+        return await asyncio.gather(*[flight.do('/tasks', fetch) for _ in range(5)])
+
+    results = asyncio.run(main())
+    assert len(calls) == 1
+    assert results == [[1, 2]] * 5
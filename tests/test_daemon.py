@@ -0,0 +1,92 @@
+import os
+import threading
+from concurrent.futures import TimeoutError
+
+import pytest
+
+from SuperfacilityAPI.daemon import SuperfacilityDaemon, DaemonClient
+from SuperfacilityAPI.SuperfacilityAPI import NerscSystemState
+from SuperfacilityAPI.SuperfacilityErrors import FourOfourException
+
+
+class FakeApi:
+    access_token = "abc"
+
+    class task_poller:
+        @staticmethod
+        def wait(task_id, timeout=None):
+            raise TimeoutError()
+
+    def status(self, name=None):
+        return {'name': name, 'status': 'active'}
+
+    def system_status(self, name=None):
+        return NerscSystemState.ACTIVE
+
+    def walk(self, path, site=None):
+        yield {'path': f'{path}/a'}
+        yield {'path': f'{path}/b'}
+
+    def ls(self, path, site=None):
+        raise FourOfourException("404 not found")
+
+    def _secret(self):
+        return "hidden"
+
+
+@pytest.fixture
+def daemon(tmp_path):
+    server = SuperfacilityDaemon(FakeApi(), tmp_path / 'sfapi.sock')
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_cli_falls_back_without_daemon(tmp_path):
+    assert DaemonClient.connect(tmp_path / 'missing.sock') is None
+
+
+def test_calls_are_forwarded(daemon):
+    sfapi = DaemonClient.connect(daemon.path)
+    assert sfapi is not None
+    assert sfapi.status('perlmutter') == {'name': 'perlmutter', 'status': 'active'}
+    assert sfapi.system_status(name='perlmutter') == NerscSystemState.ACTIVE
+    assert list(sfapi.walk('/run', site='perlmutter')) == [{'path': '/run/a'}, {'path': '/run/b'}]
+    assert sfapi.ping()['requests'] == 3
+
+
+def test_errors_are_raised_in_the_client(daemon):
+    sfapi = DaemonClient.connect(daemon.path)
+    with pytest.raises(FourOfourException):
+        sfapi.ls('/nope')
+    with pytest.raises(TimeoutError):
+        sfapi.task_poller.wait('123', timeout=1)
+    with pytest.raises(AttributeError):
+        sfapi.call('_secret')
+
+
+def test_only_allowed_methods(daemon):
+    sfapi = DaemonClient.connect(daemon.path)
+    for name in ('access_token', 'task_poller', 'status.__globals__'):
+        with pytest.raises(AttributeError):
+            sfapi.call(name)
+    with pytest.raises(AttributeError):
+        sfapi._DaemonClient__request({'op': 'attr', 'name': 'access_token'})
+    assert daemon.path.stat().st_mode & 0o777 == 0o600
+
+
+def test_socket_created_owner_only(tmp_path, monkeypatch):
+    # Without the chmod the socket must already be private when bind creates it
+    monkeypatch.setattr(os, 'chmod', lambda *args: None)
+    old = os.umask(0o022)
+    try:
+        server = SuperfacilityDaemon(FakeApi(), tmp_path / 'sfapi.sock')
+        assert os.umask(0o022) == 0o022
+    finally:
+        os.umask(old)
+    try:
+        assert server.path.stat().st_mode & 0o777 == 0o600
+    finally:
+        server.server_close()
@@ -0,0 +1,97 @@
+import base64
+import hashlib
+import io
+import json
+import time
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.transport import SuperfacilityTransport
+from SuperfacilityAPI.SuperfacilityErrors import SuperfacilityCmdFailed
+from SuperfacilityAPI.streaming import iter_json_string
+
+
+class StreamAdapter(BaseAdapter):
+    def __init__(self, body):
+        super().__init__()
+        self.body = json.dumps(body).encode()
+
+    def send(self, request, **kwargs):
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.raw = io.BytesIO(self.body)
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def stream_api(body):
+    transport = SuperfacilityTransport()
+    transport.session.mount('https://', StreamAdapter(body))
+    return SuperfacilityAPI(token="abc", transport=transport)
+
+
+def test_stream_text_to_disk(tmp_path):
+    text = "line \"one\"\né\n" * 5000
+    sfapi = stream_api({'status': 'OK', 'file': text, 'is_binary': False, 'error': None})
+    sizes = []
+
+    res = sfapi.download(site='perlmutter', remote_path='/out/log.txt', local_path=tmp_path,
+                         stream=True, chunk_size=4096, progress=sizes.append,
+                         checksum=hashlib.sha256(text.encode()).hexdigest())
+
+    assert (tmp_path / 'log.txt').read_text() == text
+    assert res['size'] == len(text.encode())
+    assert all(b - a == 4096 for a, b in zip(sizes, sizes[1:-1]))
+
+
+def test_stream_binary():
+    data = bytes(range(256)) * 100
+    sfapi = stream_api({'file': base64.b64encode(data).decode(), 'is_binary': True, 'error': None})
+    chunks = list(sfapi.iter_download(site='perlmutter', remote_path='/out/a.bin',
+                                      binary=True, chunk_size=1000))
+    assert b''.join(chunks) == data
+    assert max(len(c) for c in chunks) == 1000
+
+
+def test_stream_checksum_mismatch(tmp_path):
+    sfapi = stream_api({'file': 'abc', 'error': None})
+    with pytest.raises(SuperfacilityCmdFailed):
+        sfapi.download(site='perlmutter', remote_path='/out/a.txt', local_path=tmp_path,
+                       stream=True, checksum='0' * 64)
+    assert list(tmp_path.iterdir()) == []
+
+
+def chunked(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+def test_stream_escapes_split_across_chunks():
+    text = 'a\n"\\\U0001F600é\t' * 50
+    for ensure_ascii in (True, False):
+        body = json.dumps({'file': text, 'error': None}, ensure_ascii=ensure_ascii)
+        for size in (1, 2, 5, 6, 7, 64):
+            assert ''.join(iter_json_string(chunked(body, size), 'file')) == text
+    with pytest.raises(ValueError):
+        list(iter_json_string(chunked('{"file": "ab\\x12"}', 3), 'file'))
+
+
+def test_stream_escapes_linear():
+    def parse(lines):
+        body = json.dumps({'file': 'log line\n' * lines})
+        chunks = chunked(body, 1 << 16)
+        start = time.perf_counter()
+        pieces = list(iter_json_string(chunks, 'file'))
+        # One piece per chunk, not one per escape
+        assert len(pieces) <= len(chunks)
+        return time.perf_counter() - start
+
+    parse(1000)
+    small, large = parse(50000), parse(400000)
+    # Eight times the input, roughly eight times the time rather than 64
+    assert large < 20 * small + 0.05
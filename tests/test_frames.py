@@ -0,0 +1,39 @@
+import pandas as pd
+
+from SuperfacilityAPI.SuperfacilityAPI import sacct_columns
+from SuperfacilityAPI.frames import jobs_frame, parse_durations, parse_memory, sacct_types
+
+JOBS = [
+    {'jobid': '1', 'jobidraw': '1', 'state': 'COMPLETED', 'partition': 'regular',
+     'elapsed': '1-02:03:04', 'maxrss': '1.5G', 'ncpus': '64', 'submit': '2022-04-14T23:03:00'},
+    {'jobid': '2', 'jobidraw': '2', 'state': 'RUNNING', 'partition': 'debug',
+     'elapsed': '03:04', 'maxrss': '', 'ncpus': '128', 'submit': 'Unknown'},
+]
+
+
+def test_parsers():
+    durations = parse_durations(pd.Series(['1-00:00:01', '01:00:00', '00:01.5', 'UNLIMITED']))
+    assert list(durations.dt.total_seconds()[:3]) == [86401, 3600, 1.5]
+    assert pd.isna(durations[3])
+
+    memory = parse_memory(pd.Series(['1K', '2M', '4000Mn', '0', '']))
+    assert list(memory[:4]) == [1024, 2 << 20, 4000 << 20, 0]
+    assert pd.isna(memory[4])
+
+
+def test_typed_frame_projection():
+    frame = jobs_frame(JOBS, sacct_columns, sacct_types,
+                       projection=['jobid', 'state', 'elapsed', 'maxrss', 'ncpus', 'submit'])
+
+    assert list(frame.columns) == ['jobid', 'state', 'elapsed', 'maxrss', 'ncpus', 'submit']
+    assert isinstance(frame['state'].dtype, pd.CategoricalDtype)
+    assert frame['elapsed'][0] == pd.Timedelta(days=1, hours=2, minutes=3, seconds=4)
+    assert frame['maxrss'][0] == 3 << 29
+    assert frame['ncpus'].dtype == 'Int64'
+    assert pd.isna(frame['submit'][1])
+
+
+def test_empty_frame():
+    frame = jobs_frame([], sacct_columns, sacct_types)
+    assert len(frame) == 0
+    assert 'maxrss' in frame.columns
@@ -0,0 +1,12 @@
+import subprocess
+import sys
+
+# Modules that must not be loaded just by importing the package or building a client
+HEAVY = ['pandas', 'numpy', 'authlib', 'requests.sessions', 'httpx._client']
+
+
+def test_import_is_lazy():
+    code = ("import sys; import SuperfacilityAPI; SuperfacilityAPI.SuperfacilityAPI(); "
+            f"print([m for m in {HEAVY!r} if m in sys.modules])")
+    out = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert out.stdout.strip() == '[]'
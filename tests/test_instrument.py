@@ -0,0 +1,107 @@
+import json
+import time
+
+import pytest
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.endpoints import endpoint_template
+from SuperfacilityAPI.instrument import Metrics
+from SuperfacilityAPI.retry import RetryPolicy, NO_RETRY
+from SuperfacilityAPI.SuperfacilityErrors import FourOfourException
+
+
+def test_endpoint_template():
+    assert endpoint_template('https://api.nersc.gov/api/v1.2/compute/jobs/perlmutter/123?sacct=true') == \
+        '/compute/jobs/{site}/{jobid}'
+    assert endpoint_template('/status/') == '/status'
+    assert endpoint_template('/status/outages/planned/dtns') == '/status/outages/planned/{name}'
+    assert endpoint_template('/utilities/ls/perlmutter/%2Fglobal%2Fhomes') == '/utilities/ls/{site}/{path}'
+    assert endpoint_template('/utilities/download/perlmutter//a/b/c') == '/utilities/download/{site}/{path}'
+    assert endpoint_template('/tasks/12') == '/tasks/{task_id}'
+
+
+def test_hooks_see_every_request(mock_server):
+    mock_server.state.inject_error(503, path='/account', count=1)
+    sfapi = SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url,
+                             retry=RetryPolicy(backoff_factor=0))
+    before, after = [], []
+    sfapi.instrumentation.add_hook(pre=before.append, post=after.append)
+
+    sfapi.projects()
+    assert [event['endpoint'] for event in before] == ['/account/projects']
+    event = after[-1]
+    assert event['status'] == 200 and event['retries'] == 1 and event['error'] is None
+    assert event['bytes'] > 0 and event['duration'] > 0
+
+    with pytest.raises(FourOfourException):
+        sfapi.get_groups('missing')
+    assert after[-1]['status'] == 404
+    assert isinstance(after[-1]['error'], FourOfourException)
+
+
+def test_trace_and_cache_hits(mock_server):
+    sfapi = SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url,
+                             retry=NO_RETRY)
+    with sfapi.instrumentation.trace() as calls:
+        sfapi.status('perlmutter')
+        sfapi.status('dtns')
+    assert [(call['endpoint'], call['cache']) for call in calls] == [('/status', 'miss'),
+                                                                    ('/status/{name}', 'hit')]
+    sfapi.status('cori')
+    assert len(calls) == 2
+
+
+def test_metrics_export(mock_server):
+    sfapi = SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url,
+                             retry=NO_RETRY)
+    sfapi.status()
+    sfapi.status()
+    sfapi.roles()
+
+    text = sfapi.instrumentation.metrics.to_prometheus()
+    assert '# TYPE sfapi_requests_total counter' in text
+    assert 'sfapi_requests_total{method="GET",endpoint="/status",status="200"} 1' in text
+    assert 'sfapi_cache_total{cache="status",result="hit"} 1' in text
+    assert 'sfapi_request_duration_seconds_count{method="GET",endpoint="/account/roles"} 1' in text
+
+    snapshot = json.loads(sfapi.instrumentation.metrics.to_json())
+    bytes_total = snapshot['counters']['response_bytes_total']
+    assert {series['labels']['endpoint'] for series in bytes_total} == {'/status', '/account/roles'}
+
+
+def test_histogram_buckets():
+    metrics = Metrics(buckets=(0.1, 1))
+    for value in (0.05, 0.5, 5):
+        metrics.observe('latency', value, op='x')
+    hist = metrics.to_dict()['histograms']['latency'][0]
+    assert hist['buckets'] == {'0.1': 1, '1': 2, '+Inf': 3}
+    assert hist['count'] == 3 and hist['sum'] == pytest.approx(5.55)
+
+
+def test_streamed_response_reported_once_read(mock_server):
+    def jobs_calls(calls):
+        return [call for call in calls if call['endpoint'] == '/compute/jobs/{site}']
+
+    for _ in range(3):
+        mock_server.state.add_job('perlmutter')
+    sfapi = SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url,
+                             retry=NO_RETRY)
+    with sfapi.instrumentation.trace() as calls:
+        sfapi.get_jobs('perlmutter', sacct=False)
+        jobs = sfapi.iter_jobs('perlmutter', sacct=False)
+        next(jobs)
+        time.sleep(0.2)
+        # The body is still being read
+        assert len(jobs_calls(calls)) == 1
+        assert len(list(jobs)) == 2
+    whole, streamed = jobs_calls(calls)
+    assert streamed['status'] == 200 and streamed['error'] is None
+    assert streamed['bytes'] == whole['bytes']
+    assert streamed['duration'] >= 0.2
+
+    with sfapi.instrumentation.trace() as calls:
+        jobs = sfapi.iter_jobs('perlmutter', sacct=False, chunk_size=16)
+        next(jobs)
+        jobs.close()
+    [closed] = jobs_calls(calls)
+    assert 0 < closed['bytes'] < whole['bytes']
@@ -0,0 +1,99 @@
+from datetime import datetime
+import time
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.job_history import JobHistory, job_state, latest_time, shift_time
+from SuperfacilityAPI.mock_server import MOCK_USER
+
+SITE = 'perlmutter'
+OLD = '2020-01-01T00:00:00'
+
+
+def record(jobid, user='alice', state='COMPLETED', submit='2022-04-14T10:00:00', partition='regular'):
+    return {'jobid': jobid, 'jobidraw': jobid, 'user': user, 'state': state,
+            'submit': submit, 'partition': partition}
+
+
+def test_store_and_query(tmp_path):
+    history = JobHistory(tmp_path / 'jobs.sqlite')
+    history.put(SITE, [record('1'), record('2', user='bob', state='CANCELLED by 99'),
+                       record('3', state='RUNNING', submit='2022-04-15T10:00:00', partition='debug')])
+    history.put(SITE, [record('1', state='FAILED')])
+    assert len(history) == 3
+
+    assert [r['jobid'] for r in history.query(site=SITE, user='alice')] == ['1', '3']
+    assert [r['jobid'] for r in history.query(state=['cancelled', 'FAILED'])] == ['1', '2']
+    assert [r['jobid'] for r in history.query(start=datetime(2022, 4, 15))] == ['3']
+    assert [r['jobid'] for r in history.query(end='2022-04-15T00:00:00', partition='regular')] == ['1', '2']
+    assert history.unfinished(SITE) == ['3']
+    assert job_state('CANCELLED by 99') == 'CANCELLED'
+
+    assert history.watermark(SITE) is None
+    history.set_watermark(SITE, watermark='2022-04-15T10:00:00')
+    assert history.watermark(SITE) == '2022-04-15T10:00:00' and history.watermark(SITE, 'alice') is None
+
+
+def test_delta_sync(mock_server, tmp_path):
+    state = mock_server.state
+    for i in range(3):
+        state.add_job(SITE, state='COMPLETED', end=OLD, name=f'old_{i}')
+    running = state.add_job(SITE, state='RUNNING', name='running')
+    lost = state.add_job(SITE, state='RUNNING', name='lost')
+
+    sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url,
+                             job_history=JobHistory(tmp_path / 'jobs.sqlite'))
+    assert sfapi.sync_jobs(site=SITE) == {'site': SITE, 'user': None, 'full': True, 'fetched': 5}
+
+    state.finish_job(SITE, running)
+    state.finish_job(SITE, lost, state='FAILED')
+    # Ended long ago as far as sacct -S is concerned, found as an unfinished job instead
+    state.history[SITE][lost]['end'] = OLD
+    new = state.add_job(SITE, state='COMPLETED', name='new')
+
+    ret = sfapi.sync_jobs(site=SITE)
+    assert ret['full'] is False and ret['fetched'] == 3
+    jobs = {job['jobid']: job['state'] for job in sfapi.job_history.query(site=SITE)}
+    assert jobs[running] == 'COMPLETED' and jobs[lost] == 'FAILED' and new in jobs
+    assert sfapi.job_history.unfinished(SITE) == []
+
+    assert len(sfapi.sacct(site=SITE, user=MOCK_USER)) == 6
+    assert [job['jobid'] for job in sfapi.query_jobs(site=SITE, state='FAILED', sync=False)] == [lost]
+
+
+def test_watermark_from_records():
+    records = [record('1', submit='2022-04-14T10:00:00'),
+               dict(record('2', submit='2022-04-14T11:00:00'), start='2022-04-14T12:00:00', end='Unknown')]
+    assert latest_time(records) == '2022-04-14T12:00:00'
+    assert latest_time([], '2022-04-14T09:00:00') == '2022-04-14T09:00:00'
+    assert shift_time('2022-04-15T00:02:00', -300) == '2022-04-14T23:57:00'
+
+
+def test_delta_sync_client_timezone(mock_server, tmp_path, monkeypatch):
+    # A client far ahead of the cluster mustn't ask sacct for jobs from its own future
+    monkeypatch.setenv('TZ', 'Asia/Tokyo')
+    time.tzset()
+    try:
+        state = mock_server.state
+        state.add_job(SITE, state='COMPLETED', name='first')
+        sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url,
+                                 job_history=JobHistory(tmp_path / 'jobs.sqlite'))
+        assert sfapi.sync_jobs(site=SITE)['full'] is True
+
+        new = state.add_job(SITE, state='COMPLETED', name='new')
+        ret = sfapi.sync_jobs(site=SITE)
+        assert ret['full'] is False and ret['fetched'] >= 1
+        assert new in [job['jobid'] for job in sfapi.job_history.query(site=SITE)]
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_sacct_jobid_skips_sync(mock_server, tmp_path):
+    state = mock_server.state
+    jobids = [state.add_job(SITE, state='COMPLETED', name=f'job_{i}') for i in range(3)]
+    sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url,
+                             job_history=JobHistory(tmp_path / 'jobs.sqlite'))
+
+    assert [job['jobid'] for job in sfapi.sacct(site=SITE, jobid=jobids[1])] == [jobids[1]]
+    assert sfapi.job_history.watermark(SITE) is None
+    assert [job['jobid'] for job in sfapi.job_history.query(site=SITE)] == [jobids[1]]
@@ -0,0 +1,99 @@
+from SuperfacilityAPI import SuperfacilityAPI, job_watcher
+from SuperfacilityAPI.job_watcher import JobWatcher
+
+
+class FakeQueue:
+    def __init__(self, ticks, final, lag=0):
+        self.ticks = ticks
+        self.final = final
+        self.lag = lag
+        self.calls = []
+
+    def get_jobs(self, site, sacct=True, jobid=None, user=None, jobids=None):
+        self.calls.append((sacct, jobid if jobids is None else ','.join(jobids)))
+        if sacct and self.lag:
+            # sacct hasn't caught up with squeue yet
+            self.lag -= 1
+            return {'output': []}
+        if sacct:
+            jobs = []
+            for jobid in jobids or [jobid]:
+                jobs += [self.final[jobid], {'jobid': f'{jobid}.batch', 'state': 'COMPLETED'}]
+            return {'output': jobs}
+        jobs = self.ticks.pop(0) if len(self.ticks) > 1 else self.ticks[0]
+        if jobids is not None:
+            jobs = [job for job in jobs if job['jobid'] in jobids]
+        return {'output': jobs}
+
+
+def test_watch_user_only_emits_changes():
+    queue = FakeQueue([
+        [{'jobid': '1', 'state': 'PENDING'}, {'jobid': '2', 'state': 'RUNNING'}],
+        [{'jobid': '1', 'state': 'PENDING'}, {'jobid': '2', 'state': 'RUNNING'}],
+        [{'jobid': '1', 'state': 'RUNNING'}],
+        [{'jobid': '1', 'state': 'RUNNING'}],
+    ], final={'2': {'jobid': '2', 'state': 'CANCELLED by 123'}})
+    watcher = JobWatcher(queue, 'perlmutter', user='me', interval=0)
+
+    changes = [[(t['jobid'], t['old_state'], t['new_state']) for t in watcher.poll()]
+               for _ in range(4)]
+    assert changes == [[('1', None, 'PENDING'), ('2', None, 'RUNNING')],
+                       [],
+                       [('1', 'PENDING', 'RUNNING'), ('2', 'RUNNING', 'CANCELLED')],
+                       []]
+    # Job 2 is looked up in sacct once, then never again
+    assert queue.calls.count((True, '2')) == 1
+
+
+def test_watch_jobids_stops_when_finished():
+    queue = FakeQueue([
+        [{'jobid': '7', 'state': 'RUNNING'}],
+        [],
+    ], final={'7': {'jobid': '7', 'state': 'COMPLETED'}})
+    watcher = JobWatcher(queue, 'perlmutter', jobids=[7], interval=0)
+
+    states = [t['new_state'] for t in watcher]
+    assert states == ['RUNNING', 'COMPLETED']
+    assert watcher.done
+    assert queue.calls == [(False, '7'), (False, '7'), (True, '7')]
+
+
+def test_watch_waits_for_sacct():
+    queue = FakeQueue([
+        [{'jobid': '7', 'state': 'RUNNING'}],
+        [],
+    ], final={'7': {'jobid': '7', 'state': 'FAILED'}}, lag=2)
+    watcher = JobWatcher(queue, 'perlmutter', jobids=[7], interval=0)
+
+    states = [t['new_state'] for t in watcher]
+    assert states == ['RUNNING', 'FAILED']
+    assert queue.calls.count((True, '7')) == 3
+
+
+def test_watch_jobids_batches_requests(monkeypatch):
+    monkeypatch.setattr(job_watcher, 'WATCH_JOBS_PER_REQUEST', 2)
+    running = [{'jobid': str(jobid), 'state': 'RUNNING'} for jobid in range(1, 6)]
+    # The fake moves on a tick per squeue call, one per chunk of watched jobs
+    queue = FakeQueue([running] * 3 + [running[4:]] * 3 + [[]], final={str(jobid): {'jobid': str(jobid), 'state': 'COMPLETED'} for jobid in range(1, 6)})
+    watcher = JobWatcher(queue, 'perlmutter', jobids=range(1, 6), interval=0)
+
+    states = [t['new_state'] for t in watcher]
+    assert states == ['RUNNING'] * 5 + ['COMPLETED'] * 5
+    # One request per chunk of watched jobs per poll, never one per job
+    assert queue.calls == [(False, '1,2'), (False, '3,4'), (False, '5'),
+                           (False, '1,2'), (False, '3,4'), (False, '5'), (True, '1,2'), (True, '3,4'),
+                           (False, '5'), (True, '5')]
+
+
+def test_watch_jobids_one_request_per_poll(mock_server):
+    state = mock_server.state
+    sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url)
+    jobids = [state.add_job('perlmutter') for _ in range(3)]
+    watcher = sfapi.watch_jobs('perlmutter', jobids=jobids, interval=0)
+
+    assert [t['new_state'] for t in watcher.poll()] == ['RUNNING'] * 3
+    state.finish_job('perlmutter', jobids[0])
+    state.finish_job('perlmutter', jobids[1], state='FAILED')
+    assert sorted(t['new_state'] for t in watcher.poll()) == ['COMPLETED', 'FAILED']
+    # One squeue per poll, and one sacct for both jobs that left the queue
+    assert state.requests['GET /compute/jobs/perlmutter'] == 3
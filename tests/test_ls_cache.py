@@ -0,0 +1,72 @@
+import time
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.ls_cache import LsCache
+
+LISTING = {'status': 'OK', 'entries': [{'name': 'job.sh', 'perms': '-rw-r--r--'}]}
+
+
+def test_exists_from_parent_listing(tmp_path):
+    cache = LsCache(tmp_path / 'ls.sqlite')
+    cache.put('perlmutter', '/run/', LISTING)
+
+    assert cache.get('perlmutter', '/run') == LISTING
+    assert cache.exists('perlmutter', '/run/job.sh') is True
+    # Not proof it is missing, the listing may be older than the file
+    assert cache.exists('perlmutter', '/run/other.sh') is None
+    assert cache.exists('perlmutter', '/elsewhere/job.sh') is None
+
+
+def test_invalidate_parent_and_children(tmp_path):
+    cache = LsCache(tmp_path / 'ls.sqlite')
+    for path in ['/run', '/run/a', '/run/a/b', '/running']:
+        cache.put('perlmutter', path, LISTING)
+
+    cache.invalidate('perlmutter', '/run/a')
+    assert cache.get('perlmutter', '/run') is None
+    assert cache.get('perlmutter', '/run/a/b') is None
+    assert cache.get('perlmutter', '/running') == LISTING
+
+
+def test_ttl_and_lru(tmp_path):
+    cache = LsCache(tmp_path / 'ls.sqlite', max_entries=2)
+    cache.put('perlmutter', '/a', LISTING)
+    time.sleep(0.01)
+    cache.put('perlmutter', '/b', LISTING)
+    time.sleep(0.01)
+    cache.get('perlmutter', '/a')
+    cache.put('perlmutter', '/c', LISTING)
+    assert len(cache) == 2
+    assert cache.get('perlmutter', '/b') is None
+
+    cache.ttl = 0
+    assert cache.get('perlmutter', '/a') is None
+
+
+def test_exists_checks_live_when_listing_is_stale(mock_server, tmp_path):
+    state = mock_server.state
+    state.add_file('perlmutter', '/run/job.sh')
+    sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url,
+                             ls_cache=LsCache(tmp_path / 'ls.sqlite'))
+    sfapi.ls('/run', site='perlmutter')
+
+    # Created after /run was listed and cached
+    state.add_file('perlmutter', '/run/new.sh')
+    assert sfapi.exists('/run/new.sh', site='perlmutter') is True
+    assert sfapi.ls_cache.exists('perlmutter', '/run/new.sh') is True
+    assert sfapi.exists('/run/missing.sh', site='perlmutter') is False
+
+
+def test_only_user_commands_invalidate(mock_server, tmp_path):
+    state = mock_server.state
+    state.add_file('perlmutter', '/run/job.sh', 'srun hostname\n')
+    sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url,
+                             ls_cache=LsCache(tmp_path / 'ls.sqlite'))
+    sfapi.ls('/run', site='perlmutter')
+
+    # The library's own checksums don't change anything
+    assert sfapi.sha256sum('/run/job.sh', site='perlmutter') is not None
+    assert sfapi.ls_cache.get('perlmutter', '/run') is not None
+
+    sfapi.custom_cmd(site='perlmutter', cmd='touch /run/new.sh')
+    assert sfapi.ls_cache.get('perlmutter', '/run') is None
@@ -0,0 +1,97 @@
+import pytest
+
+from SuperfacilityAPI import SuperfacilityAPI, SuperfacilityAccessToken
+from SuperfacilityAPI.SuperfacilityAPI import NerscSystemState
+from SuperfacilityAPI.mock_server import MockServer, Fixtures, MOCK_HOME
+from SuperfacilityAPI.retry import RetryPolicy, NO_RETRY
+from SuperfacilityAPI.SuperfacilityErrors import ApiTokenError, InternalServerError
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server
+
+
+def client(server, **kwargs):
+    return SuperfacilityAPI(token=server.state.issue_token(), base_url=server.base_url, **kwargs)
+
+
+def test_status_offline(server):
+    sfapi = client(server)
+    assert sfapi.system_status('perlmutter') == NerscSystemState.ACTIVE
+    assert 'perlmutter' in sfapi.system_names()
+
+    server.state.set_status('dtns', 'down')
+    assert sfapi.status('dtns', new=True)['status'] == 'down'
+
+
+def test_token_endpoint(server):
+    rsa = pytest.importorskip('cryptography.hazmat.primitives.asymmetric.rsa')
+    serialization = pytest.importorskip('cryptography.hazmat.primitives.serialization')
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                            serialization.NoEncryption()).decode()
+
+    token = SuperfacilityAccessToken(client_id='mock', private_key=pem, token_url=server.token_url,
+                                     background_refresh=False)
+    assert token.token in server.state.tokens
+    assert SuperfacilityAPI(token=token, base_url=server.base_url).projects()[0]['repo_name'] == 'm0000'
+
+
+def test_jobs_complete_in_the_background(server):
+    server.state.add_file('perlmutter', f'{MOCK_HOME}/job.sh', "#!/bin/bash\n#SBATCH -J mockjob\n")
+    sfapi = client(server)
+
+    job = sfapi.post_job(script=f'{MOCK_HOME}/job.sh', isPath=True, run_async=True)
+    assert server.state.tasks[job['task_id']]['status'] == 'new'
+
+    jobid = sfapi.post_job(script=f'{MOCK_HOME}/job.sh', isPath=True, sleeptime=1)['jobid']
+    queue = sfapi.get_jobs(jobid=jobid, sacct=False)['output']
+    assert queue[0]['name'] == 'mockjob'
+
+    assert sfapi.delete_job(jobid=jobid)['status'] == 'OK'
+    assert sfapi.get_jobs(jobid=jobid, sacct=False)['output'] == []
+    assert sfapi.get_jobs(jobid=jobid, sacct=True)['output'][0]['state'] == 'CANCELLED'
+
+
+def test_utilities(server):
+    server.state.add_file('perlmutter', f'{MOCK_HOME}/data/hello.txt', 'hello')
+    sfapi = client(server)
+
+    names = [entry['name'] for entry in sfapi.ls(f'{MOCK_HOME}/data')['entries']]
+    assert names == ['hello.txt']
+    assert not sfapi.exists(f'{MOCK_HOME}/missing')
+    assert sfapi.download(remote_path=f'{MOCK_HOME}/data/hello.txt')['file'] == 'hello'
+    assert b''.join(sfapi.iter_download(remote_path=f'{MOCK_HOME}/data/hello.txt',
+                                        binary=True)) == b'hello'
+    assert sfapi.custom_cmd(cmd='echo hi', sleeptime=1)['output'] == 'hi\n'
+
+
+def test_error_injection(server):
+    server.state.inject_error(503, path='/status', count=2)
+    sfapi = client(server, retry=RetryPolicy(backoff_factor=0))
+    assert sfapi.status('perlmutter')['status'] == 'active'
+    assert sfapi.transport.retries == 2
+
+    server.state.inject_error(500, path='/account')
+    with pytest.raises(InternalServerError):
+        sfapi.projects()
+
+    server.state.clear_errors()
+    with pytest.raises(ApiTokenError):
+        SuperfacilityAPI(token='not-a-token', base_url=server.base_url, retry=NO_RETRY).projects()
+
+
+def test_record_and_replay(server, tmp_path):
+    token = server.state.issue_token()
+    fixtures = Fixtures(tmp_path / 'fixtures.json')
+    with MockServer(fixtures=fixtures, upstream=server.base_url) as recorder:
+        recorded = SuperfacilityAPI(token=token, base_url=recorder.base_url)
+        projects = recorded.projects()
+        status = recorded.status()
+
+    with MockServer(fixtures=Fixtures(tmp_path / 'fixtures.json')) as replayer:
+        replayed = SuperfacilityAPI(token='anything', base_url=replayer.base_url, retry=NO_RETRY)
+        assert replayed.projects() == projects
+        assert replayed.status() == status
+        assert server.state.requests['GET /account/projects'] == 1
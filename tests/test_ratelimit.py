@@ -0,0 +1,122 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from SuperfacilityAPI.ratelimit import (
+    RateLimiter,
+    FileBackend,
+    request_priority,
+    current_priority,
+    INTERACTIVE,
+    BACKGROUND,
+    NORMAL
+)
+
+URL = 'https://api.nersc.gov/api/v1.2/compute/jobs/perlmutter'
+
+
+def test_budgets_are_per_endpoint_class():
+    limiter = RateLimiter(rates={'compute': (20, 2), 'status': (1000, 1000)})
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire(URL)
+    # Burst of 2, then two more at 20/s
+    assert time.monotonic() - start >= 0.08
+    assert limiter.throttled == 2
+
+    assert limiter.acquire('/status/perlmutter') == 0
+
+
+def test_interactive_jumps_the_queue():
+    limiter = RateLimiter(rates={'compute': (10, 1)})
+    limiter.acquire(URL)
+    order = []
+
+    def request(name, priority):
+        with request_priority(priority):
+            limiter.acquire(URL)
+        order.append(name)
+
+    threads = [threading.Thread(target=request, args=(f'poll{i}', BACKGROUND)) for i in range(3)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.02)
+    cancel = threading.Thread(target=request, args=('scancel', INTERACTIVE))
+    cancel.start()
+    for thread in threads + [cancel]:
+        thread.join()
+    assert order[0] == 'scancel'
+    assert current_priority() == NORMAL
+
+
+def test_file_backend_is_shared(tmp_path):
+    path = tmp_path / 'buckets.json'
+    first = RateLimiter(rates={'compute': (0.001, 2)}, backend=FileBackend(path))
+    second = RateLimiter(rates={'compute': (0.001, 2)}, backend=FileBackend(path))
+    first.acquire(URL)
+    second.acquire(URL)
+    assert FileBackend(path).take('compute', 0.001, 2) > 0
+
+
+def test_async_acquire_keeps_priority():
+    limiter = RateLimiter(rates={'compute': (20, 1)})
+    limiter.acquire(URL)
+    order = []
+
+    async def request(name, priority):
+        await limiter.acquire_async(URL, priority)
+        order.append(name)
+
+    async def run():
+        polls = [asyncio.create_task(request(f'poll{i}', BACKGROUND)) for i in range(3)]
+        await asyncio.sleep(0.01)
+        # Waits in the same line as a blocking acquire from another thread
+        blocking = threading.Thread(target=limiter.acquire, args=(URL, BACKGROUND))
+        blocking.start()
+        await asyncio.gather(request('scancel', INTERACTIVE), *polls)
+        await asyncio.get_running_loop().run_in_executor(None, blocking.join)
+
+    start = time.monotonic()
+    asyncio.run(run())
+    assert order[0] == 'scancel' and len(order) == 4
+    # Five requests past the burst at 20/s
+    assert time.monotonic() - start >= 0.2
+    assert limiter.throttled == 5
+
+
+def test_async_file_backend_doesnt_block_the_loop(tmp_path):
+    fcntl = pytest.importorskip('fcntl')
+    path = tmp_path / 'buckets.json'
+    limiter = RateLimiter(rates={'compute': (1000, 10)}, backend=FileBackend(path))
+    locked = threading.Event()
+
+    def hold_lock():
+        # Another process using the same buckets
+        with open(path, 'a+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            locked.set()
+            time.sleep(0.3)
+
+    async def run():
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        ticker = asyncio.create_task(tick())
+        await limiter.acquire_async(URL)
+        ticker.cancel()
+        return ticks
+
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    locked.wait()
+    ticks = asyncio.run(run())
+    holder.join()
+    # The loop kept running while the take waited on the lock
+    assert ticks >= 10
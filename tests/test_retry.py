@@ -0,0 +1,130 @@
+import json
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from SuperfacilityAPI.transport import SuperfacilityTransport
+from SuperfacilityAPI.retry import RetryPolicy, CircuitBreaker, parse_retry_after, OPEN, HALF_OPEN
+from SuperfacilityAPI.endpoints import endpoint_site
+from SuperfacilityAPI.SuperfacilityErrors import (
+    InternalServerError,
+    SuperfacilityCircuitOpen,
+    SuperfacilityRateLimited
+)
+
+URL = 'https://api.nersc.gov/api/v1.2/compute/jobs/perlmutter'
+
+
+class ScriptedAdapter(BaseAdapter):
+    def __init__(self, script):
+        super().__init__()
+        self.script = list(script)
+        self.sent = 0
+
+    def send(self, request, **kwargs):
+        self.sent += 1
+        step = self.script.pop(0) if len(self.script) > 1 else self.script[0]
+        if isinstance(step, Exception):
+            raise step
+        status, headers = step
+        resp = requests.Response()
+        resp.status_code = status
+        resp.headers.update(headers)
+        resp._content = json.dumps({}).encode()
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def transport(script, retry=None, breaker=None):
+    transport = SuperfacilityTransport(retry=RetryPolicy(backoff_factor=0) if retry is None else retry,
+                                       breaker=breaker)
+    adapter = ScriptedAdapter(script)
+    transport.session.mount('https://', adapter)
+    return transport, adapter
+
+
+def test_endpoint_site():
+    assert endpoint_site(URL) == 'perlmutter'
+    assert endpoint_site('/utilities/ls/dtn01//global/homes') == 'dtn01'
+    assert endpoint_site('/status/perlmutter') is None
+
+
+def test_retry_after():
+    assert parse_retry_after('3') == 3
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT') == 0
+    assert RetryPolicy(backoff_factor=0).delay('GET', 0, 503, '2') == 2
+    assert RetryPolicy().delay('POST', 0, 503) is None
+    assert RetryPolicy().delay('GET', 0, 404) is None
+
+
+def test_idempotent_requests_are_retried(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr('time.sleep', sleeps.append)
+    t, adapter = transport([(503, {'Retry-After': '1'}),
+                            requests.exceptions.ConnectionError("reset"),
+                            (200, {})])
+    assert t.request('GET', URL, token="abc").status_code == 200
+    assert adapter.sent == 3
+    assert sleeps == [1, 0]
+    assert t.counters['retries'] == 2
+
+
+def test_posts_are_not_retried(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda s: None)
+    t, adapter = transport([(503, {}), (200, {})])
+    with pytest.raises(InternalServerError):
+        t.request('POST', URL, token="abc")
+    assert adapter.sent == 1
+
+
+def test_circuit_opens_and_recovers(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda s: None)
+    breaker = CircuitBreaker(failure_threshold=2, reset_timeout=0.05)
+    t, adapter = transport([(502, {})], retry=RetryPolicy(max_retries=0), breaker=breaker)
+    for _ in range(2):
+        with pytest.raises(InternalServerError):
+            t.request('GET', URL, token="abc")
+    with pytest.raises(SuperfacilityCircuitOpen):
+        t.request('GET', URL, token="abc")
+    assert adapter.sent == 2
+    assert t.counters['open_circuits'] == {'perlmutter': OPEN}
+    assert t.counters['circuit_rejections'] == 1
+
+    monkeypatch.setattr('time.monotonic', lambda: float('inf'))
+    assert breaker.state('perlmutter') == HALF_OPEN
+    adapter.script = [(200, {})]
+    t.request('GET', URL, token="abc")
+    assert t.counters['open_circuits'] == {}
+    assert t.counters['circuits_opened'] == 1
+
+
+def test_half_open_trial_failing_unexpectedly(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda s: None)
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.05)
+    t, adapter = transport([(502, {})], retry=RetryPolicy(max_retries=0), breaker=breaker)
+    with pytest.raises(InternalServerError):
+        t.request('GET', URL, token="abc")
+
+    monkeypatch.setattr('time.monotonic', lambda: 1e9)
+    adapter.script = [ValueError("bad adapter")]
+    with pytest.raises(ValueError):
+        t.request('GET', URL, token="abc")
+    # The trial failed, so the circuit opened again rather than staying half-open
+    assert breaker.state('perlmutter') == OPEN
+
+    monkeypatch.setattr('time.monotonic', lambda: 2e9)
+    adapter.script = [(200, {})]
+    assert t.request('GET', URL, token="abc").status_code == 200
+
+
+def test_rate_limited_after_retries(monkeypatch):
+    monkeypatch.setattr('time.sleep', lambda s: None)
+    t, adapter = transport([(429, {'Retry-After': '0'})], retry=RetryPolicy(max_retries=2, backoff_factor=0))
+    with pytest.raises(SuperfacilityRateLimited):
+        t.request('GET', URL, token="abc")
+    assert adapter.sent == 3
@@ -1,12 +1,12 @@
 from SuperfacilityAPI import SuperfacilityAPI
 
 
-def test_status():
-    sfapi = SuperfacilityAPI()
+def test_status(mock_server):
+    sfapi = SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url)
     sfapi.status()
 
 
-def test_system_names():
-    sfapi = SuperfacilityAPI()
+def test_system_names(mock_server):
+    sfapi = SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url)
     sfapi.system_names()
     sfapi.systems
@@ -0,0 +1,81 @@
+import json
+import threading
+
+import requests
+from requests.adapters import BaseAdapter
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.status_cache import StatusCache
+from SuperfacilityAPI.transport import SuperfacilityTransport
+
+
+STATUS = [{'name': 'perlmutter', 'status': 'active'},
+          {'name': 'dtns', 'status': 'degraded'}]
+
+
+def test_full_status_serves_systems():
+    cache = StatusCache(ttl=60)
+    cache.put_all(STATUS)
+    assert cache.get() == STATUS
+    assert cache.get('dtns')['status'] == 'degraded'
+
+
+def test_ttl_and_invalidate():
+    cache = StatusCache(ttl=60, ttls={'perlmutter': 0})
+    cache.put_all(STATUS)
+    assert cache.get('perlmutter') is None
+    assert cache.get('dtns') is not None
+
+    cache.invalidate('dtns')
+    assert cache.get('dtns') is None
+    cache.invalidate()
+    assert cache.get() is None
+
+
+class StatusAdapter(BaseAdapter):
+    def __init__(self):
+        super().__init__()
+        self.paths = []
+        self.lock = threading.Lock()
+
+    def send(self, request, **kwargs):
+        path = request.path_url.split('/api/v1.2')[-1]
+        with self.lock:
+            self.paths.append(path)
+        if path == '/status/':
+            body = STATUS
+        elif path == '/status/outages':
+            body = [[{'name': 'perlmutter', 'status': 'planned'}], []]
+        else:
+            body = {'name': path.rsplit('/', 1)[-1], 'status': 'active'}
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps(body).encode()
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def status_api():
+    transport = SuperfacilityTransport()
+    adapter = StatusAdapter()
+    transport.session.mount('https://', adapter)
+    return SuperfacilityAPI(token="abc", transport=transport), adapter
+
+
+def test_status_many_uses_one_bulk_call():
+    sfapi, adapter = status_api()
+    ret = sfapi.status_many(['dtns', 'perlmutter', 'global_homes', 'dtns'])
+    assert list(ret) == ['dtns', 'perlmutter', 'global_homes']
+    assert ret['dtns']['status'] == 'degraded'
+    assert ret['global_homes'] == {'name': 'global_homes', 'status': 'active'}
+    assert sorted(adapter.paths) == ['/status/', '/status/global_homes']
+
+
+def test_status_many_outages():
+    sfapi, adapter = status_api()
+    ret = sfapi.status_many(['perlmutter', 'dtns'], outages=True)
+    assert ret == {'perlmutter': [{'name': 'perlmutter', 'status': 'planned'}], 'dtns': []}
+    assert adapter.paths == ['/status/outages']
@@ -0,0 +1,66 @@
+import json
+
+import pytest
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.streaming import iter_json_array
+
+SITE = 'perlmutter'
+
+
+def pieces(text, size):
+    return (text[i:i + size] for i in range(0, len(text), size))
+
+
+def test_iter_json_array():
+    records = [{'jobid': str(i), 'name': f'job "{i}" é', 'nodes': i} for i in range(50)]
+    body = json.dumps({'status': 'OK', 'output': records, 'error': None})
+    fields = {}
+    for size in (1, 7, len(body)):
+        assert list(iter_json_array(pieces(body, size), 'output', fields)) == records
+    assert fields == {'status': 'OK', 'output': None, 'error': None}
+
+    batches = list(iter_json_array(pieces(body, 13), 'output', batch_size=20))
+    assert [len(batch) for batch in batches] == [20, 20, 10]
+    assert list(iter_json_array(['{"output": [], "error": null}'], 'output')) == []
+
+    with pytest.raises(ValueError):
+        list(iter_json_array(pieces(body[:len(body) // 2], 64), 'output'))
+
+
+@pytest.fixture
+def sfapi(mock_server):
+    for i in range(250):
+        mock_server.state.add_job(SITE, state='RUNNING' if i % 2 else 'PENDING', name=f'job_{i}')
+        mock_server.state.add_job(SITE, state='COMPLETED', name=f'done_{i}')
+    return SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url)
+
+
+def test_stream_squeue(sfapi):
+    queue = sfapi.get_jobs(site=SITE, sacct=False)['output']
+    assert list(sfapi.iter_jobs(site=SITE, sacct=False, chunk_size=512)) == queue
+
+    batches = list(sfapi.squeue(site=SITE, stream=True, batch_size=100))
+    assert [len(batch) for batch in batches] == [100, 100, 50]
+    assert [job for batch in batches for job in batch] == queue
+
+
+def test_stream_sacct_frames(sfapi):
+    pytest.importorskip('pandas')
+    frames = list(sfapi.sacct(site=SITE, stream=True, dataframe=True, batch_size=200))
+    assert [len(frame) for frame in frames] == [200, 200, 100]
+    assert set(frames[-1]['state']) <= {'RUNNING', 'PENDING', 'COMPLETED'}
+
+
+
+def test_sacct_frame_keeps_strings_by_default(sfapi):
+    pd = pytest.importorskip('pandas')
+    columns = ['jobid', 'state', 'submit', 'nnodes']
+    jobs = sfapi.get_jobs(site=SITE, sacct=True)['output']
+    raw = sfapi.sacct(site=SITE, dataframe=True, columns=columns)
+    assert raw.to_dict('records') == [{name: job[name] for name in columns} for job in jobs]
+    assert pd.api.types.is_string_dtype(raw['submit'])
+
+    typed = sfapi.sacct(site=SITE, dataframe=True, columns=columns, typed=True)
+    assert pd.api.types.is_datetime64_any_dtype(typed['submit'])
+    assert typed['nnodes'].dtype == 'Int64'
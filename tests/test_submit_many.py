@@ -0,0 +1,88 @@
+import json
+import threading
+import time
+
+import requests
+from requests.adapters import BaseAdapter
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.transport import SuperfacilityTransport
+
+
+class FakeNersc(BaseAdapter):
+    """Answers status, ls, job posts and the task list like the api would"""
+
+    def __init__(self, post_delay=0):
+        super().__init__()
+        self.post_delay = post_delay
+        self.lock = threading.Lock()
+        self.calls = []
+        self.tasks = []
+
+    def route(self, request):
+        path = request.path_url.split('/api/v1.2')[-1]
+        if path.startswith('/status/'):
+            return [{'name': 'perlmutter', 'status': 'active', 'description': ''}]
+        if path.startswith('/utilities/ls/'):
+            return {'status': 'OK', 'entries': [{'name': 'a.sh'}, {'name': 'b.sh'}]}
+        if path.startswith('/compute/jobs/') and request.method == 'POST':
+            task_id = len(self.tasks) + 1
+            result = json.dumps({'error': None, 'jobid': str(1000 + task_id)})
+            self.tasks.append({'id': str(task_id), 'status': 'completed', 'result': result})
+            return {'task_id': str(task_id)}
+        if path == '/tasks':
+            return {'tasks': self.tasks}
+        return {}
+
+    def send(self, request, **kwargs):
+        if request.method == 'POST':
+            time.sleep(self.post_delay)
+        with self.lock:
+            self.calls.append(request.path_url)
+            body = self.route(request)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps(body).encode()
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def test_submit_many():
+    transport = SuperfacilityTransport()
+    nersc = FakeNersc()
+    transport.session.mount('https://', nersc)
+    sfapi = SuperfacilityAPI(token="abc", transport=transport)
+
+    scripts = ['/run/a.sh', '/run/b.sh', '/run/missing.sh']
+    results = list(sfapi.submit_many(scripts, site='perlmutter'))
+
+    assert len(results) == 3
+    errors = {r['script']: r['error'] for r in results}
+    assert errors['/run/missing.sh'] is not None
+    assert errors['/run/a.sh'] is None
+    assert sorted(r['jobid'] for r in results if r['jobid']) == ['1001', '1002']
+    # One ls for the shared directory and one status check
+    assert sum('/utilities/ls/' in call for call in nersc.calls) == 1
+    assert sum('/status/' in call for call in nersc.calls) == 1
+
+
+def test_submit_many_timeout():
+    transport = SuperfacilityTransport()
+    nersc = FakeNersc(post_delay=0.3)
+    transport.session.mount('https://', nersc)
+    sfapi = SuperfacilityAPI(token="abc", transport=transport)
+
+    scripts = [f"#!/bin/bash\nsrun job{i}" for i in range(6)]
+    start = time.monotonic()
+    results = list(sfapi.submit_many(scripts, site='perlmutter', isPath=False,
+                                     max_in_flight=2, timeout=0.1))
+    # Only the two posts in flight at the deadline were sent, and waited for
+    assert time.monotonic() - start < 1
+    assert len(nersc.tasks) == 2 and len(results) == 6
+    submitted = [r for r in results if r['task_id'] is not None]
+    assert sorted(r['task_id'] for r in submitted) == ['1', '2']
+    assert all('not completed' in r['error'] for r in submitted)
+    assert sum(r['error'] == 'not submitted after 0.1s' for r in results) == 4
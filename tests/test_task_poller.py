@@ -0,0 +1,29 @@
+import threading
+
+from SuperfacilityAPI.task_poller import Backoff, TaskPoller
+
+
+def test_backoff_grows_to_ceiling():
+    backoff = Backoff(initial=1, factor=2, ceiling=5)
+    assert [backoff.next() for _ in range(5)] == [1, 2, 4, 5, 5]
+    backoff.reset()
+    assert backoff.next() == 1
+
+
+def test_one_poll_resolves_many_tasks():
+    polls = []
+    lock = threading.Lock()
+
+    def fetch_tasks():
+        with lock:
+            polls.append(1)
+        return [{'id': str(i), 'status': 'completed', 'result': '{}'} for i in range(200)]
+
+    poller = TaskPoller(fetch_tasks, Backoff(initial=0.05))
+    done = []
+    futures = [poller.submit(i, callback=done.append) for i in range(200)]
+
+    assert [f.result(timeout=5)['id'] for f in futures] == [str(i) for i in range(200)]
+    assert len(done) == 200
+    assert len(polls) < 5
+    assert len(poller) == 0
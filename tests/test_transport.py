@@ -0,0 +1,68 @@
+import json
+
+import pytest
+import requests
+from requests.adapters import BaseAdapter
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.transport import SuperfacilityTransport
+from SuperfacilityAPI.SuperfacilityErrors import FourOfourException
+
+
+class StubAdapter(BaseAdapter):
+    def __init__(self, status=200, body=None):
+        super().__init__()
+        self.status = status
+        self.body = {} if body is None else body
+        self.sent = []
+
+    def send(self, request, **kwargs):
+        self.sent.append((request, kwargs))
+        resp = requests.Response()
+        resp.status_code = self.status
+        resp._content = json.dumps(self.body).encode()
+        resp.url = request.url
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def stub_api(status=200, body=None):
+    transport = SuperfacilityTransport(timeout=(1, 2))
+    adapter = StubAdapter(status, body)
+    transport.session.mount('https://', adapter)
+    return SuperfacilityAPI(token="abc", transport=transport), adapter
+
+
+def test_requests_share_session():
+    sfapi, adapter = stub_api(body={'status': 'OK', 'entries': []})
+    sfapi.ls('/global/homes')
+    sfapi.tasks()
+
+    assert len(adapter.sent) == 2
+    request, kwargs = adapter.sent[0]
+    assert request.headers['Authorization'] == 'Bearer abc'
+    assert kwargs['timeout'] == (1, 2)
+
+
+def test_post_is_form_encoded():
+    sfapi, adapter = stub_api(body={'task_id': 1})
+    sfapi.create_groups(name="grp", repo_name="m0000")
+
+    request, _ = adapter.sent[0]
+    assert request.method == 'POST'
+    assert request.body == 'name=grp&repo_name=m0000'
+
+
+def test_no_token():
+    sfapi = SuperfacilityAPI()
+    with pytest.raises(PermissionError):
+        sfapi.tasks()
+
+
+def test_404():
+    sfapi, _ = stub_api(status=404)
+    with pytest.raises(FourOfourException):
+        sfapi.roles()
@@ -0,0 +1,82 @@
+import hashlib
+
+import pytest
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.mock_server import MOCK_HOME
+from SuperfacilityAPI.retry import NO_RETRY
+from SuperfacilityAPI.SuperfacilityErrors import InternalServerError
+from SuperfacilityAPI.upload import UploadManifest, chunk_checksums, part_path
+
+SITE = 'perlmutter'
+
+
+@pytest.fixture
+def sfapi(mock_server):
+    return SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url,
+                            retry=NO_RETRY)
+
+
+@pytest.fixture
+def local_file(tmp_path):
+    path = tmp_path / 'data.bin'
+    path.write_bytes(bytes(range(256)) * 40)
+    return path
+
+
+def test_chunk_checksums(local_file):
+    chunks, whole = chunk_checksums(local_file, chunk_size=4096)
+    data = local_file.read_bytes()
+    assert len(chunks) == 3
+    assert chunks[2] == hashlib.sha256(data[8192:]).hexdigest()
+    assert whole == hashlib.sha256(data).hexdigest()
+
+
+def test_upload_in_chunks(mock_server, sfapi, local_file, tmp_path):
+    remote = f'{MOCK_HOME}/data.bin'
+    sent = []
+    ret = sfapi.upload(local_file, remote, site=SITE, chunk_size=4096,
+                       progress=sent.append, manifest_dir=tmp_path / 'manifests')
+
+    assert ret['error'] is None and ret['chunks'] == 3 and ret['resumed'] == 0
+    assert sent == [4096, 8192, local_file.stat().st_size]
+    assert mock_server.state.files[SITE][remote] == local_file.read_bytes()
+    assert part_path(remote, 0) not in mock_server.state.files[SITE]
+    assert not list((tmp_path / 'manifests').iterdir())
+
+
+def test_upload_resumes(mock_server, sfapi, local_file, tmp_path):
+    remote = f'{MOCK_HOME}/data.bin'
+    manifests = tmp_path / 'manifests'
+    mock_server.state.inject_error(500, method='PUT',
+                                   path=f"/utilities/upload/{SITE}/" + part_path(remote, 2).replace('/', '%2F'))
+    with pytest.raises(InternalServerError):
+        sfapi.upload(local_file, remote, site=SITE, chunk_size=4096, manifest_dir=manifests)
+    manifest = UploadManifest(local_file, remote, SITE, 4096, manifests)
+    assert manifest.load() and manifest.sent == {0, 1}
+
+    mock_server.state.clear_errors()
+    # Corrupt a chunk already sent, it is found by its checksum and sent again
+    mock_server.state.files[SITE][part_path(remote, 1)] = b'corrupt'
+    puts = sum(n for key, n in mock_server.state.requests.items() if key.startswith('PUT'))
+    ret = sfapi.upload(local_file, remote, site=SITE, chunk_size=4096, manifest_dir=manifests)
+
+    assert ret['resumed'] == 2
+    assert sum(n for key, n in mock_server.state.requests.items() if key.startswith('PUT')) == puts + 2
+    assert mock_server.state.files[SITE][remote] == local_file.read_bytes()
+
+
+def test_upload_many(mock_server, sfapi, tmp_path):
+    files = {}
+    for i in range(3):
+        path = tmp_path / f'file_{i}.txt'
+        path.write_text(f'file {i}\n')
+        files[str(path)] = f'{MOCK_HOME}/file_{i}.txt'
+    files[str(tmp_path / 'missing.txt')] = f'{MOCK_HOME}/missing.txt'
+
+    results = {ret['local']: ret for ret in sfapi.upload_many(files, site=SITE,
+                                                               manifest_dir=tmp_path / 'manifests')}
+    assert results[str(tmp_path / 'missing.txt')]['error'].startswith('FileNotFoundError')
+    for i in range(3):
+        assert results[str(tmp_path / f'file_{i}.txt')]['chunks'] == 1
+        assert mock_server.state.files[SITE][f'{MOCK_HOME}/file_{i}.txt'] == f'file {i}\n'.encode()
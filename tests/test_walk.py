@@ -0,0 +1,69 @@
+import json
+import threading
+
+import requests
+from requests.adapters import BaseAdapter
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.transport import SuperfacilityTransport
+
+TREE = {
+    '/run': [{'name': 'a', 'perms': 'drwxr-xr-x'}, {'name': 'job.sh', 'perms': '-rw-r--r--'},
+             {'name': 'loop', 'perms': 'lrwxrwxrwx'}],
+    '/run/a': [{'name': 'b', 'perms': 'drwxr-xr-x'}, {'name': 'out.log', 'perms': '-rw-r--r--'},
+               {'name': 'skip', 'perms': 'drwxr-xr-x'}],
+    '/run/a/b': [{'name': 'deep.log', 'perms': '-rw-r--r--'}],
+    '/run/a/skip': [{'name': 'hidden.log', 'perms': '-rw-r--r--'}],
+}
+
+
+class TreeAdapter(BaseAdapter):
+    def __init__(self):
+        super().__init__()
+        self.lock = threading.Lock()
+        self.listed = []
+
+    def send(self, request, **kwargs):
+        path = requests.utils.unquote(request.path_url.split('/perlmutter/')[-1])
+        with self.lock:
+            self.listed.append(path)
+        resp = requests.Response()
+        resp.status_code = 200
+        resp._content = json.dumps({'status': 'OK', 'entries': TREE.get(path, [])}).encode()
+        resp.request = request
+        return resp
+
+    def close(self):
+        pass
+
+
+def walk_api():
+    transport = SuperfacilityTransport()
+    adapter = TreeAdapter()
+    transport.session.mount('https://', adapter)
+    return SuperfacilityAPI(token="abc", transport=transport), adapter
+
+
+def test_walk():
+    sfapi, adapter = walk_api()
+    paths = {e['path'] for e in sfapi.walk('/run', site='perlmutter', exclude=['skip'])}
+    assert paths == {'/run/a', '/run/job.sh', '/run/loop', '/run/a/b',
+                     '/run/a/out.log', '/run/a/b/deep.log'}
+    assert sorted(adapter.listed) == ['/run', '/run/a', '/run/a/b']
+
+
+def test_walk_depth_and_include():
+    sfapi, _ = walk_api()
+    entries = list(sfapi.walk('/run', site='perlmutter', max_depth=2, include=['*.log']))
+    assert {(e['path'], e['depth']) for e in entries} == {('/run/a/out.log', 2)}
+
+
+def test_walk_skips_forbidden_directory(mock_server):
+    state = mock_server.state
+    for path in ('/tree/a/one.txt', '/tree/secret/key.txt', '/tree/z/two.txt'):
+        state.add_file('perlmutter', path)
+    state.inject_error(403, path='/utilities/ls/perlmutter/%2Ftree%2Fsecret')
+    sfapi = SuperfacilityAPI(token=state.issue_token(), base_url=mock_server.base_url)
+
+    paths = {entry['path'] for entry in sfapi.walk('/tree', site='perlmutter')}
+    assert paths == {'/tree/a', '/tree/secret', '/tree/z', '/tree/a/one.txt', '/tree/z/two.txt'}
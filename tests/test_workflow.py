@@ -0,0 +1,95 @@
+import pytest
+
+from SuperfacilityAPI import SuperfacilityAPI
+from SuperfacilityAPI.mock_server import MOCK_HOME
+from SuperfacilityAPI.SuperfacilityErrors import SuperfacilityCmdFailed
+from SuperfacilityAPI.workflow import add_directives, dependency_option
+
+SITE = 'perlmutter'
+SCRIPT = "#!/bin/bash\n#SBATCH -N 1\nsrun hostname\n"
+
+
+def test_directives():
+    assert dependency_option({'afterok': ['1', '2'], 'afterany': []}) == '--dependency=afterok:1:2'
+    assert dependency_option({'afterok': [], 'afterany': []}) is None
+    assert add_directives(SCRIPT, ['--array=0-3']) == \
+        "#!/bin/bash\n#SBATCH -N 1\n#SBATCH --array=0-3\nsrun hostname\n"
+    assert add_directives("srun hostname", ['-J x']) == "#SBATCH -J x\nsrun hostname"
+    # Only the leading block counts, sbatch ignores #SBATCH after the first command
+    assert add_directives("#!/bin/sh\n# setup\n#SBATCH -q debug\n\necho\n#SBATCH -N 2", ['-d afterok:1']) == \
+        "#!/bin/sh\n# setup\n#SBATCH -q debug\n#SBATCH -d afterok:1\n\necho\n#SBATCH -N 2"
+    with pytest.raises(SuperfacilityCmdFailed, match='its own --dependency'):
+        add_directives("#!/bin/bash\n#SBATCH --dependency=afterok:99\nsrun hostname\n",
+                       ['--dependency=afterok:1'])
+
+
+@pytest.fixture
+def sfapi(mock_server):
+    return SuperfacilityAPI(token=mock_server.state.issue_token(), base_url=mock_server.base_url)
+
+
+def diamond(sfapi, checkpoint=None, path=f'{MOCK_HOME}/c.sh'):
+    flow = sfapi.workflow(site=SITE, checkpoint=checkpoint)
+    flow.add('a', SCRIPT)
+    flow.add('b', SCRIPT, afterok=['a'], array='0-9')
+    flow.add('c', path, is_path=True, afterok=['a'])
+    flow.add('d', SCRIPT, afterany=['b', 'c'])
+    return flow
+
+
+def test_order_and_cycles(sfapi):
+    flow = diamond(sfapi)
+    order = flow.order()
+    assert order[0] == 'a' and order[-1] == 'd'
+
+    flow.add('e', SCRIPT, afterok=['f'])
+    flow.add('f', SCRIPT, afterok=['e'])
+    with pytest.raises(SuperfacilityCmdFailed, match='cycle'):
+        flow.order()
+
+
+def test_submit_with_dependencies(mock_server, sfapi):
+    mock_server.state.add_file(SITE, f'{MOCK_HOME}/c.sh', SCRIPT.encode())
+    flow = diamond(sfapi)
+    results = {ret['name']: ret for ret in flow.submit(timeout=30)}
+
+    assert all(ret['error'] is None for ret in results.values())
+    jobids = flow.jobids
+    queue = mock_server.state.queue[SITE]
+    assert queue[jobids['a']]['dependency'] == '(null)'
+    assert queue[jobids['b']]['dependency'] == f"afterok:{jobids['a']}"
+    assert queue[jobids['c']]['dependency'] == f"afterok:{jobids['a']}"
+    assert queue[jobids['d']]['dependency'] == f"afterany:{jobids['b']}:{jobids['c']}"
+
+
+def test_resume_from_checkpoint(mock_server, sfapi, tmp_path):
+    checkpoint = tmp_path / 'flow.json'
+    results = {ret['name']: ret for ret in diamond(sfapi, checkpoint).submit(timeout=30)}
+    # c.sh isn't on the site yet, so c and d can't be submitted
+    assert results['a']['jobid'] and results['b']['jobid']
+    assert results['c']['error'] and results['d']['error'] == 'c was not submitted'
+
+    mock_server.state.add_file(SITE, f'{MOCK_HOME}/c.sh', SCRIPT.encode())
+    posts = mock_server.state.requests[f'POST /compute/jobs/{SITE}']
+    resumed = {ret['name']: ret for ret in diamond(sfapi, checkpoint).submit(timeout=30)}
+
+    assert resumed['a']['resumed'] and resumed['a']['jobid'] == results['a']['jobid']
+    assert resumed['c']['jobid'] and resumed['d']['jobid'] and not resumed['d']['resumed']
+    assert mock_server.state.requests[f'POST /compute/jobs/{SITE}'] == posts + 2
+
+    # Everything is submitted, nothing is posted again
+    assert all(ret['resumed'] for ret in diamond(sfapi, checkpoint).submit(timeout=30))
+    assert mock_server.state.requests[f'POST /compute/jobs/{SITE}'] == posts + 2
+
+    with pytest.raises(SuperfacilityCmdFailed, match='changed'):
+        list(diamond(sfapi, checkpoint, path=f'{MOCK_HOME}/other.sh').submit())
+
+
+def test_script_dependency_conflicts(mock_server, sfapi):
+    flow = sfapi.workflow(site=SITE)
+    flow.add('a', SCRIPT)
+    flow.add('b', "#!/bin/bash\n#SBATCH --dependency=singleton\nsrun hostname\n", afterok=['a'])
+    results = {ret['name']: ret for ret in flow.submit(timeout=30)}
+
+    assert results['a']['error'] is None
+    assert 'its own --dependency' in results['b']['error'] and results['b']['jobid'] is None